@@ -0,0 +1,8 @@
+"""
+Benchmarks of import, export and check with synthetic workouts
+
+    python -m benchmarks --scales 1000 10000 --output results.json
+
+- generator: seeded generator of realistic workouts, with duplicates from several sources
+- scenarios: the measured scenarios, each run in a new process
+"""
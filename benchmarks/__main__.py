@@ -0,0 +1,66 @@
+"""
+Runs the benchmark scenarios for several numbers of workouts and writes the results as json file
+"""
+
+import os
+import sys
+import json
+import shutil
+import logging
+import argparse
+import platform
+import tempfile
+from datetime import datetime
+
+from benchmarks.generator import generate_workouts, write_csv, write_json
+from benchmarks.scenarios import SCENARIOS, run
+
+
+def main():
+    parser = argparse.ArgumentParser(prog="python -m benchmarks")
+    parser.add_argument("--scales", type=int, nargs='+', default=[1000, 10000],
+                        help="numbers of generated workouts, e.g. 1000 10000 100000 1000000")
+    parser.add_argument("--scenarios", nargs='+', default=list(SCENARIOS), choices=list(SCENARIOS))
+    parser.add_argument("--seed", type=int, default=0, help="seed of the workout generator")
+    parser.add_argument("--directory", help="directory for generated files and databases, default a temporary one")
+    parser.add_argument("-o", "--output", default="benchmark_results.json", help="results file")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.CRITICAL)
+
+    directory = args.directory or tempfile.mkdtemp(prefix="workouts_benchmark_")
+    os.makedirs(directory, exist_ok=True)
+    results = []
+    try:
+        for scale in args.scales:
+            print("{} workouts: generating files ...".format(scale))
+            files = {'csv': os.path.join(directory, "workouts_{}.csv".format(scale)),
+                     'json': os.path.join(directory, "workouts_{}.json".format(scale)),
+                     'imported': os.path.join(directory, "imported_{}.db".format(scale))}
+            write_csv(files['csv'], generate_workouts(scale, args.seed))
+            write_json(files['json'], generate_workouts(scale, args.seed))
+            if any(SCENARIOS[name][1] in ('imported', 'unchecked') for name in args.scenarios):
+                # the database the export and check scenarios start with
+                run('import_csv', files, directory)
+                shutil.copyfile(os.path.join(directory, "import_csv.db"), files['imported'])
+            for name in args.scenarios:
+                result = dict(run(name, files, directory), scale=scale)
+                results.append(result)
+                print("{:>9} {:<20} {:>9.3f}s {:>11} workouts/s {:>8} MB {:>9} statements".format(
+                    scale, name, result['seconds'], result['workouts_per_second'], result['peak_rss_mb'],
+                    result['sql_statements']))
+    finally:
+        if not args.directory:
+            shutil.rmtree(directory, ignore_errors=True)
+
+    with open(args.output, "w") as file:
+        json.dump({'created': str(datetime.now()),
+                   'python': sys.version.split()[0],
+                   'platform': platform.platform(),
+                   'cpus': os.cpu_count(),
+                   'seed': args.seed,
+                   'results': results}, file, indent=2)
+    print("results written to {}".format(args.output))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,118 @@
+# coding=utf-8
+
+import csv
+import json
+import random
+from datetime import datetime, timedelta
+
+from lib.workout import Workout
+
+# sportstypes as imported from Garmin Connect: (name, weight, speed in m/s, duration in minutes, attributes)
+SPORTSTYPES = [
+    ('running', 30, 3.0, (20, 120), ['average_running_cadence_steps_per_min', 'max_running_cadence_steps_per_min',
+                                     'avg_vertical_oscillation', 'avg_ground_contact_time', 'avg_stride_length']),
+    ('cycling', 20, 7.5, (45, 300), ['avg_power', 'max_power', 'norm_power', 'average_biking_cadence_rev_per_min',
+                                     'max_biking_cadence_rev_per_min', 'max_20_min_power']),
+    ('virtual_ride', 15, 8.5, (30, 120), ['avg_power', 'max_power', 'norm_power',
+                                          'average_biking_cadence_rev_per_min', 'max_biking_cadence_rev_per_min']),
+    ('lap_swimming', 10, 0.8, (30, 75), ['average_swolf', 'active_lengths', 'pool_length', 'strokes',
+                                         'avg_stroke_distance', 'average_swim_cadence_strokes_per_min']),
+    ('strength_training', 10, 0.0, (20, 60), []),
+    ('walking', 10, 1.4, (20, 180), ['average_running_cadence_steps_per_min']),
+    ('other', 5, 1.0, (10, 90), []),
+]
+ROUTES = ["Watopia", "Richmond", "London", "New York", "Innsbruck", "Yorkshire", "Makuri Islands"]
+# probability that a workout is imported a second time from another source
+DUPLICATE_PROBABILITY = 0.15
+
+
+def generate_workouts(number, seed=0, start=datetime(2015, 1, 1, 6, 0, 0)):
+    """
+    yields number workouts as records with the keys of Workout.header(), like an export of the database
+    - the same seed always yields the same workouts
+    - a mix of sportstypes, most attributes are NULL, sport specific ones are only set for their sport
+    - workouts are imported from "Garmin", some are imported again, slightly shifted, as duplicates:
+      virtual rides from "Zwift" (leading the merged workout), the others as "CSV import"
+    """
+    generator = random.Random(seed)
+    names = [sportstype[0] for sportstype in SPORTSTYPES]
+    weights = [sportstype[1] for sportstype in SPORTSTYPES]
+    sportstypes = {sportstype[0]: sportstype for sportstype in SPORTSTYPES}
+    external_ids = {"Garmin": 4000000000, "CSV import": 1, "Zwift": 100000}
+    start_time = start
+    generated = 0
+    while generated < number:
+        (name, weight, speed, durations, attributes) = sportstypes[generator.choices(names, weights)[0]]
+        duration = generator.randint(*durations) * 60
+        start_time += timedelta(seconds=generator.randint(3600, 30 * 3600))
+        record = dict.fromkeys(Workout.header())
+        record.update({'source': "Garmin",
+                       'sportstype': name,
+                       'name': "{} {}".format(name.replace('_', ' ').title(), start_time.strftime("%A")),
+                       'start_time': start_time.strftime("%Y-%m-%d %H:%M:%S"),
+                       'duration_sec': duration,
+                       'moving_duration_sec': int(duration * generator.uniform(0.85, 1.0)),
+                       'calories': int(duration / 60 * generator.uniform(5, 14)),
+                       'average_hr': generator.randint(95, 165) if generator.random() < 0.9 else None,
+                       'max_hr': generator.randint(165, 195) if generator.random() < 0.9 else None})
+        if speed:
+            average_speed = speed * generator.uniform(0.8, 1.2)
+            record.update({'distance_m': int(average_speed * duration),
+                           'average_speed_m_per_sec': round(average_speed, 3),
+                           'max_speed_m_per_sec': round(average_speed * generator.uniform(1.1, 1.8), 3),
+                           'elevation_gain_m': generator.randint(0, 1500) if generator.random() < 0.7 else None,
+                           'elevation_loss_m': generator.randint(0, 1500) if generator.random() < 0.7 else None})
+        if generator.random() < 0.6:
+            record.update({'aerobic_training_effect': round(generator.uniform(1, 5), 1),
+                           'anaerobic_training_effect': round(generator.uniform(0, 3), 1),
+                           'training_stress_score': round(duration / 3600 * generator.uniform(30, 110), 1)})
+        for attribute in attributes:
+            record[attribute] = generator.randint(1, 400)
+        record['id'] = external_ids["Garmin"]
+        external_ids["Garmin"] += 1
+        yield record
+        generated += 1
+
+        if generated < number and generator.random() < DUPLICATE_PROBABILITY:
+            duplicate = dict(record)
+            duplicate['start_time'] = (start_time + timedelta(seconds=generator.randint(-120, 120)))\
+                .strftime("%Y-%m-%d %H:%M:%S")
+            if name == 'virtual_ride':
+                duplicate.update({'source': "Zwift", 'name': "Zwift - {}".format(generator.choice(ROUTES))})
+            else:
+                duplicate['source'] = "CSV import"
+                for attribute in attributes:
+                    duplicate[attribute] = None
+            duplicate['id'] = external_ids[duplicate['source']]
+            external_ids[duplicate['source']] += 1
+            yield duplicate
+            generated += 1
+        start_time += timedelta(seconds=duration)
+
+
+def write_csv(filename, workouts):
+    """
+    writes workouts to a csv file formatted like the csv export
+    """
+    header = Workout.header()
+    with open(filename, "w", encoding='utf-8', newline='') as file:
+        writer = csv.writer(file)
+        writer.writerow(header)
+        writer.writerows([workout[key] for key in header] for workout in workouts)
+
+
+def write_json(filename, workouts, ndjson=False):
+    """
+    writes workouts to a json file formatted like the json export
+    """
+    with open(filename, "w", encoding='utf-8') as file:
+        if ndjson:
+            for workout in workouts:
+                file.write(json.dumps(workout) + "\n")
+        else:
+            file.write("[")
+            for (i, workout) in enumerate(workouts):
+                if i:
+                    file.write(", ")
+                file.write(json.dumps(workout))
+            file.write("]")
@@ -0,0 +1,136 @@
+# coding=utf-8
+
+import os
+import time
+import shutil
+import resource
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+from sqlalchemy import event, create_engine, text
+from sqlalchemy.engine import Engine
+
+from lib.workout import Workout, WorkoutsDatabase, SCHEMA_MIGRATIONS
+from lib.csv_importer import CsvImporter
+from lib.json_importer import JsonImporter
+from lib.csv_exporter import CsvExporter
+from lib.json_exporter import JsonExporter
+
+
+def _import(importer, database):
+    db = WorkoutsDatabase(database)
+    db.create_session()
+    importer.create_session()
+    (fetched, imported) = importer.import_workouts(db)
+    importer.close_session()
+    db.close_session()
+    return fetched
+
+
+def _export(exporter, database):
+    db = WorkoutsDatabase(database)
+    db.create_session()
+    exporter.create_session()
+    exporter.export_workouts(db)
+    exporter.close_session()
+    number = db.session.query(Workout.id).count()
+    db.close_session()
+    return number
+
+
+def import_csv(files):
+    return _import(CsvImporter(files['csv']), files['database'])
+
+
+def import_csv_parallel(files):
+    return _import(CsvImporter(files['csv'], jobs=os.cpu_count() or 1), files['database'])
+
+
+def import_json(files):
+    return _import(JsonImporter(files['json']), files['database'])
+
+
+def export_csv(files):
+    return _export(CsvExporter(files['output'] + ".csv"), files['database'])
+
+
+def export_json(files):
+    return _export(JsonExporter(files['output'] + ".json"), files['database'])
+
+
+def check(files):
+    db = WorkoutsDatabase(files['database'])
+    db.create_session()
+    (checked, duplicates, merged) = db.check()
+    db.close_session()
+    if not merged:
+        raise RuntimeError("check did not merge any workouts, the database was checked before")
+    return checked
+
+
+def reset_duplicates(database):
+    """
+    undoes the duplicate handling of the import: merged workouts are removed, marks are cleared and
+    the summaries are computed again, so that check has to find all duplicates
+    """
+    engine = create_engine('sqlite:///{}'.format(database))
+    summaries = dict(SCHEMA_MIGRATIONS)[3]
+    with engine.begin() as connection:
+        connection.execute(text("DELETE FROM workouts WHERE source = 'MERGED WORKOUT'"))
+        connection.execute(text("UPDATE workouts SET is_duplicate_with = NULL, manual_check_required_with = NULL"))
+        connection.execute(text("DELETE FROM training_loads"))
+        for statement in summaries:
+            connection.execute(text(statement))
+    engine.dispose()
+
+
+# scenarios: name -> (function, database the scenario starts with: None for an empty one,
+# 'imported' or 'unchecked' for the imported one without the duplicate handling of the import)
+SCENARIOS = {
+    'import_csv': (import_csv, None),
+    'import_csv_parallel': (import_csv_parallel, None),
+    'import_json': (import_json, None),
+    'export_csv': (export_csv, 'imported'),
+    'export_json': (export_json, 'imported'),
+    'check': (check, 'unchecked'),
+}
+
+
+def _peak_rss_mb():
+    # ru_maxrss is reported in kilobytes on linux and in bytes on macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024 * 1024) if os.uname().sysname == 'Darwin' else peak / 1024
+
+
+def measure(name, files):
+    """
+    runs a scenario and returns its measurements, meant to run in a fresh process,
+    so that the peak resident set size belongs to the scenario
+    """
+    statements = []
+    event.listen(Engine, 'before_cursor_execute', lambda *args: statements.append(1))
+    started = time.perf_counter()
+    workouts = SCENARIOS[name][0](files)
+    seconds = time.perf_counter() - started
+    return {'scenario': name,
+            'workouts': workouts,
+            'seconds': round(seconds, 3),
+            'workouts_per_second': round(workouts / seconds, 1) if seconds else None,
+            'peak_rss_mb': round(_peak_rss_mb(), 1),
+            'sql_statements': len(statements)}
+
+
+def run(name, files, directory):
+    """
+    prepares the database of a scenario in directory and measures the scenario in a new process
+    """
+    files = dict(files, database=os.path.join(directory, "{}.db".format(name)),
+                 output=os.path.join(directory, name))
+    if os.path.exists(files['database']):
+        os.remove(files['database'])
+    if SCENARIOS[name][1] in ('imported', 'unchecked'):
+        shutil.copyfile(files['imported'], files['database'])
+    if SCENARIOS[name][1] == 'unchecked':
+        reset_duplicates(files['database'])
+    with ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context('spawn')) as executor:
+        return executor.submit(measure, name, files).result()
@@ -0,0 +1,111 @@
+"""
+Measures the cold start of the command line tool: the wall time of short commands, each run in a new process
+
+    python -m benchmarks.startup --runs 10 --output startup_results.json
+"""
+
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import platform
+import statistics
+import subprocess
+import tempfile
+from datetime import datetime
+
+from benchmarks.generator import generate_workouts, write_csv
+
+SCRIPT = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "workouts.py")
+# modules which only some actions need, reported if a command loads them
+HEAVY_MODULES = ['requests', 'lib.garmin_importer', 'pyarrow', 'numpy', 'lib.csv_importer', 'lib.json_importer']
+
+
+def commands(directory):
+    """
+    returns the measured commands: name -> arguments of workouts.py
+    """
+    database = os.path.join(directory, "startup.db")
+    return {'version': ["--version"],
+            'show': ["show", database],
+            'check': ["check", database],
+            'report': ["report", database],
+            'import_csv': ["import", database, "-s", "csv", "-f", os.path.join(directory, "startup.csv")]}
+
+
+# runs workouts.py like python would and writes the names of the loaded modules to a file at exit,
+# python -X importtime does not report modules imported through importlib.import_module
+MODULES_SCRIPT = """
+import os, sys, json, atexit, runpy
+(output, script) = sys.argv[1:3]
+sys.path.insert(0, os.path.dirname(script))
+atexit.register(lambda: json.dump(sorted(sys.modules), open(output, "w")))
+sys.argv = sys.argv[2:]
+runpy.run_path(script, run_name="__main__")
+"""
+
+
+def imported_modules(arguments, directory):
+    """
+    returns the names of the modules a command loads
+    """
+    output = os.path.join(directory, "modules.json")
+    subprocess.run([sys.executable, "-c", MODULES_SCRIPT, output, SCRIPT] + arguments,
+                   stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    with open(output) as file:
+        return set(json.load(file))
+
+
+def measure(name, arguments, runs, directory):
+    """
+    runs a command runs times and returns the minimum and median wall time
+    """
+    seconds = []
+    for i in range(runs):
+        started = time.perf_counter()
+        subprocess.run([sys.executable, SCRIPT] + arguments, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        seconds.append(time.perf_counter() - started)
+    modules = imported_modules(arguments, directory)
+    return {'command': name,
+            'runs': runs,
+            'min_seconds': round(min(seconds), 4),
+            'median_seconds': round(statistics.median(seconds), 4),
+            'modules': len(modules),
+            'heavy_modules': [module for module in HEAVY_MODULES if module in modules]}
+
+
+def main():
+    parser = argparse.ArgumentParser(prog="python -m benchmarks.startup")
+    parser.add_argument("--runs", type=int, default=10, help="number of runs per command")
+    parser.add_argument("--workouts", type=int, default=100, help="number of workouts in the database")
+    parser.add_argument("-o", "--output", default="startup_results.json", help="results file")
+    args = parser.parse_args()
+
+    directory = tempfile.mkdtemp(prefix="workouts_startup_")
+    results = []
+    try:
+        write_csv(os.path.join(directory, "startup.csv"), generate_workouts(args.workouts))
+        measured = commands(directory)
+        # the database the other commands start with, import_csv then imports known workouts only
+        subprocess.run([sys.executable, SCRIPT] + measured['import_csv'], check=True)
+        for (name, arguments) in measured.items():
+            result = measure(name, arguments, args.runs, directory)
+            results.append(result)
+            print("{:<12} {:>8.3f}s min {:>8.3f}s median {:>6} modules  {}".format(
+                name, result['min_seconds'], result['median_seconds'], result['modules'],
+                ", ".join(result['heavy_modules'])))
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+
+    with open(args.output, "w") as file:
+        json.dump({'created': str(datetime.now()),
+                   'python': sys.version.split()[0],
+                   'platform': platform.platform(),
+                   'results': results}, file, indent=2)
+    print("results written to {}".format(args.output))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,134 @@
+# coding=utf-8
+
+from lib.workout_exporter import WorkoutExporter
+from lib.workout import Workout
+from lib import profiler
+from sqlalchemy import Integer, Float, DateTime, Boolean
+import logging
+
+try:
+    import pyarrow
+    import pyarrow.ipc
+    import pyarrow.parquet
+except ImportError:
+    pyarrow = None
+
+logger = logging.getLogger(__name__)
+
+# number of workouts written in one record batch
+BATCH_SIZE = 10000
+
+
+def arrow_format(filename, format=None):
+    """
+    returns the columnar format of a file, 'parquet' or 'arrow' (ipc file), if not given by the file extension
+    """
+    if format:
+        return format
+    return "parquet" if str(filename).lower().endswith((".parquet", ".pq")) else "arrow"
+
+
+def arrow_schema():
+    """
+    returns the arrow schema of the workout attributes in header()
+    """
+    types = {Integer: pyarrow.int64(), Float: pyarrow.float64(), DateTime: pyarrow.timestamp('us'),
+             Boolean: pyarrow.bool_()}
+    columns = Workout.__table__.columns
+    fields = []
+    for key in Workout.header():
+        if key == "id":
+            # external ids of merged workouts are timestamps with fractions of a second
+            fields.append(pyarrow.field(key, pyarrow.float64()))
+        elif key == "sportstype":
+            fields.append(pyarrow.field(key, pyarrow.string()))
+        else:
+            fields.append(pyarrow.field(key, types.get(type(columns[key].type), pyarrow.string())))
+    return pyarrow.schema(fields)
+
+
+def _to_array(values, type):
+    """
+    returns the values of a column as arrow array
+    numbers which are stored with another type, like numbers imported as text, are converted,
+    values the type cannot represent exactly, like decimals in an integer column, raise a ValueError
+    """
+    try:
+        array = pyarrow.array(values)
+    except (pyarrow.ArrowInvalid, pyarrow.ArrowTypeError):
+        if pyarrow.types.is_string(type):
+            values = [None if value is None else str(value) for value in values]
+        else:
+            values = [None if value in ('', None) else float(value) if isinstance(value, str) else value
+                      for value in values]
+        array = pyarrow.array(values)
+    return array.cast(type)
+
+
+class ArrowExporter(WorkoutExporter):
+    """
+    Exports workouts from a database to a columnar file, Parquet or Arrow IPC, using pyarrow
+    workouts are streamed from the database and written as record batches,
+    the files can be memory mapped and read column by column
+    """
+
+    def __init__(self, filename, format=None):
+        logger.info("arrow exporter initializing ...")
+        self.writer = None
+        self.filename = filename
+        self.format = arrow_format(filename, format)
+        self.stats = {}
+
+    def create_session(self):
+        logger.info("arrow exporter creating session ...")
+        if not pyarrow:
+            logger.error("pyarrow is needed to export {} files".format(self.format))
+            return False
+        try:
+            self.schema = arrow_schema()
+            if self.format == "parquet":
+                self.writer = pyarrow.parquet.ParquetWriter(self.filename, self.schema)
+            else:
+                self.writer = pyarrow.ipc.new_file(self.filename, self.schema)
+        except OSError:
+            logger.error("{} output file could not be accessed".format(self.format))
+            return False
+        except TypeError:
+            logger.error("export filename not correct")
+            return False
+        return True
+
+    def close_session(self):
+        logger.info("arrow exporter closing session ...")
+        if self.writer:
+            self.writer.close()
+        self.writer = None
+
+    def export_workouts(self, db):
+        logger.info("exporting workouts ...")
+        exported_workouts = 0
+        rows = []
+        for workout in profiler.timed(Workout.export_query(db).yield_per(BATCH_SIZE), "fetch"):
+            rows.append(workout)
+            if len(rows) >= BATCH_SIZE:
+                exported_workouts += self._write_batch(rows)
+                rows = []
+        if rows:
+            exported_workouts += self._write_batch(rows)
+        logger.info("{} workouts exported".format(exported_workouts))
+        self.stats = profiler.stats()
+
+    def _write_batch(self, rows):
+        """
+        writes the rows as one record batch, column by column
+        """
+        with profiler.stage("write"):
+            columns = []
+            for (values, field) in zip(zip(*rows), self.schema):
+                try:
+                    columns.append(_to_array(values, field.type))
+                except ValueError as e:
+                    logger.error("column {} cannot be exported as {}: {}".format(field.name, field.type, e))
+                    raise
+            self.writer.write_batch(pyarrow.RecordBatch.from_arrays(columns, schema=self.schema))
+        return len(rows)
@@ -0,0 +1,98 @@
+# coding=utf-8
+
+from lib.workout_importer import WorkoutImporter
+from lib.workout import Workout
+from lib import profiler
+from lib.arrow_exporter import arrow_format, BATCH_SIZE
+import logging
+
+try:
+    import pyarrow
+    import pyarrow.ipc
+    import pyarrow.parquet
+except ImportError:
+    pyarrow = None
+
+logger = logging.getLogger(__name__)
+
+
+class ArrowImporter(WorkoutImporter):
+    """
+    Imports workouts from a columnar file, Parquet or Arrow IPC, using pyarrow
+    the file is memory mapped and read record batch by record batch
+    """
+
+    def __init__(self, filename, format=None):
+        logger.info("arrow importer initializing ...")
+        self.file = None
+        self.mapped_file = None
+        self.filename = filename
+        self.format = arrow_format(filename, format)
+        self.stats = {}
+
+    def create_session(self):
+        logger.info("arrow importer creating session ...")
+        if not pyarrow:
+            logger.error("pyarrow is needed to import {} files".format(self.format))
+            return False
+        try:
+            if self.format == "parquet":
+                self.file = pyarrow.parquet.ParquetFile(self.filename, memory_map=True)
+            else:
+                self.mapped_file = pyarrow.memory_map(self.filename)
+                self.file = pyarrow.ipc.open_file(self.mapped_file)
+        except FileNotFoundError:
+            logger.error("{} input file not found".format(self.format))
+            return False
+        except (OSError, pyarrow.ArrowInvalid):
+            logger.error("{} input file not formatted correctly".format(self.format))
+            return False
+        except TypeError:
+            logger.error("import filename not correct")
+            return False
+        return True
+
+    def close_session(self):
+        logger.info("arrow importer closing session ...")
+        if self.format == "parquet" and self.file:
+            self.file.close()
+        if self.mapped_file:
+            self.mapped_file.close()
+        self.file = None
+        self.mapped_file = None
+
+    def import_workouts(self, db):
+        """
+        Imports workouts into a database
+        from the record batches of a columnar file
+        """
+        logger.info("fetching workouts ...")
+        total_fetched_workouts = 0
+        total_imported_workouts = 0
+
+        if self.file:
+            (total_fetched_workouts, total_imported_workouts) = db.add_workouts(self._read_workouts(db))
+        logger.info("{} workouts fetched and {} workouts imported".format(
+            total_fetched_workouts, total_imported_workouts))
+        self.stats = profiler.stats()
+        return(total_fetched_workouts, total_imported_workouts)
+
+    def _batches(self):
+        if self.format == "parquet":
+            return self.file.iter_batches(batch_size=BATCH_SIZE)
+        return (self.file.get_batch(i) for i in range(self.file.num_record_batches))
+
+    def _read_workouts(self, db):
+        """
+        yields a WorkoutRecord for each row of the record batches
+        """
+        for batch in profiler.timed(self._batches(), "fetch"):
+            with profiler.stage("decode"):
+                names = batch.schema.names
+                decode = Workout.decoder(list(enumerate(names)),
+                                         None if 'source' in names else {'source': "Arrow import"})
+                workouts = decode(zip(*(column.to_pylist() for column in batch.columns)))
+            for workout in workouts:
+                with profiler.stage("resolve"):
+                    (workout.sportstype_id, workout.sport_id) = db.resolve_sportstype(workout.sportstype, workout.name)
+                yield workout
@@ -2,6 +2,7 @@
 
 from lib.workout_exporter import WorkoutExporter
 from lib.workout import Workout, Sport, SportsType, WorkoutsDatabase
+from lib import profiler
 import logging
 import csv
 
@@ -17,6 +18,7 @@ class CsvExporter(WorkoutExporter):
         logger.info("csv exporter initializing ...")
         self.csv = None
         self.filename = filename
+        self.stats = {}
 
     def create_session(self):
         logger.info("csv exporter creating session ...")
@@ -37,18 +39,24 @@ class CsvExporter(WorkoutExporter):
         self.csv = None
 
     def export_workouts(self, db):
+        CHUNK_SIZE = 1000
+
         logger.info("exporting workouts ...")
         exported_workouts = 0
-        workouts = db.session.query(Workout).all()
-        csv_data = []
+        writer = csv.writer(self.csv)
 
         # header line
-        header = Workout.header()
-        csv_data.append(header)
-        # record lines
-        for workout in workouts:
-            csv_data.append(workout.as_list(db))
+        writer.writerow(Workout.header())
+        # record lines, streamed from the database and written chunk by chunk
+        csv_data = []
+        for workout in profiler.timed(Workout.export_query(db).yield_per(CHUNK_SIZE), "fetch"):
+            csv_data.append(workout)
             exported_workouts += 1
-        writer = csv.writer(self.csv)
-        writer.writerows(csv_data)
+            if len(csv_data) >= CHUNK_SIZE:
+                with profiler.stage("write"):
+                    writer.writerows(csv_data)
+                csv_data = []
+        with profiler.stage("write"):
+            writer.writerows(csv_data)
         logger.info("{} workouts exported".format(exported_workouts))
+        self.stats = profiler.stats()
@@ -1,22 +1,111 @@
 # coding=utf-8
 
 from lib.workout_importer import WorkoutImporter
-from lib.workout import Workout, Sport, SportsType, WorkoutsDatabase
-import logging
+from lib.workout import Workout
+from lib import profiler
+import io
+import os
 import csv
-from datetime import datetime
+import mmap
+import logging
+import itertools
+import collections
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
 
 logger = logging.getLogger(__name__)
 
+# size of the byte ranges parsed by one worker process
+CHUNK_SIZE = 4 * 1024 * 1024
+# number of csv rows decoded at once
+DECODE_SIZE = 1000
+# number of chunks per worker process parsed ahead of the import
+CHUNKS_AHEAD = 2
+
+
+def _decode_records(rows, header):
+    """
+    yields a WorkoutRecord for each csv row, the name of the sportstype is kept as 'sportstype'
+    """
+    decode = Workout.decoder(list(enumerate(header)))
+    width = len(header)
+    rows = iter(rows)
+    while True:
+        with profiler.stage("decode"):
+            batch = [row if len(row) >= width else row + [''] * (width - len(row))
+                     for row in itertools.islice(rows, DECODE_SIZE) if row]
+            workouts = decode(batch)
+            for workout in workouts:
+                if not workout.source:
+                    workout.source = "CSV import"
+        if not batch:
+            break
+        yield from workouts
+
+
+def _parse_chunk(filename, start, end, header):
+    """
+    parses the csv records between the byte offsets start and end of a file, runs in a worker process
+    """
+    with open(filename, "rb") as file:
+        file.seek(start)
+        text = file.read(end - start).decode('utf-8')
+    return list(_decode_records(csv.reader(io.StringIO(text, newline='')), header))
+
+
+def _parse_chunks(executor, filename, boundaries, header, window):
+    """
+    yields the parsed chunks between the boundaries in the order of the file
+    at most window chunks are submitted or parsed but not yielded yet, so parsed chunks do not pile up
+    while the import is slower than the worker processes
+    """
+    futures = collections.deque()
+    for (start, end) in zip(boundaries[:-1], boundaries[1:]):
+        if len(futures) >= window:
+            yield futures.popleft().result()
+        futures.append(executor.submit(_parse_chunk, filename, start, end, header))
+    while futures:
+        yield futures.popleft().result()
+
+
+def _record_boundaries(data, start, chunk_size):
+    """
+    returns the byte offsets splitting data after start into ranges of about chunk_size bytes
+    a range only ends at a line break outside of a quoted field, so no record is split
+    """
+    boundaries = [start]
+    scanned = start     # quotes are counted from the last boundary up to scanned
+    quotes = 0          # odd within a quoted field
+    while boundaries[-1] + chunk_size < len(data):
+        position = max(boundaries[-1] + chunk_size, scanned)
+        newline = data.find(b'\n', position)
+        while newline >= 0:
+            quotes += data[scanned:newline].count(b'"')
+            scanned = newline
+            if quotes % 2 == 0:
+                break
+            newline = data.find(b'\n', newline + 1)
+        if newline < 0 or newline + 1 >= len(data):
+            break
+        boundaries.append(newline + 1)
+        scanned = newline + 1
+        quotes = 0
+    boundaries.append(len(data))
+    return boundaries
+
 
 class CsvImporter(WorkoutImporter):
     """
     Imports workouts from CSV file to database
+    With more than one job the file is split into byte ranges which are parsed by worker processes,
+    the workouts are written into the database by this process only
     """
-    def __init__(self, filename):
+    def __init__(self, filename, jobs=1):
         logger.info("csv importer initializing ...")
         self.csv = None
         self.filename = filename
+        self.jobs = jobs
+        self.stats = {}
 
     def create_session(self):
         logger.info("csv importer creating session ...")
@@ -45,39 +134,46 @@ class CsvImporter(WorkoutImporter):
         total_fetched_workouts = 0
         total_imported_workouts = 0
 
-        keys = Workout.header()
-        workouts = csv.DictReader(self.csv)
-        # TODO check if header is correct
-
         if self.csv:
-            for record in workouts:
-                logger.debug('CSV record: {}'.format(record))
-                workout = Workout()
-                total_fetched_workouts += 1
-                for key in keys:
-                    if key == "start_time":
-                        record[key] = datetime.strptime(record[key], "%Y-%m-%d %H:%M:%S")
-                    elif key == "id":
-                        workout.external_id = record[key]
-                        continue
-                    elif key == "sportstype":
-                        sportstype = SportsType(name = record[key])
-                        if record["name"]:
-                            workout.name = record["name"]     # necessary for sportstype association
-                        sportstype.add(workout, db)
-                        workout.sportstype_id = sportstype.id
-                        workout.sport_id = sportstype.sport_id
-                        continue
-                    setattr(workout, key, record[key])
-                    if getattr(workout, key) == '':
-                        setattr(workout, key, None)
-                if 'source' not in keys or record['source'] == '' or record['source'] == None:
-                    workout.source = "CSV import"
-                logger.debug('WORKOUT: {}'.format(workout))
-                if workout.add(db):
-                    total_imported_workouts += 1
+            if self.jobs > 1:
+                records = self._read_records_parallel()
+            else:
+                rows = csv.reader(self.csv)
+                records = _decode_records(rows, next(rows, []))
+            (total_fetched_workouts, total_imported_workouts) = db.add_workouts(self._read_workouts(records, db))
 
         logger.info("{} workouts fetched and {} workouts imported".format(
             total_fetched_workouts, total_imported_workouts))
+        self.stats = profiler.stats()
         
         return(total_fetched_workouts, total_imported_workouts)
+
+    def _read_workouts(self, records, db):
+        """
+        yields the decoded csv records with resolved sportstype
+        """
+        for workout in records:
+            logger.debug('WORKOUT: {}'.format(workout))
+            with profiler.stage("resolve"):
+                (workout.sportstype_id, workout.sport_id) = db.resolve_sportstype(workout.sportstype, workout.name)
+            yield workout
+
+    def _read_records_parallel(self):
+        """
+        yields the decoded csv records of the file, parsed by a pool of worker processes
+        the chunks are yielded in the order of the file, so workouts are added as in a serial import
+        """
+        with open(self.filename, "rb") as file:
+            if os.fstat(file.fileno()).st_size == 0:
+                return
+            with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as data:
+                end_of_header = data.find(b'\n') + 1 or len(data)
+                header = next(csv.reader([data[:end_of_header].decode('utf-8')]), [])
+                boundaries = _record_boundaries(data, end_of_header, CHUNK_SIZE)
+        logger.debug("parsing {} chunks with {} processes".format(len(boundaries) - 1, self.jobs))
+        # forked workers do not run the command line script again, which has no main guard
+        context = multiprocessing.get_context('fork') if 'fork' in multiprocessing.get_all_start_methods() else None
+        with ProcessPoolExecutor(max_workers=self.jobs, mp_context=context) as executor:
+            chunks = _parse_chunks(executor, self.filename, boundaries, header, CHUNKS_AHEAD * self.jobs)
+            for chunk in profiler.timed(chunks, "decode"):
+                yield from chunk
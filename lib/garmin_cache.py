@@ -0,0 +1,90 @@
+# coding=utf-8
+
+import os
+import re
+import gzip
+import json
+import hashlib
+import logging
+import threading
+from datetime import datetime
+
+logger = logging.getLogger(__name__)
+
+
+class GarminCache:
+    """
+    Content addressed cache of raw Garmin Connect responses, used to replay imports without network
+    - objects/<sha256>.json.gz contains a gzip compressed response body, identical pages are stored once
+    - <account>.ndjson is the index of an account: a line per fetched page, in the order they have been fetched,
+      pages are only appended
+    """
+
+    def __init__(self, directory, account):
+        self.directory = directory
+        self.account = account
+        self.lock = threading.Lock()
+        self.index_filename = os.path.join(directory, "{}.ndjson".format(re.sub(r'[^\w.-]', '_', str(account))))
+        self.index = None
+        # start -> object of the most recently fetched page of each start
+        self.latest = None
+        # False if the index ends with an incomplete line, the next page starts a new line
+        self.complete = True
+
+    def _load_index(self):
+        if self.index is None:
+            self.index = []
+            try:
+                with open(self.index_filename, "r") as file:
+                    for line in file:
+                        self.complete = line.endswith("\n")
+                        try:
+                            self.index.append(json.loads(line))
+                        except ValueError:
+                            # the last line of an interrupted import
+                            logger.warning("ignoring incomplete entry of {}".format(self.index_filename))
+            except FileNotFoundError:
+                pass
+            self.latest = {page["start"]: page["object"] for page in self.index}
+        return self.index
+
+    def _object_filename(self, digest):
+        return os.path.join(self.directory, "objects", "{}.json.gz".format(digest))
+
+    def store(self, start, content):
+        """
+        stores the response body of the page beginning with workout number start
+        """
+        digest = hashlib.sha256(content).hexdigest()
+        with self.lock:
+            filename = self._object_filename(digest)
+            if not os.path.exists(filename):
+                os.makedirs(os.path.dirname(filename), exist_ok=True)
+                with gzip.open(filename + ".tmp", "wb") as file:
+                    file.write(content)
+                os.replace(filename + ".tmp", filename)
+            index = self._load_index()
+            if self.latest.get(start) != digest:
+                page = {"start": start, "object": digest, "fetched": str(datetime.now())}
+                index.append(page)
+                self.latest[start] = digest
+                os.makedirs(self.directory, exist_ok=True)
+                with open(self.index_filename, "a") as file:
+                    file.write(("" if self.complete else "\n") + json.dumps(page) + "\n")
+                self.complete = True
+        logger.debug("cached page {} of {} as {}".format(start, self.account, digest))
+
+    def pages(self):
+        """
+        yields the response bodies of all cached pages of the account, the most recently fetched first,
+        so that the newest copy of a workout fetched more than once is imported
+        """
+        with self.lock:
+            index = list(self._load_index())
+        replayed = set()
+        for page in reversed(index):
+            if page["object"] in replayed:
+                continue
+            replayed.add(page["object"])
+            with gzip.open(self._object_filename(page["object"]), "rb") as file:
+                yield file.read()
@@ -1,11 +1,18 @@
 import requests
+import os
 import re
 import json
 import logging
+import threading
+import collections
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 
 from lib.workout_importer import WorkoutImporter
-from lib.workout import Workout, Sport, SportsType, WorkoutsDatabase
+from lib.workout import WorkoutRecord
+from lib.garmin_cache import GarminCache
+from lib.record_mapping import FieldMapping, compile_mapping, mapping_keys, to_datetime
+from lib import profiler
 
 logger = logging.getLogger(__name__)
 
@@ -20,10 +27,98 @@ GARMIN_GPX_EXPORT = "http://connect.garmin.com/proxy/activity-service-1.1/gpx/ac
 GARMIN_KML_EXPORT = "http://connect.garmin.com/proxy/activity-service-1.0/kml/activity/%d?full=true&#8220;"
 GARMIN_TCX_EXPORT = "http://connect.garmin.com/proxy/activity-service-1.0/tcx/activity/%d?full=true&#8220;"
 
+# number of workouts per page of the activities search
+CHUNK_SIZE = 400
+
+# mapping of the Garmin activity fields to the workout columns
+GARMIN_FIELDS = [
+    FieldMapping('activityId', 'external_id'),
+    FieldMapping('activityName', 'name'),
+    FieldMapping('description', 'description'),
+    FieldMapping(('activityType', 'typeKey'), 'sportstype'),
+    FieldMapping('minTemperature', 'min_temperature', int),
+    FieldMapping('maxTemperature', 'max_temperature', int),
+    FieldMapping('startTimeLocal', 'start_time', to_datetime),      # 2020-03-28 16:25:47
+    FieldMapping('duration', 'duration_sec', int),
+    FieldMapping('movingDuration', 'moving_duration_sec', int),
+    FieldMapping('distance', 'distance_m', int),
+    FieldMapping('averageSpeed', 'average_speed_m_per_sec', rounding=3),
+    FieldMapping('maxSpeed', 'max_speed_m_per_sec', rounding=3),
+    FieldMapping('elevationGain', 'elevation_gain_m'),
+    FieldMapping('elevationLoss', 'elevation_loss_m'),
+    FieldMapping('calories', 'calories', int),
+    FieldMapping('averageHR', 'average_hr'),
+    FieldMapping('maxHR', 'max_hr'),
+    FieldMapping('avgPower', 'avg_power'),
+    FieldMapping('maxPower', 'max_power'),
+    FieldMapping('normPower', 'norm_power', int),
+    FieldMapping('aerobicTrainingEffect', 'aerobic_training_effect', rounding=1),
+    FieldMapping('anaerobicTrainingEffect', 'anaerobic_training_effect', rounding=1),
+    FieldMapping('trainingStressScore', 'training_stress_score', rounding=1),
+    FieldMapping('intensityFactor', 'intensity_factor', rounding=3),
+    FieldMapping('averageRunningCadenceInStepsPerMinute', 'average_running_cadence_steps_per_min', int),
+    FieldMapping('maxRunningCadenceInStepsPerMinute', 'max_running_cadence_steps_per_min', int),
+    FieldMapping('averageBikingCadenceInRevPerMinute', 'average_biking_cadence_rev_per_min'),
+    FieldMapping('maxBikingCadenceInRevPerMinute', 'max_biking_cadence_rev_per_min'),
+    FieldMapping('averageSwimCadenceInStrokesPerMinute', 'average_swim_cadence_strokes_per_min'),
+    FieldMapping('maxSwimCadenceInStrokesPerMinute', 'max_swim_cadence_strokes_per_min'),
+    FieldMapping('averageSwolf', 'average_swolf'),
+    FieldMapping('activeLengths', 'active_lengths'),
+    FieldMapping('poolLength', 'pool_length'),
+    FieldMapping(('unitOfPoolLength', 'unitKey'), 'unit_of_pool_length', str),
+    FieldMapping(('unitOfPoolLength', 'factor'), 'pool_length_factor', int),
+    FieldMapping('strokes', 'strokes'),
+    FieldMapping('avgStrokeDistance', 'avg_stroke_distance', int),
+    FieldMapping('avgStrokeCadence', 'avg_stroke_cadence'),
+    FieldMapping('maxStrokeCadence', 'max_stroke_cadence'),
+    FieldMapping('avgStrokes', 'avg_strokes', rounding=1),
+    FieldMapping('minStrokes', 'min_strokes', rounding=1),
+    FieldMapping('leftBalance', 'left_balance'),
+    FieldMapping('rightBalance', 'right_balance'),
+    FieldMapping('avgLeftBalance', 'avg_left_balance'),
+    FieldMapping('avgVerticalOscillation', 'avg_vertical_oscillation', rounding=1),
+    FieldMapping('avgGroundContactTime', 'avg_ground_contact_time', int),
+    FieldMapping('avgStrideLength', 'avg_stride_length', int),
+    FieldMapping('avgFractionalCadence', 'avg_fractional_cadence'),
+    FieldMapping('maxFractionalCadence', 'max_fractional_cadence'),
+    FieldMapping('avgVerticalRatio', 'avg_vertical_ratio', rounding=2),
+    FieldMapping('avgGroundContactBalance', 'avg_ground_contact_balance', rounding=2),
+    FieldMapping('vO2MaxValue', 'vo2_max_value'),
+    FieldMapping('lactateThresholdBpm', 'lactate_threshold_bpm'),
+    FieldMapping('lactateThresholdSpeed', 'lactate_threshold_speed'),
+    FieldMapping('maxFtp', 'max_ftp'),
+    FieldMapping('max20MinPower', 'max_20_min_power', int),
+    FieldMapping('maxAvgPower_1', 'max_avg_power_1'),
+    FieldMapping('maxAvgPower_2', 'max_avg_power_2'),
+    FieldMapping('maxAvgPower_5', 'max_avg_power_5'),
+    FieldMapping('maxAvgPower_10', 'max_avg_power_10'),
+    FieldMapping('maxAvgPower_20', 'max_avg_power_20'),
+    FieldMapping('maxAvgPower_30', 'max_avg_power_30'),
+    FieldMapping('maxAvgPower_60', 'max_avg_power_60'),
+    FieldMapping('maxAvgPower_120', 'max_avg_power_120'),
+    FieldMapping('maxAvgPower_300', 'max_avg_power_300'),
+    FieldMapping('maxAvgPower_600', 'max_avg_power_600'),
+    FieldMapping('maxAvgPower_1200', 'max_avg_power_1200'),
+    FieldMapping('maxAvgPower_1800', 'max_avg_power_1800'),
+    FieldMapping('maxAvgPower_3600', 'max_avg_power_3600'),
+    FieldMapping('maxAvgPower_7200', 'max_avg_power_7200'),
+    FieldMapping('maxAvgPower_18000', 'max_avg_power_18000'),
+]
+# keys of the activities that are kept when parsing a page: the mapped ones and the ones for the sync watermark
+GARMIN_KEYS = mapping_keys(GARMIN_FIELDS) | {'startTimeGMT'}
+
 
 class GarminImporter(WorkoutImporter):
     """
     Imports workouts from Garmin Connect
+    While the workouts of a page are written to the database, up to 'concurrency' following pages are fetched
+    in parallel, using the connection pool of the session. A concurrency of 0 fetches page by page.
+    Garmin Connect delivers the newest workouts first. Unless 'full' is set, fetching stops at the newest workout
+    of the previous import (the sync watermark of the account).
+    If 'cache_directory' is set, the raw pages are stored there; with 'replay' set, the workouts are imported
+    from all cached pages of the account instead of Garmin Connect.
+    If 'session_file' is set, the cookies of the signed in session are kept there and reused by the next import,
+    signing in again only if Garmin Connect rejects them.
     """
 
     def _authenticate(self):
@@ -68,16 +163,98 @@ class GarminImporter(WorkoutImporter):
         else:
             logger.warning("NO TITLE FOUND IN RESPONE")
 
-    def __init__(self, username, password):
+    def _load_session(self):
+        """
+        restores the cookies of a previous session of the same user, returns False if there are none
+        """
+        if not self.session_file:
+            return False
+        try:
+            with open(self.session_file, "r") as file:
+                stored_session = json.load(file)
+        except (OSError, ValueError):
+            return False
+        try:
+            if stored_session.get("username") != self.username:
+                return False
+            for cookie in stored_session["cookies"]:
+                self.session.cookies.set(cookie["name"], cookie["value"], domain=cookie["domain"],
+                                         path=cookie["path"], secure=cookie["secure"], expires=cookie["expires"])
+        except (KeyError, TypeError, AttributeError) as e:
+            logger.warning("ignoring invalid session file {}: {}".format(self.session_file, repr(e)))
+            self.session.cookies.clear()
+            return False
+        logger.info("reusing session of {}".format(self.session_file))
+        return True
+
+    def _save_session(self):
+        """
+        stores the cookies of the signed in session, readable by the owner only
+        """
+        if not self.session_file:
+            return
+        cookies = []
+        for cookie in self.session.cookies:
+            cookies.append({"name": cookie.name,
+                            "value": cookie.value,
+                            "domain": cookie.domain,
+                            "path": cookie.path,
+                            "secure": cookie.secure,
+                            "expires": cookie.expires})
+        directory = os.path.dirname(self.session_file)
+        if directory:
+            os.makedirs(directory, mode=0o700, exist_ok=True)
+        descriptor = os.open(self.session_file, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+        os.chmod(self.session_file, 0o600)
+        with os.fdopen(descriptor, "w") as file:
+            json.dump({"username": self.username, "cookies": cookies}, file)
+
+    def _reauthenticate(self, authentication):
+        """
+        signs in again after Garmin Connect rejected the session
+        authentication is the number of the session the rejected request was sent with,
+        parallel requests rejected with the same session sign in only once
+        """
+        with self.lock:
+            if authentication == self.authentications:
+                self.session.cookies.clear()
+                self._authenticate()
+                self._save_session()
+                self.authentications += 1
+
+    def __init__(self, username, password, concurrency=4, full=False, cache_directory=None, replay=False,
+                 session_file=None):
         logger.info("garmin importer initializing ...")
         self.username = username
         self.password = password
+        self.concurrency = concurrency
+        self.full = full
+        self.cache = None
+        if cache_directory:
+            self.cache = GarminCache(cache_directory, username)
+        self.replay = replay
+        self.session_file = session_file
         self.session = None
+        self.transform = compile_mapping(GARMIN_FIELDS, {'source': "Garmin"}, WorkoutRecord)
+        self.lock = threading.Lock()
+        self.authentications = 0
+        self.stats = {}
 
     def create_session(self):
         logger.info("garmin importer creating session ...")
+        if self.replay:
+            if not self.cache:
+                logger.error("replay needs a cache directory")
+                return False
+            # no network needed
+            return True
         self.session = requests.Session()
-        self._authenticate()
+        # the connection pool has to serve all pages fetched in parallel
+        adapter = requests.adapters.HTTPAdapter(pool_maxsize=max(self.concurrency, 1))
+        self.session.mount("https://", adapter)
+        if not self._load_session():
+            self._authenticate()
+            self._save_session()
         return True
 
     def close_session(self):
@@ -87,153 +264,136 @@ class GarminImporter(WorkoutImporter):
             self.session = None
         logger.info("session closed")
 
-    def _create_workout(self, record, db):
-        workout = Workout()
-        workout.source = "Garmin"
-        workout.external_id = record['activityId'] 
-        workout.name = record['activityName']
-        workout.description = record['description']
-
-        sportstype = SportsType(name = record['activityType']['typeKey'])
-        sportstype.add(workout, db)
-        workout.sportstype_id = sportstype.id
-        workout.sport_id = sportstype.sport_id
-
-        if record['minTemperature']:
-            workout.min_temperature = int(record['minTemperature'])
-        if record['maxTemperature']:
-            workout.max_temperature = int(record['maxTemperature'])
-        workout.start_time = datetime.strptime(record['startTimeLocal'], "%Y-%m-%d %H:%M:%S")     # 2020-03-28 16:25:47
-        if record['duration']:
-            workout.duration_sec = int(record['duration'])
-        if record['movingDuration']:
-            workout.moving_duration_sec = int(record['movingDuration'])
-        if record['distance']:
-            workout.distance_m = int(record['distance'])
-        if record['averageSpeed']:
-            workout.average_speed_m_per_sec = round(record['averageSpeed'], 3)
-        if record['maxSpeed']:
-            workout.max_speed_m_per_sec = round(record['maxSpeed'], 3)
-        workout.elevation_gain_m = record['elevationGain']
-        workout.elevation_loss_m = record['elevationLoss']
-        if record['calories']:
-            workout.calories = int(record['calories']) 
-        workout.average_hr = record['averageHR']
-        workout.max_hr = record['maxHR']
-        workout.avg_power = record['avgPower']
-        workout.max_power = record['maxPower']
-        if record['normPower']:
-            workout.norm_power = int(record['normPower'])
-        if record['aerobicTrainingEffect']:
-            workout.aerobic_training_effect = round(record['aerobicTrainingEffect'], 1)
-        if record['anaerobicTrainingEffect']:
-            workout.anaerobic_training_effect = round(record['anaerobicTrainingEffect'], 1)
-        if record['trainingStressScore']:
-            workout.training_stress_score = round(record['trainingStressScore'], 1)
-        if record['intensityFactor']:
-            workout.intensity_factor = round(record['intensityFactor'], 3)
-        if record['averageRunningCadenceInStepsPerMinute']:
-            workout.average_running_cadence_steps_per_min = int(record['averageRunningCadenceInStepsPerMinute'])
-        if record['maxRunningCadenceInStepsPerMinute']:
-            workout.max_running_cadence_steps_per_min = int(record['maxRunningCadenceInStepsPerMinute'])
-        workout.average_biking_cadence_rev_per_min = record['averageBikingCadenceInRevPerMinute']
-        workout.max_biking_cadence_rev_per_min = record['maxBikingCadenceInRevPerMinute']
-        workout.average_swim_cadence_strokes_per_min = record['averageSwimCadenceInStrokesPerMinute']
-        workout.max_swim_cadence_strokes_per_min = record['maxSwimCadenceInStrokesPerMinute']
-        workout.average_swolf = record['averageSwolf']
-        workout.active_lengths = record['activeLengths']
-        workout.pool_length = record['poolLength']
-        if record['unitOfPoolLength']:
-            if record['unitOfPoolLength']['unitKey']:
-                workout.unit_of_pool_length = str(record['unitOfPoolLength']['unitKey'])
-        if record['unitOfPoolLength']:
-            if record['unitOfPoolLength']['factor']:
-                workout.pool_length_factor = int(record['unitOfPoolLength']['factor'])
-        workout.strokes = record['strokes']
-        if record['avgStrokeDistance']:
-            workout.avg_stroke_distance = int(record['avgStrokeDistance'])
-        workout.avg_stroke_cadence = record['avgStrokeCadence']
-        workout.max_stroke_cadence = record['maxStrokeCadence']
-        if record['avgStrokes']:
-            workout.avg_strokes = round(record['avgStrokes'], 1)
-        if record['minStrokes']:
-            workout.min_strokes = round(record['minStrokes'], 1)
-        workout.left_balance = record['leftBalance']
-        workout.right_balance = record['rightBalance']
-        workout.avg_left_balance = record['avgLeftBalance']
-        if record['avgVerticalOscillation']:
-            workout.avg_vertical_oscillation = round(record['avgVerticalOscillation'], 1)
-        if record['avgGroundContactTime']:
-            workout.avg_ground_contact_time = int(record['avgGroundContactTime'])
-        if record['avgStrideLength']:
-            workout.avg_stride_length = int(record['avgStrideLength'])
-        workout.avg_fractional_cadence = record['avgFractionalCadence']
-        workout.max_fractional_cadence = record['maxFractionalCadence']
-        if record['avgVerticalRatio']:
-            workout.avg_vertical_ratio = round(record['avgVerticalRatio'], 2)
-        if record['avgGroundContactBalance']:
-            workout.avg_ground_contact_balance = round(record['avgGroundContactBalance'], 2)
-        workout.vo2_max_value = record['vO2MaxValue']
-        workout.lactate_threshold_bpm = record['lactateThresholdBpm']
-        workout.lactate_threshold_speed = record['lactateThresholdSpeed']
-        workout.max_ftp = record['maxFtp']
-        if record['max20MinPower']:
-            workout.max_20_min_power = int(record['max20MinPower'])
-        workout.max_avg_power_1 = record['maxAvgPower_1']
-        workout.max_avg_power_2 = record['maxAvgPower_2']
-        workout.max_avg_power_5 = record['maxAvgPower_5']
-        workout.max_avg_power_10 = record['maxAvgPower_10']
-        workout.max_avg_power_20 = record['maxAvgPower_20']
-        workout.max_avg_power_30 = record['maxAvgPower_30']          
-        workout.max_avg_power_60 = record['maxAvgPower_60']
-        workout.max_avg_power_120 = record['maxAvgPower_120']
-        workout.max_avg_power_300 = record['maxAvgPower_300']
-        workout.max_avg_power_600 = record['maxAvgPower_600']
-        workout.max_avg_power_1200 = record['maxAvgPower_1200']
-        workout.max_avg_power_1800 = record['maxAvgPower_1800']
-        workout.max_avg_power_3600 = record['maxAvgPower_3600']
-        workout.max_avg_power_7200 = record['maxAvgPower_7200']
-        workout.max_avg_power_18000 = record['maxAvgPower_18000']
-        return workout.add(db)
+    def _fetch_workouts(self, start):
+        """
+        fetches the page of workouts beginning with workout number start
+        """
+        params = {
+            "start": start,
+            "limit": CHUNK_SIZE }
+        authentication = self.authentications
+        response = self.session.get(GARMIN_ACTIVITIES_SEARCH, params=params)
+        if response.status_code in [401, 403] or response.url.startswith(GARMIN_SSO_URL):
+            # the session is not signed in (anymore)
+            logger.info("session rejected by Garmin Connect")
+            response.close()
+            self._reauthenticate(authentication)
+            response = self.session.get(GARMIN_ACTIVITIES_SEARCH, params=params)
+        if response.status_code != 200:
+            raise ValueError("error reading workouts")
+        if self.cache:
+            self.cache.store(start, response.content)
+        return self._parse_page(response.content)
 
-    def import_workouts(self, db):
-        CHUNK_SIZE = 400
+    @staticmethod
+    def _parse_page(content):
+        """
+        parses a page of activities, keeping just the fields needed for the import,
+        so the pages fetched ahead take less memory
+        """
+        # the json module decodes the whole page faster than any incremental parser keeping only some keys
+        return [{key: activity[key] for key in GARMIN_KEYS if key in activity} for activity in json.loads(content)]
+
+    @staticmethod
+    def _watermark(record):
+        """
+        returns the position of a workout in the order of the activities search: (start time GMT, activity id)
+        """
+        return (datetime.strptime(record['startTimeGMT'], "%Y-%m-%d %H:%M:%S"), record['activityId'])
+
+    def _import_page(self, records, db, watermark):
+        """
+        imports the workouts of a page that are newer than watermark
+        Returns (number of fetched workouts, number of imported workouts, newest position, True if watermark reached)
+        """
+        newest = None
+        watermark_reached = False
+        new_records = []
+        for record in records:
+            position = self._watermark(record)
+            if watermark and position <= watermark:
+                # this and all following workouts have been imported before
+                watermark_reached = True
+                break
+            if not newest or position > newest:
+                newest = position
+            new_records.append(record)
 
+        # with open("workouts.json", "w") as file:
+        #   json.dump(workouts, file)
+        # file.close()
+        with profiler.stage("decode"):
+            workouts = self.transform(new_records)
+        with profiler.stage("resolve"):
+            for workout in workouts:
+                (workout.sportstype_id, workout.sport_id) = db.resolve_sportstype(workout.sportstype, workout.name)
+        (fetched_workouts, imported_workouts) = db.add_workouts(workouts)
+        return (fetched_workouts, imported_workouts, newest, watermark_reached)
+
+    def import_workouts(self, db):
         logger.info("fetching workouts ...")
 
-        workouts_left = True
+        watermark = None
+        if not self.full and not self.replay:
+            watermark = db.get_watermark("Garmin", self.username)
+            if watermark:
+                logger.info("fetching workouts newer than {} started {}".format(watermark[1], watermark[0]))
+        newest = watermark
+        failed_workouts = db.failed_workouts
+
         total_imported_workouts = 0
         total_fetched_workouts = 0
-        next_workout = 0
-        while workouts_left:
-            imported_workouts = 0
-            fetched_workouts = 0
-            params = {
-                "start": next_workout,
-                "limit": CHUNK_SIZE }
-            response = self.session.get(GARMIN_ACTIVITIES_SEARCH, params=params)
-            if response.status_code != 200:
-                raise ValueError("error reading workouts")
-            
-            for workout in response.json():
-                # with open("workouts.json", "w") as file:
-                #   json.dump(workouts, file)
-                # file.close()
-                if self._create_workout(workout, db):
-                    # new workout created
-                    imported_workouts += 1
-                else:
-                    # workout already known
-                    pass
-                fetched_workouts += 1
-                
-            if fetched_workouts < CHUNK_SIZE:
-                workouts_left = False
-            next_workout += fetched_workouts 
+        for records in profiler.timed(self._fetch_pages(watermark), "fetch"):
+            (fetched_workouts, imported_workouts, page_newest, watermark_reached) = \
+                self._import_page(records, db, watermark)
             total_imported_workouts +=  imported_workouts
             total_fetched_workouts += fetched_workouts
+            if page_newest and (not newest or page_newest > newest):
+                newest = page_newest
+            if watermark_reached:
+                break
+
+        if db.failed_workouts > failed_workouts:
+            # the next import has to fetch the workouts that were not stored again
+            logger.error("{} workouts could not be stored, the next import fetches them again"
+                         .format(db.failed_workouts - failed_workouts))
+        elif newest and newest != watermark:
+            db.set_watermark("Garmin", self.username, newest[0], newest[1])
 
         logger.info("{} workouts fetched and {} workouts imported".format(total_fetched_workouts, total_imported_workouts))
+        self.stats = profiler.stats()
+        return(total_fetched_workouts, total_imported_workouts)
+
+    def _fetch_pages(self, watermark):
+        """
+        yields the workouts page by page, from the cache if replaying, else from Garmin Connect
+        """
+        if self.replay:
+            for content in self.cache.pages():
+                yield self._parse_page(content)
+            return
+
+        workouts_left = True
+        next_page = 0
+        pages = collections.deque()
+        # an incremental import requests the first page alone, usually it contains all new workouts
+        pages_ahead = 0 if watermark else self.concurrency
+        with ThreadPoolExecutor(max_workers=max(self.concurrency, 1)) as executor:
+            try:
+                while workouts_left:
+                    # request the following pages before the current one is written to the database
+                    while len(pages) <= pages_ahead:
+                        pages.append(executor.submit(self._fetch_workouts, next_page))
+                        next_page += CHUNK_SIZE
+                    records = pages.popleft().result()
+                    if len(records) < CHUNK_SIZE:
+                        workouts_left = False
+                    pages_ahead = self.concurrency
+                    yield records
+            finally:
+                # pages beyond the last one are not needed
+                for page in pages:
+                    page.cancel()
 
 
     # sample Garmin activity:
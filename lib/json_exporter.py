@@ -2,6 +2,7 @@
 
 from lib.workout_exporter import WorkoutExporter
 from lib.workout import Workout, Sport, SportsType, WorkoutsDatabase
+from lib import profiler
 import logging
 import json
 
@@ -11,12 +12,15 @@ logger = logging.getLogger(__name__)
 class JsonExporter(WorkoutExporter):
     """
     Exports workouts from a database to a json file
+    either as one json array or, if ndjson is set, as one json object per line
     """
 
-    def __init__(self, filename):
+    def __init__(self, filename, ndjson=False):
         logger.info("json exporter initializing ...")
         self.json = None
         self.filename = filename
+        self.ndjson = ndjson
+        self.stats = {}
 
     def create_session(self):
         logger.info("json exporter creating session ...")
@@ -37,12 +41,27 @@ class JsonExporter(WorkoutExporter):
         self.json = None
 
     def export_workouts(self, db):
+        CHUNK_SIZE = 1000
+
         logger.info("exporting workouts ...")
         exported_workouts = 0
-        workouts = db.session.query(Workout).all()
-        json_data = []
-        for workout in workouts:
-            json_data.append(workout.as_dict(db))
+        header = Workout.header()
+        # workouts are streamed from the database and written one by one
+        if not self.ndjson:
+            self.json.write("[")
+        for workout in profiler.timed(Workout.export_query(db).yield_per(CHUNK_SIZE), "fetch"):
+            with profiler.stage("write"):
+                record = dict(zip(header, workout))
+                record["start_time"] = str(record["start_time"])
+                if self.ndjson:
+                    self.json.write(json.dumps(record))
+                    self.json.write("\n")
+                else:
+                    if exported_workouts:
+                        self.json.write(", ")
+                    self.json.write(json.dumps(record))
             exported_workouts += 1
-        json.dump(json_data, self.json)
+        if not self.ndjson:
+            self.json.write("]")
         logger.info("{} workouts exported".format(exported_workouts))
+        self.stats = profiler.stats()
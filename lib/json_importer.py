@@ -1,10 +1,11 @@
 # coding=utf-8
 
 from lib.workout_importer import WorkoutImporter
-from lib.workout import Workout, Sport, SportsType, WorkoutsDatabase
+from lib.workout import Workout
+from lib import profiler
+from lib.json_stream import iter_json_array, iter_json_lines, read_chunks
 import logging
 import json
-from datetime import datetime
 
 logger = logging.getLogger(__name__)
 
@@ -12,11 +13,14 @@ logger = logging.getLogger(__name__)
 class JsonImporter(WorkoutImporter):
     """
     Imports workouts in JSON format into a database
+    the file is parsed incrementally, either as json arrays or, if ndjson is set, as one json object per line
     """
-    def __init__(self, filename):
+    def __init__(self, filename, ndjson=False):
         logger.info("json importer initializing ...")
         self.json = None
         self.filename = filename
+        self.ndjson = ndjson
+        self.stats = {}
 
     def create_session(self):
         logger.info("json importer creating session ...")
@@ -47,36 +51,33 @@ class JsonImporter(WorkoutImporter):
         total_imported_workouts = 0
 
         if (self.json):
-            for data in self.json:
-                try:
-                    records = json.loads(data)
-                except json.JSONDecodeError as e:
-                    logger.error("JSON file not formatted correctly: {}".format(e.args))
-                    break
-                for record in records:
-                    workout = Workout()
-                    total_fetched_workouts += 1
-                    for key in record:
-                        if key == "start_time":
-                            record[key] = datetime.strptime(
-                                record[key], "%Y-%m-%d %H:%M:%S")
-                        elif key == "id":
-                            workout.external_id = record[key]
-                            continue
-                        elif key == "sportstype":
-                            sportstype = SportsType(name=record[key])
-                            if record["name"]:
-                                # necessary for sportstype association
-                                workout.name = record["name"]
-                            sportstype.add(workout, db)
-                            workout.sportstype_id = sportstype.id
-                            workout.sport_id = sportstype.sport_id
-                            continue
-                        setattr(workout, key, record[key])
-                    if 'source' not in record:
-                        workout.source = "JSON import"
-                    if workout.add(db):
-                        total_imported_workouts += 1
+            (total_fetched_workouts, total_imported_workouts) = db.add_workouts(self._read_workouts(db))
         logger.info("{} workouts fetched and {} workouts imported".format(
             total_fetched_workouts, total_imported_workouts))
+        self.stats = profiler.stats()
         return(total_fetched_workouts, total_imported_workouts)
+
+    def _read_workouts(self, db):
+        """
+        yields a WorkoutRecord for each json record
+        """
+        if self.ndjson:
+            records = iter_json_lines(self.json)
+        else:
+            records = iter_json_array(read_chunks(self.json))
+        decoders = {}
+        try:
+            for record in profiler.timed(records, "decode"):
+                with profiler.stage("decode"):
+                    keys = tuple(record)
+                    decode = decoders.get(keys)
+                    if not decode:
+                        # one decoder for each set of keys, usually all records have the same
+                        decode = Workout.decoder(keys, None if 'source' in record else {'source': "JSON import"})
+                        decoders[keys] = decode
+                    workout = decode((record,))[0]
+                with profiler.stage("resolve"):
+                    (workout.sportstype_id, workout.sport_id) = db.resolve_sportstype(workout.sportstype, workout.name)
+                yield workout
+        except json.JSONDecodeError as e:
+            logger.error("JSON file not formatted correctly: {}".format(e.args))
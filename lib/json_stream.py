@@ -0,0 +1,94 @@
+# coding=utf-8
+
+import json
+
+WHITESPACE = " \t\n\r"
+
+# states of the array parser
+OUTSIDE_ARRAY = 0
+FIRST_VALUE = 1
+NEXT_VALUE = 2
+SEPARATOR = 3
+
+
+def read_chunks(file, chunk_size=65536):
+    """
+    yields a file opened in text mode in chunks of chunk_size characters
+    """
+    return iter(lambda: file.read(chunk_size), '')
+
+
+def iter_json_array(chunks, decoder=None):
+    """
+    Yields the elements of top-level json arrays one by one, reading the text chunks as they are needed
+    Several arrays following each other, like one array per line, are read one after the other
+    Raises json.JSONDecodeError if the text is not formatted correctly
+    """
+    if not decoder:
+        decoder = json.JSONDecoder()
+    chunks = iter(chunks)
+    buffer = ''
+    position = 0
+    state = OUTSIDE_ARRAY
+    more = True
+    while True:
+        while position < len(buffer) and buffer[position] in WHITESPACE:
+            position += 1
+        if position == len(buffer):
+            chunk = next(chunks, None) if more else None
+            if chunk is None:
+                break
+            buffer = chunk
+            position = 0
+            continue
+
+        char = buffer[position]
+        if state == OUTSIDE_ARRAY:
+            if char != '[':
+                raise json.JSONDecodeError("Expecting '['", buffer, position)
+            state = FIRST_VALUE
+            position += 1
+        elif char == ']' and state in [FIRST_VALUE, SEPARATOR]:
+            state = OUTSIDE_ARRAY
+            position += 1
+        elif state == SEPARATOR:
+            if char != ',':
+                raise json.JSONDecodeError("Expecting ',' delimiter", buffer, position)
+            state = NEXT_VALUE
+            position += 1
+        else:
+            try:
+                (value, end) = decoder.raw_decode(buffer, position)
+                # a number at the end of the buffer may continue in the next chunk
+                complete = end < len(buffer) or isinstance(value, (dict, list, str))
+            except json.JSONDecodeError:
+                complete = False
+                if not more:
+                    raise
+            if not complete and more:
+                chunk = next(chunks, None)
+                if chunk is None:
+                    more = False
+                else:
+                    buffer = buffer[position:] + chunk
+                    position = 0
+                continue
+            yield value
+            position = end
+            state = SEPARATOR
+
+    if state != OUTSIDE_ARRAY:
+        raise json.JSONDecodeError("Unterminated array", buffer, position)
+
+
+def iter_json_lines(lines, decoder=None):
+    """
+    Yields the json objects of newline delimited json (one object per line), empty lines are skipped
+    Raises json.JSONDecodeError if a line is not formatted correctly
+    """
+    if not decoder:
+        decoder = json.JSONDecoder()
+    for line in lines:
+        line = line.strip()
+        if line:
+            yield decoder.decode(line)
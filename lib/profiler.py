@@ -0,0 +1,194 @@
+# coding=utf-8
+
+import re
+import sys
+import time
+import pstats
+import cProfile
+import threading
+import contextlib
+from sqlalchemy import event
+
+# the profiler of the running import or export, None if not profiling
+active = None
+
+
+class Profiler:
+    """
+    Collects where the time of an import or export goes
+    - stages: time spent in named stages like decode, resolve, insert or dedupe, a stage running within
+      another one is only counted for the inner one
+    - sql: number and time of the statements executed by an engine, by normalized sql text
+    - optionally a cProfile of the whole run
+    Stages are timed in the thread that started the profiler only
+    """
+
+    def __init__(self, cprofile=False):
+        self.stages = {}
+        self.statements = {}
+        self.stack = []
+        self.engines = []
+        self.cprofile = cProfile.Profile() if cprofile else None
+        self.started = None
+        self.seconds = 0.0
+        self.thread = None
+
+    def start(self, engine=None):
+        """
+        starts profiling, statements of engine are recorded
+        """
+        global active
+        active = self
+        self.thread = threading.get_ident()
+        if engine is not None:
+            event.listen(engine, 'before_cursor_execute', self._before_cursor_execute)
+            event.listen(engine, 'after_cursor_execute', self._after_cursor_execute)
+            self.engines.append(engine)
+        if self.cprofile:
+            self.cprofile.enable()
+        self.started = time.perf_counter()
+        return self
+
+    def stop(self):
+        global active
+        if self.started is None:
+            return
+        self.seconds += time.perf_counter() - self.started
+        self.started = None
+        if self.cprofile:
+            self.cprofile.disable()
+        for engine in self.engines:
+            event.remove(engine, 'before_cursor_execute', self._before_cursor_execute)
+            event.remove(engine, 'after_cursor_execute', self._after_cursor_execute)
+        self.engines = []
+        if active is self:
+            active = None
+
+    def _before_cursor_execute(self, connection, cursor, statement, parameters, context, executemany):
+        connection.info.setdefault('profiler_started', []).append(time.perf_counter())
+
+    def _after_cursor_execute(self, connection, cursor, statement, parameters, context, executemany):
+        seconds = time.perf_counter() - connection.info['profiler_started'].pop()
+        key = normalize_statement(statement)
+        entry = self.statements.get(key)
+        if entry is None:
+            entry = self.statements[key] = [0, 0.0]
+        entry[0] += 1
+        entry[1] += seconds
+
+    def enter(self, name):
+        now = time.perf_counter()
+        if self.stack:
+            # the outer stage is paused
+            (outer, started) = self.stack[-1]
+            self._add(outer, now - started, 0)
+        self.stack.append((name, now))
+
+    def exit(self):
+        now = time.perf_counter()
+        (name, started) = self.stack.pop()
+        self._add(name, now - started, 1)
+        if self.stack:
+            self.stack[-1] = (self.stack[-1][0], now)
+
+    def _add(self, name, seconds, calls):
+        entry = self.stages.get(name)
+        if entry is None:
+            entry = self.stages[name] = [0, 0.0]
+        entry[0] += calls
+        entry[1] += seconds
+
+    def stats(self):
+        """
+        returns the statistics as dict:
+        {'seconds': total, 'stages': {name: {'calls', 'seconds'}},
+         'sql': {'statements', 'seconds', 'by_statement': {normalized sql: {'count', 'seconds'}}}}
+        """
+        seconds = self.seconds + (time.perf_counter() - self.started if self.started is not None else 0)
+        return {'seconds': seconds,
+                'stages': {name: {'calls': calls, 'seconds': stage_seconds}
+                           for (name, (calls, stage_seconds)) in self.stages.items()},
+                'sql': {'statements': sum(count for (count, sql_seconds) in self.statements.values()),
+                        'seconds': sum(sql_seconds for (count, sql_seconds) in self.statements.values()),
+                        'by_statement': {statement: {'count': count, 'seconds': sql_seconds}
+                                         for (statement, (count, sql_seconds)) in self.statements.items()}}}
+
+    def report(self, file=None, statements=15):
+        """
+        prints the stages, the statements taking most time and, if enabled, the cProfile summary
+        """
+        file = file or sys.stdout
+        stats = self.stats()
+        total = stats['seconds'] or 1e-9
+        print("{:<30}{:>10}{:>12}{:>8}".format("STAGE", "CALLS", "SECONDS", "%"), file=file)
+        stages = sorted(stats['stages'].items(), key=lambda item: -item[1]['seconds'])
+        for (name, stage) in stages:
+            print("{:<30}{:>10}{:>12.3f}{:>8.1f}".format(
+                name, stage['calls'], stage['seconds'], 100 * stage['seconds'] / total), file=file)
+        other = total - sum(stage['seconds'] for (name, stage) in stages)
+        print("{:<30}{:>10}{:>12.3f}{:>8.1f}".format("(other)", "", other, 100 * other / total), file=file)
+        print("{:<30}{:>10}{:>12.3f}".format("total", "", stats['seconds']), file=file)
+        print(file=file)
+        print("{:>8}{:>12}  SQL ({} statements, {:.3f} s)".format(
+            "COUNT", "SECONDS", stats['sql']['statements'], stats['sql']['seconds']), file=file)
+        by_statement = sorted(stats['sql']['by_statement'].items(), key=lambda item: -item[1]['seconds'])
+        for (statement, entry) in by_statement[:statements]:
+            print("{:>8}{:>12.3f}  {}".format(entry['count'], entry['seconds'], statement[:100]), file=file)
+        if self.cprofile:
+            print(file=file)
+            pstats.Stats(self.cprofile, stream=file).sort_stats('cumulative').print_stats(25)
+
+
+def normalize_statement(statement):
+    """
+    returns the sql text with whitespace collapsed and IN lists of any number of parameters shortened
+    """
+    statement = re.sub(r'\s+', ' ', statement).strip()
+    return re.sub(r'IN \(\?(?:, \?)+\)', 'IN (?, ...)', statement)
+
+
+class _Stage:
+    __slots__ = ['profiler', 'name']
+
+    def __init__(self, profiler, name):
+        self.profiler = profiler
+        self.name = name
+
+    def __enter__(self):
+        self.profiler.enter(self.name)
+
+    def __exit__(self, *args):
+        self.profiler.exit()
+
+
+_NO_STAGE = contextlib.nullcontext()
+_END = object()
+
+
+def stage(name):
+    """
+    returns a context manager timing a stage if a profiler is active
+    """
+    if active is None or active.thread != threading.get_ident():
+        return _NO_STAGE
+    return _Stage(active, name)
+
+
+def timed(iterable, name):
+    """
+    yields the items of an iterable, the time needed to get them is counted for the stage
+    """
+    iterator = iter(iterable)
+    while True:
+        with stage(name):
+            item = next(iterator, _END)
+        if item is _END:
+            return
+        yield item
+
+
+def stats():
+    """
+    returns the statistics of the active profiler, an empty dict if not profiling
+    """
+    return active.stats() if active else {}
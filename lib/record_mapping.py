@@ -0,0 +1,183 @@
+# coding=utf-8
+
+import logging
+import collections
+from datetime import datetime
+
+logger = logging.getLogger(__name__)
+
+# declarative mapping of one field of an imported record to a workout column
+# - source: key of the field in the record, a tuple of keys for nested fields
+# - target: name of the workout column
+# - converter: function applied to the value, e.g. int
+# - rounding: number of decimals the value is rounded to
+# values with converter or rounding are only converted if they are set (not None, 0 or ''), else they become None;
+# values without are copied as they are
+FieldMapping = collections.namedtuple('FieldMapping', ['source', 'target', 'converter', 'rounding'],
+                                      defaults=[None, None])
+
+
+def to_datetime(value):
+    """
+    converts '2020-03-28 16:25:47' to a datetime, datetimes are kept
+    """
+    if isinstance(value, datetime):
+        return value
+    return datetime.fromisoformat(value)
+
+
+def to_int(value):
+    """
+    converts '42' or 42.0 to an int, numbers with decimals like '1.5' or 1.5 are kept as float
+    """
+    if isinstance(value, float):
+        return int(value) if value.is_integer() else value
+    try:
+        return int(value)
+    except ValueError:
+        value = float(value)
+        return int(value) if value.is_integer() else value
+
+
+def to_bool(value):
+    """
+    converts 'True', 'true' or '1' to True and other strings to False, other values by their truth value
+    """
+    if isinstance(value, str):
+        return value.lower() in ('true', '1')
+    return bool(value)
+
+
+def mapping_keys(fields):
+    """
+    returns all keys of the records used by the mapping, including the keys of nested fields
+    """
+    keys = set()
+    for field in fields:
+        if isinstance(field.source, tuple):
+            keys.update(field.source)
+        else:
+            keys.add(field.source)
+    return keys
+
+
+def _checked(field):
+    """
+    returns a function converting a value with converter and rounding of field,
+    values which cannot be converted are logged and become None
+    """
+    def convert(value):
+        try:
+            converted = field.converter(value) if field.converter else value
+            return converted if field.rounding is None else round(converted, field.rounding)
+        except (ValueError, TypeError) as e:
+            logger.warning("{!r} could not be converted to {}, it is stored as NULL: {}".format(value, field.target, e))
+            return None
+    return convert
+
+
+def _convert(i, field, value, condition, namespace, checked=False):
+    """
+    returns the expression converting value with converter and rounding of field if condition holds for it,
+    checked expressions log values which cannot be converted and return None for them
+    """
+    converted = "_value"
+    if checked:
+        namespace["converter_{}".format(i)] = _checked(field)
+        converted = "converter_{}({})".format(i, converted)
+    else:
+        if field.converter:
+            namespace["converter_{}".format(i)] = field.converter
+            converted = "converter_{}({})".format(i, converted)
+        if field.rounding is not None:
+            converted = "round({}, {})".format(converted, field.rounding)
+    return "({} if {} else None)".format(converted, condition.format("(_value := {})".format(value)))
+
+
+def _compile(name, expressions, constants, factory=None, fallback=None):
+    """
+    compiles the expressions of the workout columns, returned by expressions(namespace, checked), into a function
+    converting a list of records, into dicts or, if given, into objects created by factory with the columns as
+    keyword arguments
+    a record which cannot be converted, e.g. because of text in a numeric column, is converted again by a function
+    compiled with checked expressions, which store None for the values that fail
+    """
+    namespace = {}
+    values = expressions(namespace, fallback is not None)
+    for (i, (target, constant)) in enumerate((constants or {}).items()):
+        namespace["constant_{}".format(i)] = constant
+        values.append((target, "constant_{}".format(i)))
+    # a target mapped more than once, e.g. by a repeated csv column, gets the last value like in a dict literal
+    values = list(dict(values).items())
+
+    if factory:
+        namespace["factory"] = factory
+        row = "factory({})".format(", ".join("{}={}".format(target, value) for (target, value) in values))
+    else:
+        row = "{{{}}}".format(", ".join("{!r}: {}".format(target, value) for (target, value) in values))
+    if fallback is None:
+        namespace["fallback"] = _compile(name, expressions, constants, factory, fallback=False)
+        append = "        try:\n" \
+                 "            append({})\n" \
+                 "        except (ValueError, TypeError):\n" \
+                 "            append(fallback((record,))[0])\n".format(row)
+    else:
+        append = "        append({})\n".format(row)
+    source = "def {}(records):\n" \
+             "    rows = []\n" \
+             "    append = rows.append\n" \
+             "    for record in records:\n" \
+             "{}" \
+             "    return rows\n".format(name, append)
+    exec(source, namespace)
+    return namespace[name]
+
+
+def compile_initializer(keys):
+    """
+    compiles an __init__ method setting the attributes keys from keyword arguments, missing ones to None,
+    for classes with __slots__
+    """
+    namespace = {}
+    source = "def __init__(self, {}):\n".format(", ".join("{}=None".format(key) for key in keys)) + \
+             "".join("    self.{0} = {0}\n".format(key) for key in keys)
+    exec(source, namespace)
+    return namespace["__init__"]
+
+
+def compile_mapping(fields, constants=None, factory=None):
+    """
+    Compiles a list of FieldMapping (and constant column values) once into a function
+    that converts a list of records into a list of dicts of workout columns, ready for WorkoutsDatabase.add_workouts()
+    with factory, e.g. WorkoutRecord, the columns are passed as keyword arguments to factory instead
+    values which cannot be converted are logged and become None
+    """
+    def expressions(namespace, checked):
+        values = []
+        for (i, field) in enumerate(fields):
+            if isinstance(field.source, tuple):
+                value = "record.get({!r})".format(field.source[0])
+                for key in field.source[1:]:
+                    value = "({} or {{}}).get({!r})".format(value, key)
+            else:
+                value = "record.get({!r})".format(field.source)
+            if field.converter or field.rounding is not None:
+                value = _convert(i, field, value, "{}", namespace, checked)
+            values.append((field.target, value))
+        return values
+    return _compile("transform", expressions, constants, factory)
+
+
+def compile_decoder(fields, constants=None, factory=None):
+    """
+    Compiles a list of FieldMapping (and constant column values) for records with known keys once into a function
+    that converts a list of records into a list of dicts of workout columns
+    unlike compile_mapping, sources are keys or indexes every record contains, e.g. the columns of a csv header,
+    and every value is converted unless it is None or '', which become None
+    factory is used like in compile_mapping, values which cannot be converted are logged and become None
+    """
+    def expressions(namespace, checked):
+        return [(field.target, _convert(i, field, "record[{!r}]".format(field.source), "{} not in ('', None)",
+                                        namespace, checked))
+                for (i, field) in enumerate(fields)]
+    return _compile("decode", expressions, constants, factory)
@@ -0,0 +1,85 @@
+# coding=utf-8
+
+import logging
+import importlib
+
+logger = logging.getLogger(__name__)
+
+# built-in importers and exporters: name -> "module:class", the modules are imported on first use
+IMPORTERS = {
+    'garmin': "lib.garmin_importer:GarminImporter",
+    'csv': "lib.csv_importer:CsvImporter",
+    'json': "lib.json_importer:JsonImporter",
+    'parquet': "lib.arrow_importer:ArrowImporter",
+    'arrow': "lib.arrow_importer:ArrowImporter",
+}
+EXPORTERS = {
+    'csv': "lib.csv_exporter:CsvExporter",
+    'json': "lib.json_exporter:JsonExporter",
+    'parquet': "lib.arrow_exporter:ArrowExporter",
+    'arrow': "lib.arrow_exporter:ArrowExporter",
+}
+# entry point groups other packages register their importers and exporters in, e.g. in pyproject.toml:
+# [project.entry-points."workouts.importers"]
+# fit = "workouts_fit:FitImporter"
+IMPORTER_GROUP = "workouts.importers"
+EXPORTER_GROUP = "workouts.exporters"
+
+
+def _entry_points(group):
+    """
+    returns the entry points of a group by name, without importing them
+    """
+    # importlib.metadata is imported here, it is only needed for formats which are not built-in
+    from importlib import metadata
+    try:
+        return {entry_point.name: entry_point for entry_point in metadata.entry_points(group=group)}
+    except Exception as e:
+        logger.error("entry points {} could not be read: {}".format(group, e))
+        return {}
+
+
+def _names(builtins, group):
+    return list(builtins) + [name for name in _entry_points(group) if name not in builtins]
+
+
+def _load(builtins, group, name):
+    """
+    imports and returns the class registered as name, None if unknown
+    built-in formats take precedence over entry points of the same name
+    """
+    if name in builtins:
+        (module, attribute) = builtins[name].split(":")
+        return getattr(importlib.import_module(module), attribute)
+    entry_point = _entry_points(group).get(name)
+    if entry_point:
+        return entry_point.load()
+    return None
+
+
+def importer_names():
+    """
+    returns the names of all importers, built-in ones first
+    """
+    return _names(IMPORTERS, IMPORTER_GROUP)
+
+
+def exporter_names():
+    """
+    returns the names of all exporters, built-in ones first
+    """
+    return _names(EXPORTERS, EXPORTER_GROUP)
+
+
+def importer(name):
+    """
+    returns the importer class registered as name, None if unknown
+    """
+    return _load(IMPORTERS, IMPORTER_GROUP, name)
+
+
+def exporter(name):
+    """
+    returns the exporter class registered as name, None if unknown
+    """
+    return _load(EXPORTERS, EXPORTER_GROUP, name)
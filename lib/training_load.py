@@ -0,0 +1,101 @@
+# coding=utf-8
+
+from lib.workout import Workout, TrainingLoad
+from sqlalchemy import select, func
+import datetime
+import logging
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+logger = logging.getLogger(__name__)
+
+# time constants in days of fitness (chronic training load) and fatigue (acute training load)
+CTL_DAYS = 42
+ATL_DAYS = 7
+# number of days computed at once, small enough that decay ** -BLOCK_SIZE does not overflow
+BLOCK_SIZE = 256
+
+
+def ewma(values, days, initial=0.0, block_size=BLOCK_SIZE):
+    """
+    returns the exponentially weighted moving average with time constant days of a daily series
+    y[t] = y[t-1] * decay + values[t] * (1 - decay), decay = exp(-1 / days), y[-1] = initial
+    the recursion is solved in closed form block by block, without a python loop over the days:
+    y[t] = decay ** (t + 1) * (y[-1] + (1 - decay) * sum(values[k] / decay ** (k + 1) for k <= t))
+    """
+    decay = numpy.exp(-1.0 / days)
+    values = numpy.asarray(values, dtype=float)
+    result = numpy.empty_like(values)
+    powers = decay ** numpy.arange(1, block_size + 1)
+    previous = initial
+    for start in range(0, len(values), block_size):
+        block = values[start:start + block_size]
+        weights = powers[:len(block)]
+        result[start:start + len(block)] = weights * (previous + (1 - decay) * numpy.cumsum(block / weights))
+        previous = result[start + len(block) - 1]
+    return result
+
+
+def update_training_loads(db, until=None):
+    """
+    computes and caches the training loads of all days up to until (default today) which are not cached yet
+    - the daily training stress score is the sum over all workouts of a day not marked as duplicate
+    - CTL and ATL are exponentially weighted averages of the daily score over CTL_DAYS and ATL_DAYS
+    - TSB (form) of a day is CTL - ATL of the day before
+    the computation continues from the last cached day; changed workouts remove the cached days from their day on
+    returns the number of computed days, None if numpy is not installed
+    """
+    if not numpy:
+        logger.error("numpy is needed to compute training loads")
+        return None
+    until = until or datetime.date.today()
+    last = db.session.query(TrainingLoad).order_by(TrainingLoad.day.desc()).first()
+    if last:
+        (start, ctl, atl) = (last.day + datetime.timedelta(days=1), last.ctl, last.atl)
+    else:
+        first = db.session.query(func.min(Workout.start_time)).filter(Workout.is_duplicate_with.is_(None)).scalar()
+        if not first:
+            return 0
+        (start, ctl, atl) = (first.date(), 0.0, 0.0)
+    if start > until:
+        return 0
+
+    number_of_days = (until - start).days + 1
+    day = func.date(Workout.start_time)
+    scores = db.session.execute(select(day, func.total(Workout.training_stress_score))
+                                .where(Workout.is_duplicate_with.is_(None))
+                                .where(Workout.start_time >= datetime.datetime.combine(start, datetime.time()))
+                                .where(Workout.start_time < datetime.datetime.combine(
+                                    until + datetime.timedelta(days=1), datetime.time()))
+                                .group_by(day))
+    daily_scores = numpy.zeros(number_of_days)
+    for (workout_day, score) in scores:
+        daily_scores[(datetime.date.fromisoformat(workout_day) - start).days] = score
+
+    ctls = ewma(daily_scores, CTL_DAYS, ctl)
+    atls = ewma(daily_scores, ATL_DAYS, atl)
+    tsbs = numpy.concatenate(([ctl - atl], ctls[:-1] - atls[:-1]))
+    db.session.execute(TrainingLoad.__table__.insert(), [
+        {'day': start + datetime.timedelta(days=i), 'training_stress_score': score, 'ctl': ctl, 'atl': atl, 'tsb': tsb}
+        for (i, (score, ctl, atl, tsb)) in enumerate(zip(daily_scores.tolist(), ctls.tolist(), atls.tolist(),
+                                                         tsbs.tolist()))])
+    logger.info("training loads of {} days computed from {}".format(number_of_days, start))
+    return number_of_days
+
+
+def training_loads(db, start=None, end=None):
+    """
+    returns the training loads of the days from start to end (default today), updating the cache first,
+    as list of (day, training stress score, CTL, ATL, TSB)
+    """
+    update_training_loads(db, end)
+    query = db.session.query(TrainingLoad.day, TrainingLoad.training_stress_score,
+                             TrainingLoad.ctl, TrainingLoad.atl, TrainingLoad.tsb)
+    if start:
+        query = query.filter(TrainingLoad.day >= start)
+    if end:
+        query = query.filter(TrainingLoad.day <= end)
+    return [tuple(row) for row in query.order_by(TrainingLoad.day)]
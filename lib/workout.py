@@ -1,18 +1,115 @@
 # coding=utf-8
 
+import bisect
 import logging
 import datetime
+import operator
+import collections
 from sqlalchemy.orm import relationship
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy import Column, String, Integer, DateTime, Float, Boolean
-from sqlalchemy import ForeignKey
-from sqlalchemy import create_engine, or_, and_, func
+from sqlalchemy import Column, String, Integer, DateTime, Date, Float, Boolean
+from sqlalchemy import ForeignKey, Index
+from sqlalchemy import create_engine, or_, and_, func, text, select, event, inspect, tuple_
 from sqlalchemy.orm import sessionmaker
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
 from sqlalchemy import exc
+from lib.record_mapping import FieldMapping, compile_decoder, compile_initializer, to_datetime, to_int, to_bool
+from lib import profiler
 
 Base = declarative_base()
 logger = logging.getLogger(__name__)
 
+# summed up columns and periods of the summary tables, with the sql expression of the first day of a period
+SUMMARY_COLUMNS = ['distance_m', 'duration_sec', 'calories', 'training_stress_score']
+SUMMARY_PERIODS = {'week': "date(start_time, '-6 days', 'weekday 1')",
+                   'month': "strftime('%Y-%m-01', start_time)"}
+# workout attributes the summaries depend on
+SUMMARY_KEYS = ['sport_id', 'start_time', 'is_duplicate_with'] + SUMMARY_COLUMNS
+
+# workouts imported more than once by old versions: the same source and external id as a workout with a lower id
+_REIMPORTED = ("SELECT id FROM workouts w WHERE EXISTS (SELECT 1 FROM workouts k WHERE k.source = w.source "
+               "AND k.external_id = w.external_id AND k.id < w.id)")
+# the workout with the lowest id of the same source and external id as workout d
+_KEPT = "(SELECT min(k.id) FROM workouts k WHERE k.source = d.source AND k.external_id = d.external_id)"
+# migrations of the database schema: (version, list of sql statements)
+# statements have to be idempotent, because they are applied to databases created from the current models as well
+SCHEMA_MIGRATIONS = [
+    # the reimported workouts are removed before the unique index is created, references point to the kept ones
+    (1, ["UPDATE workouts SET {column} = (SELECT {kept} FROM workouts d WHERE d.id = workouts.{column}) "
+         "WHERE {column} IN ({reimported})".format(column=column, kept=_KEPT, reimported=_REIMPORTED)
+         for column in ["is_duplicate_with", "manual_check_required_with"]] +
+        ["UPDATE workouts SET is_duplicate_with = NULL WHERE is_duplicate_with = id",
+         "UPDATE workouts SET manual_check_required_with = NULL WHERE manual_check_required_with = id",
+         "DELETE FROM workouts WHERE id IN ({})".format(_REIMPORTED)] +
+        ["CREATE UNIQUE INDEX IF NOT EXISTS ix_workouts_source_external_id ON workouts (source, external_id)",
+         "CREATE INDEX IF NOT EXISTS ix_workouts_start_time ON workouts (start_time)",
+         "CREATE INDEX IF NOT EXISTS ix_workouts_is_duplicate_with ON workouts (is_duplicate_with)",
+         "CREATE INDEX IF NOT EXISTS ix_workouts_sportstype_id ON workouts (sportstype_id)",
+         "CREATE INDEX IF NOT EXISTS ix_sportstypes_name ON sportstypes (name)",
+         "CREATE INDEX IF NOT EXISTS ix_sports_name ON sports (name)",
+        ]),
+    # table sync_states is created from the model
+    (2, []),
+    # table summaries is created from the model and filled from the existing workouts
+    (3, ["DELETE FROM summaries"] +
+        ["INSERT INTO summaries (sport_id, period, period_start, workouts, {columns}) "
+         "SELECT coalesce(sport_id, 0), '{period}', {start}, count(*), {totals} FROM workouts "
+         "WHERE is_duplicate_with IS NULL AND start_time IS NOT NULL "
+         "GROUP BY coalesce(sport_id, 0), {start}".format(
+             columns=", ".join(SUMMARY_COLUMNS), period=period, start=start,
+             totals=", ".join("total({})".format(column) for column in SUMMARY_COLUMNS))
+         for (period, start) in SUMMARY_PERIODS.items()]),
+    # table training_loads is created from the model and filled by lib.training_load
+    (4, []),
+]
+SCHEMA_VERSION = SCHEMA_MIGRATIONS[-1][0]
+
+def _period_start(period, start_time):
+    """
+    returns the first day of the week (monday) or month containing start_time, like SUMMARY_PERIODS
+    """
+    if period == 'week':
+        return (start_time - datetime.timedelta(days=start_time.weekday())).date()
+    return start_time.date().replace(day=1)
+
+
+def _add_contribution(deltas, values, sign):
+    """
+    adds the contribution of a workout, given as values of SUMMARY_KEYS, to the summary deltas
+    workouts marked as duplicate or without start time do not contribute
+    """
+    (sport_id, start_time, is_duplicate_with) = values[:3]
+    if is_duplicate_with is not None or start_time is None:
+        return
+    for period in SUMMARY_PERIODS:
+        delta = deltas[(sport_id or 0, period, _period_start(period, start_time))]
+        delta[0] += sign
+        for (i, value) in enumerate(values[3:]):
+            delta[i + 1] += sign * float(value or 0)
+
+
+# the attributes of a workout the check needs, like the rows of WorkoutsDatabase._unchecked_workouts
+_CheckedWorkout = collections.namedtuple('_CheckedWorkout', ['id', 'start_time', 'duration_sec', 'sport_id',
+                                                             'source', 'name'])
+
+
+def _end_time(workout):
+    """
+    returns the end of a workout, workouts overlap if one starts before or when the other one ends
+    """
+    return workout.start_time + datetime.timedelta(seconds=int(workout.duration_sec or 0))
+
+
+def _workout_key(source, external_id):
+    """
+    returns the identifying key of a workout
+    external ids are compared as text, since imported files deliver them as strings while the database returns numbers
+    """
+    if external_id is None:
+        return (source, None)
+    return (source, str(external_id))
+
+
 class Sport(Base):
     """
     Class manages Sport model
@@ -22,7 +119,7 @@ class Sport(Base):
     """
     __tablename__ = 'sports'
     id = Column(Integer, primary_key=True)
-    name = Column(String)
+    name = Column(String, index=True)
     sportstypes = relationship('SportsType')
     workouts = relationship('Workout')
 
@@ -34,11 +131,10 @@ class Sport(Base):
             logger.error("no database session")
             return False
 
-        id = database.session.query(Sport.id).filter(
-            Sport.name == self.name).first()
+        id = database.find_sport(self.name)
         if id:
             # this sport already exists
-            self.id = id[0]
+            self.id = id
             return False
         else:
             # create a new one and flush it immediately in order to update the id
@@ -48,6 +144,7 @@ class Sport(Base):
             except exc.SQLAlchemyError as e:
                 logger.error("Database error: {}".format(e.args))
                 return False
+            database.remember_sport(self)
             logger.info("Added new sport '{}' id {}".format(self.name, self.id))
             return True
 
@@ -67,7 +164,7 @@ class SportsType(Base):
     """
     __tablename__ = 'sportstypes'
     id = Column(Integer, primary_key=True)
-    name = Column(String)
+    name = Column(String, index=True)
     sport_id = Column(Integer, ForeignKey('sports.id'))
     workouts = relationship("Workout")
 
@@ -162,19 +259,20 @@ class SportsType(Base):
             return False
 
         self.cleanup_sportstype(workout)
-        self.associate_sport(database)
-        id = database.session.query(SportsType.id).filter(
-            SportsType.name == self.name).first()
-        if id:
-            self.id = id[0]
+        ids = database.find_sportstype(self.name)
+        if ids:
+            # this sportstype already exists, its sport has been associated when it was added
+            (self.id, self.sport_id) = ids
             return False
         else:
+            self.associate_sport(database)
             try:
                 database.session.add(self)
                 database.session.flush()
             except exc.SQLAlchemyError as e:
                 logger.error("Database error: {}".format(e.args))
                 return False
+            database.remember_sportstype(self)
             logger.info("Adding new sportstype '{}' id {} of sport {}".format(
                 self.name, self.id, self.sport_id))
             return True
@@ -183,6 +281,10 @@ class SportsType(Base):
         return "({}) {} of sport {}".format(self.id, self.name, self.sport_id)
 
 
+# converters of imported values to the types of the columns, values of other columns are kept as they are
+COLUMN_CONVERTERS = {Integer: to_int, Float: float, DateTime: to_datetime, Boolean: to_bool}
+
+
 class Workout(Base):
     """
     Class manages Workout model
@@ -192,8 +294,15 @@ class Workout(Base):
     - 'as_dict' returns a dictionary representation of a workout instance
     - 'as_list' returns a list representation of a workout instance
     - 'header' returns a list of all attributes
+    - 'export_query' returns a query of all workouts as tuples of the attributes in header
     """
     __tablename__ = 'workouts'
+    __table_args__ = (
+        Index('ix_workouts_source_external_id', 'source', 'external_id', unique=True),
+        Index('ix_workouts_start_time', 'start_time'),
+        Index('ix_workouts_is_duplicate_with', 'is_duplicate_with'),
+        Index('ix_workouts_sportstype_id', 'sportstype_id'),
+    )
 
     # identification
     id = Column(Integer, primary_key=True)
@@ -364,6 +473,49 @@ class Workout(Base):
         keys.remove("sport_id")
         return keys
 
+    @classmethod
+    def decoder(cls, keys, constants=None):
+        """
+        returns a function decoding a list of records with the given keys, e.g. the fields of a csv header,
+        into WorkoutRecords (see record_mapping.compile_decoder)
+        keys may be names or, for records read as lists, (index, name) pairs
+        - values are converted to the type of their column, empty values become None
+        - 'id' becomes external_id, the name of the 'sportstype' is kept to be resolved by the importer
+        - keys which are no workout attributes are skipped
+        """
+        columns = cls.__table__.columns
+        fields = []
+        for key in keys:
+            (source, name) = key if isinstance(key, tuple) else (key, key)
+            if name == "sportstype":
+                fields.append(FieldMapping(source, name))
+            elif name == "id":
+                fields.append(FieldMapping(source, "external_id", COLUMN_CONVERTERS[Integer]))
+            elif name in columns:
+                fields.append(FieldMapping(source, name, COLUMN_CONVERTERS.get(type(columns[name].type))))
+        return compile_decoder(fields, constants, WorkoutRecord)
+
+    @classmethod
+    def export_query(cls, db):
+        """
+        returns a query of all workouts as plain tuples of the attributes in header(),
+        the name of the sportstype is joined in the same query
+        """
+        columns = []
+        for column in cls.__table__.columns:
+            key = column.name
+            if key in ["external_id", "sport_id", "is_duplicate_with", "manual_check_required_with"]:
+                continue
+            elif key == "id":
+                columns.append(cls.external_id)
+            elif key == "sportstype_id":
+                columns.append(SportsType.name)
+            else:
+                columns.append(getattr(cls, key))
+        return db.session.query(*columns)\
+            .outerjoin(SportsType, cls.sportstype_id == SportsType.id)\
+            .order_by(cls.id)
+
     def _merge_attributes(self, workout):
         """
         Merging attributes from workout to self, 
@@ -382,6 +534,29 @@ class Workout(Base):
                 setattr(self, key, getattr(workout, key))
 
 
+    @staticmethod
+    def _find_leading_workout(duplicates):
+        """
+        Returns the duplicate that leads the merged workout, None if no rule applies
+        Duplicates need attributes 'source' and 'name', so plain query rows can be used as well
+        """
+        # Step 1: if one of the duplicates is a previously merged one, use it as the leading workout
+        for duplicate in duplicates:
+            if duplicate.source and duplicate.source == "MERGED WORKOUT":
+                logger.debug("Found leading workout in step 1: {}".format(duplicate))
+                return duplicate
+        # Step 2: else if one of the duplicates is from Zwift, prefer it as the leading workout
+        for duplicate in duplicates:
+            if duplicate.name and "Zwift" in duplicate.name:
+                logger.debug("Found leading workout in step 2: {}".format(duplicate))
+                return duplicate
+        # Step 3: else if one of the duplicates is a Garmin import, prefer it as the leading workout
+        for duplicate in duplicates:
+            if duplicate.source and "Garmin" in duplicate.source:
+                logger.debug("Found leading workout in step 3: {}".format(duplicate))
+                return duplicate
+        return None
+
     def handle_duplicates(self, database):
         """
         If a workout seems to be known in the database, for example because already imported from another source,
@@ -412,23 +587,13 @@ class Workout(Base):
         # 2nd potential duplicate in db     |------------------------|
         # 3rd potential duplicate in db             |----------------|
         # 4th potential duplicate in db             |---------|
-        # (Remark to line 2 of 1st filter: needed to use database functions, 
-        # because modifiers like timedelta do not work with sqlalchemy sql attributes)
-        # TODO handle timezones (needed for sqlite strftime)
-        duplicates = database.session.query(Workout)\
-            .filter(or_(and_(Workout.start_time < self.start_time,
-                             func.strftime('%s', Workout.start_time, 'utc') + Workout.duration_sec >= self.start_time.timestamp()),
-                        and_(Workout.start_time >= self.start_time,
-                             Workout.start_time < (self.start_time + datetime.timedelta(seconds=int(self.duration_sec))))))\
-            .filter(Workout.is_duplicate_with == None)\
-            .filter(Workout.manual_check_required_with == None)\
-            .all()
+        duplicates = database.find_overlapping(self.start_time, self.duration_sec).all()
 
         if len(duplicates) <= 1: 
             return (number_of_duplicates, number_of_merged)
 
         # find overlapping workouts of different sports -> set manual_check_required_with
-        for duplicate in duplicates:
+        for duplicate in list(duplicates):
             if duplicate.sport_id != self.sport_id:
                 self.manual_check_required_with = duplicate.id
                 logger.debug("dup check - workout marked to be checked: {}".format(duplicate))
@@ -437,27 +602,7 @@ class Workout(Base):
             return (number_of_duplicates, number_of_merged)
 
         # find overlapping workouts of same sports (they are duplicate workouts) -> now find the leading workout
-        leading_workout = None
-        # Step 1: if one of the duplicates is a previously merged one, use it as the leading workout
-        for duplicate in duplicates:
-            if duplicate.source and duplicate.source == "MERGED WORKOUT":
-                leading_workout = duplicate
-                logger.debug("Found leading workout in step 1: {}".format(leading_workout))
-                break
-        # Step 2: else if one of the duplicates is from Zwift, prefer it as the leading workout
-        if not leading_workout:
-            for duplicate in duplicates:
-                if duplicate.name and "Zwift" in duplicate.name:
-                    leading_workout = duplicate
-                    logger.debug("Found leading workout in step 2: {}".format(leading_workout))
-                    break
-        # Step 3: else if one of the duplicates is a Garmin import, prefer it as the leading workout
-        if not leading_workout:
-            for duplicate in duplicates:
-                if duplicate.source and "Garmin" in duplicate.source:
-                    leading_workout = duplicate
-                    logger.debug("Found leading workout in step 3: {}".format(leading_workout))
-                    break
+        leading_workout = Workout._find_leading_workout(duplicates)
         # Step 4: else use this workout as the leading workout
         if not leading_workout:
             leading_workout = self
@@ -514,12 +659,120 @@ class Workout(Base):
             return True
 
 
+class WorkoutRecord:
+    """
+    Lightweight workout as decoded by the importers, one slot per column of Workout and no ORM instrumentation
+    - 'sportstype' keeps the imported name of the sportstype until the importer resolves it
+    - 'parameters' returns the columns as parameters of an insert statement
+    WorkoutsDatabase.add_workouts inserts records without creating Workout objects,
+    only workouts overlapping others are loaded as Workout to merge them
+    """
+    COLUMNS = tuple(Workout.__table__.columns.keys())
+    __slots__ = COLUMNS + ('sportstype',)
+    __init__ = compile_initializer(__slots__)
+    _INSERTED = tuple(key for key in COLUMNS if key != "id")
+    _values = operator.attrgetter(*_INSERTED)
+
+    def parameters(self):
+        """
+        returns the columns except id as dict
+        """
+        return dict(zip(self._INSERTED, self._values(self)))
+
+    def __repr__(self):
+        return "({}) {} | {} | {} | {} | duplicate:{} | 2bchecked:{}"\
+            .format(self.id, self.source, self.name, self.start_time, self.sport_id, self.is_duplicate_with, self.manual_check_required_with)
+
+
+class SchemaVersion(Base):
+    """
+    Class manages SchemaVersion model
+    SchemaVersion records each migration that has been applied to the database schema
+    """
+    __tablename__ = 'schema_version'
+    version = Column(Integer, primary_key=True)
+    applied = Column(DateTime)
+
+    def __repr__(self):
+        return "({}) applied {}".format(self.version, self.applied)
+
+
+class SyncState(Base):
+    """
+    Class manages SyncState model
+    SyncState stores per source and account the newest workout seen by the last import (high-water mark),
+    so that the next import can stop at workouts that have been imported already
+    """
+    __tablename__ = 'sync_states'
+    __table_args__ = (
+        Index('ix_sync_states_source_account', 'source', 'account', unique=True),
+    )
+    id = Column(Integer, primary_key=True)
+    source = Column(String(32))
+    account = Column(String)
+    newest_start_time = Column(DateTime)
+    newest_external_id = Column(Integer)
+
+    def __repr__(self):
+        return "({}) {} | {} | {} | {}".format(
+            self.id, self.source, self.account, self.newest_start_time, self.newest_external_id)
+
+
+class Summary(Base):
+    """
+    Class manages Summary model
+    Summary holds the number of workouts and the totals of SUMMARY_COLUMNS per sport and week or month,
+    workouts marked as duplicate are not counted
+    the summaries are kept up to date whenever workouts are flushed (see WorkoutsDatabase._update_summaries())
+    """
+    __tablename__ = 'summaries'
+    __table_args__ = (
+        Index('ix_summaries_sport_id_period', 'sport_id', 'period', 'period_start', unique=True),
+    )
+    id = Column(Integer, primary_key=True)
+    sport_id = Column(Integer)      # 0 for workouts without sport
+    period = Column(String(8))
+    period_start = Column(Date)
+    workouts = Column(Integer)
+    distance_m = Column(Float)
+    duration_sec = Column(Float)
+    calories = Column(Float)
+    training_stress_score = Column(Float)
+
+    def __repr__(self):
+        return "({}) {} {} | {} | {} workouts".format(
+            self.id, self.period, self.period_start, self.sport_id, self.workouts)
+
+
+class TrainingLoad(Base):
+    """
+    Class manages TrainingLoad model
+    TrainingLoad caches the training stress score of a day and the fitness (CTL), fatigue (ATL)
+    and form (TSB) computed from it by lib.training_load
+    """
+    __tablename__ = 'training_loads'
+    day = Column(Date, primary_key=True)
+    training_stress_score = Column(Float)
+    ctl = Column(Float)
+    atl = Column(Float)
+    tsb = Column(Float)
+
+    def __repr__(self):
+        return "({}) TSS {} | CTL {} | ATL {} | TSB {}".format(
+            self.day, self.training_stress_score, self.ctl, self.atl, self.tsb)
+
+
 class WorkoutsDatabase:
     """
     Class handles SQLite DB session and manages functions that comprise the whole database rather than distinct records
     - create database
+    - migrate database schema
     - create session
     - close session
+    - cache the ids of sports and sportstypes
+    - store the newest workout imported per source and account
+    - add workouts in batches
+    - keep summaries per sport and week or month
     - show all records of the database
     - cleanup database
     """
@@ -527,28 +780,427 @@ class WorkoutsDatabase:
     def __init__(self, database):
         self.session = False
         self.database = database
+        self.unchecked_ids = set()
+        # number of workouts add_workouts failed to insert, importers keep their sync state if it grows
+        self.failed_workouts = 0
+        # longest duration of all workouts in seconds, bounds the search for overlapping workouts
+        self.longest_duration = None
+        # caches of the session: sport name -> id, sportstype name -> (id, sport_id),
+        # imported sportstype name -> (id, sport_id)
+        self.sport_ids = None
+        self.sportstype_ids = None
+        self.resolved_sportstypes = {}
     
     def create_session(self):
         engine = create_engine('sqlite:///{}'.format(self.database), echo=False)
         logger.info("connecting to {}".format(self.database))
         Session = sessionmaker(bind=engine)
         try:
-            Base.metadata.create_all(engine)
+            version = self._schema_version(engine)
+            if version != SCHEMA_VERSION:
+                Base.metadata.create_all(engine)
+                self._migrate(engine, version)
         except exc.DatabaseError as e:
             logger.error("Database error: {}".format(e.args))
             return False
         else:
             self.session = Session()
+            event.listen(self.session, 'before_flush', self._update_summaries)
         return True
 
+    def _schema_version(self, engine):
+        """
+        returns the schema version of the database, 0 if the database is not versioned yet
+        """
+        with engine.connect() as connection:
+            if not connection.execute(text(
+                    "SELECT name FROM sqlite_master WHERE type = 'table' AND name = 'schema_version'")).first():
+                return 0
+            return connection.execute(text("SELECT max(version) FROM schema_version")).scalar() or 0
+
+    def _migrate(self, engine, version):
+        """
+        applies all schema migrations newer than version
+        """
+        with engine.begin() as connection:
+            for (migration_version, statements) in SCHEMA_MIGRATIONS:
+                if migration_version <= version:
+                    continue
+                logger.info("migrating database to schema version {}".format(migration_version))
+                for statement in statements:
+                    connection.execute(text(statement))
+                connection.execute(SchemaVersion.__table__.insert().values(
+                    version=migration_version, applied=datetime.datetime.now()))
+
     def close_session(self):
         if self.session:
             try:
-                self.session.commit()
+                with profiler.stage("commit"):
+                    self.session.commit()
                 self.session.close()
             except exc.SQLAlchemyError as e:
                 logger.error("Database error: {}".format(e.args))
         self.session = False
+        self.longest_duration = None
+        self.sport_ids = None
+        self.sportstype_ids = None
+        self.resolved_sportstypes = {}
+
+    def _load_identities(self):
+        """
+        loads the ids of all sports and sportstypes once per session
+        """
+        self.sport_ids = {}
+        for (name, id) in self.session.query(Sport.name, Sport.id).order_by(Sport.id):
+            self.sport_ids.setdefault(name, id)
+        self.sportstype_ids = {}
+        for (name, id, sport_id) in self.session.query(SportsType.name, SportsType.id, SportsType.sport_id)\
+                .order_by(SportsType.id):
+            self.sportstype_ids.setdefault(name, (id, sport_id))
+
+    def find_sport(self, name):
+        """
+        returns the id of the sport with the given name, None if unknown
+        """
+        if self.sport_ids is None:
+            self._load_identities()
+        return self.sport_ids.get(name)
+
+    def find_sportstype(self, name):
+        """
+        returns (id, sport_id) of the sportstype with the given name, None if unknown
+        """
+        if self.sportstype_ids is None:
+            self._load_identities()
+        return self.sportstype_ids.get(name)
+
+    def resolve_sportstype(self, name, workout_name=None):
+        """
+        returns (sportstype_id, sport_id) of the sportstype imported as name, adding the sportstype if unknown
+        the name of the workout is needed to resolve sportstype 'other'
+        """
+        if not name:
+            return (None, None)
+        key = (name, workout_name if name.lower() == 'other' else None)
+        ids = self.resolved_sportstypes.get(key)
+        if not ids:
+            sportstype = SportsType(name=name)
+            sportstype.add(Workout(name=workout_name), self)
+            ids = (sportstype.id, sportstype.sport_id)
+            self.resolved_sportstypes[key] = ids
+        return ids
+
+    def remember_sport(self, sport):
+        """
+        adds a flushed sport to the cache
+        """
+        if self.sport_ids is not None:
+            self.sport_ids[sport.name] = sport.id
+
+    def remember_sportstype(self, sportstype):
+        """
+        adds a flushed sportstype to the cache
+        """
+        if self.sportstype_ids is not None:
+            self.sportstype_ids[sportstype.name] = (sportstype.id, sportstype.sport_id)
+
+    def _update_summaries(self, session, flush_context, instances):
+        """
+        keeps the summaries up to date with the workouts about to be flushed (before_flush event):
+        new workouts are added, the contributions of changed and deleted workouts are read from the database
+        before they are overwritten and replaced by their new ones
+        cached training loads are removed from the day of the earliest changed workout on
+        """
+        added = [workout for workout in session.new if isinstance(workout, Workout)]
+        changed = [workout for workout in session.dirty if isinstance(workout, Workout) and
+                   any(inspect(workout).attrs[key].history.has_changes() for key in SUMMARY_KEYS)]
+        deleted = [workout for workout in session.deleted if isinstance(workout, Workout)]
+        if not (added or changed or deleted):
+            return
+        deltas = collections.defaultdict(lambda: [0] * (len(SUMMARY_COLUMNS) + 1))
+        start_times = []
+        for workout in added + changed:
+            _add_contribution(deltas, [getattr(workout, key) for key in SUMMARY_KEYS], 1)
+            start_times.append(workout.start_time)
+        self._extend_longest_duration(workout.duration_sec for workout in added + changed)
+        ids = [workout.id for workout in changed + deleted if workout.id is not None]
+        table = Workout.__table__
+        for i in range(0, len(ids), 500):
+            rows = session.connection().execute(select(*[table.columns[key] for key in SUMMARY_KEYS])
+                                                .where(table.columns.id.in_(ids[i:i + 500])))
+            for row in rows:
+                _add_contribution(deltas, row, -1)
+                start_times.append(row.start_time)
+        self._apply_summary_changes(deltas, start_times, session.connection())
+
+    def _summarize_records(self, records):
+        """
+        adds records inserted without the ORM, which bypass the before_flush event, to the summaries
+        """
+        deltas = collections.defaultdict(lambda: [0] * (len(SUMMARY_COLUMNS) + 1))
+        for record in records:
+            _add_contribution(deltas, [getattr(record, key) for key in SUMMARY_KEYS], 1)
+        self._extend_longest_duration(record.duration_sec for record in records)
+        self._apply_summary_changes(deltas, [record.start_time for record in records])
+
+    def _apply_summary_changes(self, deltas, start_times, connection=None):
+        """
+        adds the deltas to the summaries and removes the cached training loads from the earliest start time on
+        """
+        self.add_summary_deltas(deltas, connection)
+        start_times = [start_time for start_time in start_times if start_time is not None]
+        if start_times:
+            self.invalidate_training_loads(min(start_times).date(), connection)
+
+    def invalidate_training_loads(self, day, connection=None):
+        """
+        removes the cached training loads from day on, they are recomputed by lib.training_load
+        """
+        (connection or self.session.connection()).execute(
+            TrainingLoad.__table__.delete().where(TrainingLoad.__table__.columns.day >= day))
+
+    def add_summary_deltas(self, deltas, connection=None):
+        """
+        adds deltas {(sport_id, period, period_start): [workouts, totals of SUMMARY_COLUMNS]} to the summaries
+        """
+        deltas = [(key, values) for (key, values) in deltas.items() if any(values)]
+        if not deltas:
+            return
+        table = Summary.__table__
+        statement = sqlite_insert(table)
+        statement = statement.on_conflict_do_update(
+            index_elements=['sport_id', 'period', 'period_start'],
+            set_={column: table.columns[column] + statement.excluded[column]
+                  for column in ['workouts'] + SUMMARY_COLUMNS})
+        (connection or self.session.connection()).execute(statement, [
+            dict(zip(['sport_id', 'period', 'period_start', 'workouts'] + SUMMARY_COLUMNS, key + tuple(values)))
+            for (key, values) in deltas])
+
+    def summaries(self, period='month', sport=None):
+        """
+        returns the summaries of a period (week or month) ordered by period and sport,
+        as tuples (period_start, sport name, number of workouts, totals of SUMMARY_COLUMNS)
+        """
+        query = self.session.query(Summary.period_start, Sport.name, Summary.workouts,
+                                   *[getattr(Summary, column) for column in SUMMARY_COLUMNS])\
+            .outerjoin(Sport, Sport.id == Summary.sport_id)\
+            .filter(Summary.period == period)\
+            .filter(Summary.workouts > 0)
+        if sport:
+            query = query.filter(Sport.name == sport)
+        return [tuple(row) for row in query.order_by(Summary.period_start, Sport.name)]
+
+    def report(self, period='month', sport=None):
+        print("{:<12}{:<20}{:>9}{:>12}{:>10}{:>10}{:>8}".format(
+            period.upper(), "SPORT", "WORKOUTS", "DISTANCE", "DURATION", "CALORIES", "TSS"))
+        for (start, name, workouts, distance, duration, calories, stress_score) in self.summaries(period, sport):
+            print("{:<12}{:<20}{:>9}{:>10.1f}km{:>9.1f}h{:>10.0f}{:>8.0f}".format(
+                str(start), name or "-", workouts, distance / 1000, duration / 3600, calories, stress_score))
+
+    def get_watermark(self, source, account):
+        """
+        returns (start_time, external_id) of the newest workout imported from source and account, None if unknown
+        """
+        state = self.session.query(SyncState)\
+            .filter(SyncState.source == source)\
+            .filter(SyncState.account == account)\
+            .first()
+        if not state:
+            return None
+        return (state.newest_start_time, state.newest_external_id)
+
+    def set_watermark(self, source, account, start_time, external_id):
+        """
+        stores the newest workout imported from source and account
+        """
+        state = self.session.query(SyncState)\
+            .filter(SyncState.source == source)\
+            .filter(SyncState.account == account)\
+            .first()
+        if not state:
+            state = SyncState(source=source, account=account)
+            self.session.add(state)
+        state.newest_start_time = start_time
+        state.newest_external_id = external_id
+        logger.info("newest workout of {} account {}: {} started {}".format(source, account, external_id, start_time))
+
+    def _extend_longest_duration(self, durations):
+        if self.longest_duration is not None:
+            self.longest_duration = max([self.longest_duration] + [int(duration) for duration in durations if duration])
+
+    def _longest_duration(self):
+        if self.longest_duration is None:
+            self.longest_duration = int(self.session.query(func.max(Workout.duration_sec)).scalar() or 0)
+        return self.longest_duration
+
+    def _earliest_overlapping(self, start_time):
+        """
+        returns the earliest start time of a workout that can overlap a workout starting at start_time
+        """
+        # a day more for shifts of daylight saving time, sqlite compares local times
+        return start_time - datetime.timedelta(seconds=self._longest_duration(), days=1)
+
+    def find_overlapping(self, start_time, duration_sec):
+        """
+        returns a query of the workouts overlapping the time from start_time for duration_sec,
+        which are neither marked as duplicate nor to be checked manually,
+        workouts added in the current batch but not checked yet are skipped
+        only workouts starting at most the longest duration of all workouts earlier can overlap,
+        this bounds the search on the index of start_time
+        (both marks are tested in one expression, else sqlite prefers the index of is_duplicate_with,
+        which matches most workouts)
+        """
+        end_time = start_time + datetime.timedelta(seconds=int(duration_sec))
+        # (Remark to the end of earlier workouts: needed to use database functions,
+        # because modifiers like timedelta do not work with sqlalchemy sql attributes)
+        # TODO handle timezones (needed for sqlite strftime)
+        query = self.session.query(Workout)\
+            .filter(Workout.start_time >= self._earliest_overlapping(start_time))\
+            .filter(Workout.start_time <= end_time)\
+            .filter(or_(Workout.start_time >= start_time,
+                        func.strftime('%s', Workout.start_time, 'utc') + Workout.duration_sec >= start_time.timestamp()))\
+            .filter(func.coalesce(Workout.is_duplicate_with, Workout.manual_check_required_with) == None)
+        if self.unchecked_ids:
+            # workouts added in the same batch, but after this one, are not known yet
+            query = query.filter(Workout.id.notin_(self.unchecked_ids))
+        return query
+
+    def _overlapping_records(self, records):
+        """
+        returns the ids of the inserted records overlapping any other workout, with one query for all records
+        marks are not considered, handle_duplicates decides on the returned records
+        records are checked in their order, records inserted after one are not known yet when it is checked
+        """
+        records = [record for record in records if record.start_time and record.duration_sec]
+        if not records:
+            return set()
+        end_times = [record.start_time + datetime.timedelta(seconds=int(record.duration_sec)) for record in records]
+        rows = self.session.query(Workout.id, Workout.start_time, Workout.duration_sec)\
+            .filter(Workout.start_time >= self._earliest_overlapping(min(record.start_time for record in records)))\
+            .filter(Workout.start_time <= max(end_times))\
+            .order_by(Workout.start_time)\
+            .all()
+        start_times = [row.start_time for row in rows]
+        ids = set(record.id for record in records)
+        overlapping = set()
+        for (record, end_time) in zip(records, end_times):
+            first = bisect.bisect_left(start_times, self._earliest_overlapping(record.start_time))
+            last = bisect.bisect_right(start_times, end_time)
+            timestamp = record.start_time.timestamp()
+            for (id, start_time, duration_sec) in rows[first:last]:
+                if id >= record.id and id in ids:
+                    continue
+                if start_time >= record.start_time or \
+                        (duration_sec and start_time.timestamp() + duration_sec >= timestamp):
+                    overlapping.add(record.id)
+                    break
+        return overlapping
+
+    def add_workouts(self, workouts, batch_size=500):
+        """
+        Adds many workouts, given as WorkoutRecords, Workout objects or dicts of workout columns, to the database
+        Workouts are processed in chunks of batch_size: existing workouts of a chunk are identified with one query,
+        new workouts are inserted with one statement, afterwards duplicates are handled like in Workout.add()
+        Workouts of a chunk that cannot be inserted are logged and counted in failed_workouts
+        Returns (number of workouts, number of added workouts)
+        """
+        number_of_workouts = 0
+        number_of_added_workouts = 0
+        if not self.session:
+            logger.error("no database session")
+            return (number_of_workouts, number_of_added_workouts)
+
+        chunk = []
+        for workout in workouts:
+            number_of_workouts += 1
+            chunk.append(workout)
+            if len(chunk) >= batch_size:
+                number_of_added_workouts += self._add_workouts_chunk(chunk)
+                chunk = []
+        if chunk:
+            number_of_added_workouts += self._add_workouts_chunk(chunk)
+        return (number_of_workouts, number_of_added_workouts)
+
+    def _add_workouts_chunk(self, workouts):
+        """
+        inserts the unknown workouts of a chunk and returns their number
+        """
+        with profiler.stage("insert"):
+            new_workouts = self._insert_unknown_workouts(workouts)
+        if not new_workouts:
+            return 0
+        # check duplicates in the order of the workouts, as if they had been added one by one
+        with profiler.stage("dedupe"):
+            # a Workout object is only needed for records overlapping other workouts
+            overlapping = self._overlapping_records(
+                [workout for workout in new_workouts if isinstance(workout, WorkoutRecord)])
+            self.unchecked_ids = set(workout.id for workout in new_workouts)
+            for workout in new_workouts:
+                logger.info("Added new workout {}".format(workout))
+                self.unchecked_ids.discard(workout.id)
+                if isinstance(workout, WorkoutRecord):
+                    if workout.id not in overlapping:
+                        continue
+                    workout = self.session.get(Workout, workout.id)
+                workout.handle_duplicates(self)
+        return len(new_workouts)
+
+    def _insert_unknown_workouts(self, workouts):
+        """
+        inserts the workouts of a chunk which are not in the database yet and returns them
+        """
+        # workouts are given as WorkoutRecords, Workout objects or dicts of workout columns
+        workouts = [WorkoutRecord(**workout) if isinstance(workout, dict) else workout for workout in workouts]
+        keys = [_workout_key(workout.source, workout.external_id) for workout in workouts]
+
+        # one query per chunk for all (source, external_id) pairs, grouped by source
+        external_ids = {}
+        for (source, external_id) in keys:
+            external_ids.setdefault(source, set()).add(external_id)
+        conditions = []
+        for source, ids in external_ids.items():
+            id_conditions = [Workout.external_id.in_([id for id in ids if id is not None])]
+            if None in ids:
+                id_conditions.append(Workout.external_id == None)
+            conditions.append(and_(Workout.source == source, or_(*id_conditions)))
+        known = set()
+        for source, external_id in self.session.query(Workout.source, Workout.external_id).filter(or_(*conditions)):
+            known.add(_workout_key(source, external_id))
+
+        new_workouts = []
+        for (key, workout) in zip(keys, workouts):
+            if key in known:
+                # don't add if this workout has already been added
+                continue
+            known.add(key)
+            new_workouts.append(workout)
+        if not new_workouts:
+            return []
+
+        objects = [workout for workout in new_workouts if isinstance(workout, Workout)]
+        records = [workout for workout in new_workouts if not isinstance(workout, Workout)]
+        try:
+            if objects:
+                self.session.add_all(objects)
+                self.session.flush()
+            if records:
+                self._insert_records(records)
+        except exc.SQLAlchemyError as e:
+            logger.error("Database error: {}".format(e.args))
+            self.failed_workouts += len(new_workouts)
+            return []
+        return new_workouts
+
+    def _insert_records(self, records):
+        """
+        inserts WorkoutRecords with one executemany statement and sets their ids
+        """
+        table = Workout.__table__
+        result = self.session.execute(table.insert().returning(table.columns.id, sort_by_parameter_order=True),
+                                      [record.parameters() for record in records])
+        for (record, (id,)) in zip(records, result):
+            record.id = id
+        self._summarize_records(records)
 
     def showall(self):
         if not self.session:
@@ -569,30 +1221,178 @@ class WorkoutsDatabase:
         for sport in sports:
             print(sport)
 
-    def check(self):
+    def check(self, chunk_size=10000):
         """ 
         Database cleanup
-        Check whole database for duplicate workouts and clean up using Workout.handle_duplicates()
+        Check whole database for duplicate workouts in a single sweep over all workouts ordered by start time
+        each unmarked workout is checked against the unmarked workouts overlapping it, like in Workout.handle_duplicates()
+        - a workout overlapping a workout of another sport is marked to be checked manually
+        - the workout and the overlapping workouts of the same sport are merged
+        Workouts are read in chunks of chunk_size, after each chunk the changes are committed and the workouts loaded
+        by the check are removed from the session, only the workouts not checked yet are kept,
+        so memory does not grow with the size of the database
+        Returns (number of checked workouts, number of duplicate workouts, number of merged workouts)
         """
         if not self.session:
             print("no database")
+            return (0, 0, 0)
 
-        number_of_checked_workouts = 0
+        number_of_checked_workouts = self.session.query(Workout.id).count()
+        number_of_duplicate_workouts = self.session.query(Workout.id).filter(Workout.is_duplicate_with != None).count()
         number_of_merged_workouts = 0
-        number_of_duplicate_workouts = 0
-        workouts = self.session.query(Workout).all()
-        for workout in workouts:
-            number_of_checked_workouts += 1
-            if workout.is_duplicate_with:
-                number_of_duplicate_workouts += 1
-            else:
-                (a, b) = workout.handle_duplicates(self)
-                number_of_duplicate_workouts += a
-                number_of_merged_workouts += b
+        kept = set(self.session.identity_map.keys())
+        workouts = self._unchecked_workouts(chunk_size, kept)
+        # unmarked workouts read, but not checked yet, ordered by start time,
+        # merged workouts created by the check, which workouts checked later can overlap,
+        # and the workouts marked while checking a workout
+        pending = []
+        merged = []
+        marked = {}
+        while True:
+            if not pending:
+                workout = next(workouts, None)
+                if workout is None:
+                    break
+                pending.append(workout)
+            workout = pending[0]
+            # later workouts start after this one, merged workouts ending before cannot overlap them
+            merged[:] = [other for other in merged if _end_time(other) >= workout.start_time]
+            number_of_merged_workouts += self._check_workout(workout, workouts, pending, merged, marked)
+            number_of_duplicate_workouts += sum(1 for other in marked.values() if other.is_duplicate_with)
+            pending[:] = [other for other in pending[1:] if other.id not in marked]
+            merged[:] = [other for other in merged if other.id not in marked]
+            marked.clear()
+        self._release_checked(kept)
         logger.info('{} workouts checked, {} of them were duplicate, created {} merged workouts'\
             .format(number_of_checked_workouts,
                     number_of_duplicate_workouts,
                     number_of_merged_workouts,))
+        return (number_of_checked_workouts, number_of_duplicate_workouts, number_of_merged_workouts)
+
+    def _unchecked_workouts(self, chunk_size, kept):
+        """
+        yields the workouts neither marked as duplicate nor to be checked manually ordered by start time and id,
+        as rows of the attributes needed to find duplicates, reading them in chunks (keyset pagination)
+        before a chunk is read, the changes made so far are released (see _release_checked)
+        """
+        query = self.session.query(Workout.id,
+                                   Workout.start_time,
+                                   Workout.duration_sec,
+                                   Workout.sport_id,
+                                   Workout.source,
+                                   Workout.name)\
+            .filter(Workout.start_time != None)\
+            .filter(func.coalesce(Workout.is_duplicate_with, Workout.manual_check_required_with) == None)\
+            .order_by(Workout.start_time, Workout.id)
+        last = None
+        while True:
+            chunk = query
+            if last:
+                # merged workouts start like their leading workout, before the workout which completed
+                # the workouts overlapping it, so they are not read again
+                chunk = chunk.filter(tuple_(Workout.start_time, Workout.id) > tuple_(last.start_time, last.id))
+            workouts = chunk.limit(chunk_size).all()
+            yield from workouts
+            if len(workouts) < chunk_size:
+                return
+            self._release_checked(kept)
+            last = workouts[-1]
+
+    def _release_checked(self, kept):
+        """
+        commits the changes of the check and expunges the workouts it loaded or merged,
+        the objects with the identity keys kept, loaded before the check, stay in the session
+        """
+        self.session.commit()
+        for (key, workout) in list(self.session.identity_map.items()):
+            if key not in kept:
+                self.session.expunge(workout)
+
+    @staticmethod
+    def _read_until(workouts, pending, end_time):
+        """
+        reads the workouts starting until end_time into pending, and the first one starting later
+        """
+        while not pending or pending[-1].start_time <= end_time:
+            workout = next(workouts, None)
+            if workout is None:
+                return
+            pending.append(workout)
+
+    def _check_workout(self, workout, workouts, pending, merged, marked):
+        """
+        Checks a workout like Workout.handle_duplicates() against the unmarked workouts overlapping it,
+        the pending workouts and the merged workouts created by the check
+        The changed workouts are added to marked
+        Returns the number of merged workouts
+        """
+        # return if this workout does not have a duration, it is found by the checks of other workouts only
+        if not workout.duration_sec:
+            return 0
+        end_time = _end_time(workout)
+        self._read_until(workouts, pending, end_time)
+        overlapping = [other for other in pending + merged
+                       if other.id not in marked
+                       and other.start_time <= end_time and _end_time(other) >= workout.start_time]
+        if len(overlapping) <= 1:
+            return 0
+        overlapping.sort(key=operator.attrgetter('id'))
+        other_sports = [other for other in overlapping if other.sport_id != workout.sport_id]
+        duplicates = [other for other in overlapping if other.sport_id == workout.sport_id]
+        leading_workout = Workout._find_leading_workout(duplicates) if len(duplicates) > 1 else None
+        if len(duplicates) > 1 and not (leading_workout and leading_workout.source == "MERGED WORKOUT"):
+            # a new merged workout is checked as well, it ends like its leading workout: all workouts it can overlap
+            # are read now, since reading releases the workouts loaded by the check (see _unchecked_workouts)
+            self._read_until(workouts, pending, max(_end_time(other) for other in duplicates))
+
+        # only the workouts that are going to be changed are loaded as a whole
+        loaded = {}
+        for loaded_workout in self.session.query(Workout).filter(Workout.id.in_([other.id for other in duplicates])):
+            loaded[loaded_workout.id] = loaded_workout
+
+        # overlapping workouts of different sports -> set manual_check_required_with
+        if other_sports:
+            loaded[workout.id].manual_check_required_with = other_sports[-1].id
+            marked[workout.id] = loaded[workout.id]
+            logger.debug("dup check - workout marked to be checked: {}".format(loaded[workout.id]))
+        if len(duplicates) <= 1:
+            return 0
+
+        # overlapping workouts of same sports (they are duplicate workouts) -> the leading workout found above
+        if not leading_workout:
+            leading_workout = workout
+            logger.debug("Found leading workout in step 4: {}".format(loaded[workout.id]))
+        leading_workout = loaded[leading_workout.id]
+
+        # create a new workout that will be treated as the leading one. Mark the duplicates
+        number_of_merged = 0
+        if leading_workout.source == "MERGED WORKOUT":
+            merged_workout = leading_workout
+        else:
+            merged_workout = Workout(source="MERGED WORKOUT", external_id=datetime.datetime.now().timestamp())
+            number_of_merged += 1
+            merged_workout._merge_attributes(leading_workout)
+            self.session.add(merged_workout)
+            self.session.flush()
+            logger.debug("dup check - merged workout with leading: {}".format(merged_workout))
+            # like Workout.add(), the new merged workout is checked right away
+            merged.append(_CheckedWorkout(merged_workout.id, merged_workout.start_time, merged_workout.duration_sec,
+                                          merged_workout.sport_id, merged_workout.source, merged_workout.name))
+            number_of_merged += self._check_workout(merged[-1], workouts, pending, merged, marked)
+            leading_workout.is_duplicate_with = merged_workout.id
+            marked[leading_workout.id] = leading_workout
+
+        for duplicate in duplicates:
+            duplicate = loaded[duplicate.id]
+            if duplicate is leading_workout or duplicate.is_duplicate_with == merged_workout.id:
+                # already merged
+                continue
+            merged_workout._merge_attributes(duplicate)
+            logger.debug("dup check - merged workout duplicate: {}".format(merged_workout))
+            duplicate.is_duplicate_with = merged_workout.id
+            marked[duplicate.id] = duplicate
+            logger.debug("dup check - duplicate workout marked: {}".format(duplicate))
+        return number_of_merged
 
     def create_sample(self):
         workout = Workout(external_id = 1,\
@@ -0,0 +1,241 @@
+# coding=utf-8
+
+from lib.workout import Workout, Sport, SportsType
+from sqlalchemy import Integer, Float, select, cast, func
+import os
+import logging
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+logger = logging.getLogger(__name__)
+
+# columns loaded if no columns are selected
+DEFAULT_COLUMNS = ['duration_sec', 'distance_m', 'calories', 'average_hr', 'training_stress_score']
+# numpy units of the periods of time buckets
+PERIODS = {'day': 'D', 'week': 'D', 'month': 'M', 'year': 'Y'}
+
+
+class WorkoutFrame:
+    """
+    Selected workout columns as contiguous NumPy arrays, for analytics without ORM objects
+    - id: int64, start_time: datetime64[s] with NaT for unknown times
+    - sport, sportstype: categorical int32 codes into the names in sports and sportstypes, -1 if unknown
+    - float columns: float64 with NaN for NULL, integer columns: masked int64 arrays, masked where NULL
+    The frame can be cached as .npz file next to the database (see load())
+    """
+
+    def __init__(self, columns, sports, sportstypes):
+        self.columns = columns
+        self.sports = sports
+        self.sportstypes = sportstypes
+
+    def __len__(self):
+        return len(self.columns['id'])
+
+    def __getitem__(self, name):
+        return self.columns[name]
+
+    def __repr__(self):
+        return "<WorkoutFrame({} workouts, columns={})>".format(len(self), list(self.columns))
+
+    @classmethod
+    def load(cls, db, columns=None, duplicates=False, cache=False):
+        """
+        loads the columns of all workouts of a database, workouts marked as duplicate only if duplicates is set
+        with cache, the frame is read from (or written to) <database>.npz,
+        which is used as long as the database file has not changed since
+        returns None if numpy is not installed
+        """
+        if not numpy:
+            logger.error("numpy is needed to load workouts into a frame")
+            return None
+        columns = list(columns or DEFAULT_COLUMNS)
+        cache_filename = "{}.npz".format(os.path.splitext(db.database)[0]) if cache else None
+        fingerprint = cls._fingerprint(db, columns, duplicates)
+        if cache_filename and os.path.exists(cache_filename):
+            frame = cls.read(cache_filename, fingerprint)
+            if frame is not None:
+                logger.debug("workouts loaded from {}".format(cache_filename))
+                return frame
+
+        table = Workout.__table__
+        selected = [Workout.id,
+                    cast(func.strftime('%s', Workout.start_time), Integer),
+                    Workout.sport_id,
+                    Workout.sportstype_id]
+        # numbers are cast in the database, as older imports may have stored them as text
+        selected += [cast(table.columns[name], Float) for name in columns]
+        query = select(*selected).order_by(Workout.start_time, Workout.id)
+        if not duplicates:
+            query = query.where(Workout.is_duplicate_with.is_(None))
+        rows = db.session.execute(query).all()
+        values = list(zip(*rows)) or [()] * len(selected)
+
+        (sports, sport_codes) = cls._categories(db, Sport, values[2])
+        (sportstypes, sportstype_codes) = cls._categories(db, SportsType, values[3])
+        seconds = numpy.array(values[1], dtype=float)
+        start_times = numpy.nan_to_num(seconds).astype(numpy.int64).astype('datetime64[s]')
+        start_times[numpy.isnan(seconds)] = numpy.datetime64('NaT')
+        frame_columns = {'id': numpy.array(values[0], dtype=numpy.int64),
+                         'start_time': start_times,
+                         'sport': sport_codes,
+                         'sportstype': sportstype_codes}
+        for (name, column_values) in zip(columns, values[4:]):
+            data = numpy.array(column_values, dtype=float)
+            if isinstance(table.columns[name].type, Integer):
+                mask = numpy.isnan(data)
+                data = numpy.ma.MaskedArray(numpy.where(mask, 0, data).astype(numpy.int64), mask=mask)
+            frame_columns[name] = data
+
+        frame = cls(frame_columns, sports, sportstypes)
+        if cache_filename:
+            frame.save(cache_filename, fingerprint)
+        return frame
+
+    @staticmethod
+    def _fingerprint(db, columns, duplicates):
+        """
+        identifies the database file and the loaded columns, to validate a cached frame
+        """
+        try:
+            stat = os.stat(db.database)
+            modified = (stat.st_mtime_ns, stat.st_size)
+        except OSError:
+            modified = (0, 0)
+        return numpy.array([str(modified), ",".join(columns), str(duplicates)])
+
+    @staticmethod
+    def _categories(db, model, ids):
+        """
+        returns the names of all sports or sportstypes and the codes of the given ids into them
+        """
+        categories = db.session.query(model.id, model.name).order_by(model.id).all()
+        names = numpy.array([name or '' for (id, name) in categories], dtype=str)
+        lookup = numpy.full(max([id for (id, name) in categories], default=0) + 1, -1, dtype=numpy.int32)
+        lookup[[id for (id, name) in categories]] = numpy.arange(len(categories), dtype=numpy.int32)
+        ids = numpy.array([-1 if id is None else id for id in ids], dtype=numpy.int64)
+        codes = numpy.where((ids >= 0) & (ids < len(lookup)), lookup[numpy.clip(ids, 0, len(lookup) - 1)], -1)
+        return (names, codes.astype(numpy.int32))
+
+    def save(self, filename, fingerprint=None):
+        """
+        saves the frame as .npz file
+        """
+        arrays = {'sports': self.sports, 'sportstypes': self.sportstypes}
+        if fingerprint is not None:
+            arrays['fingerprint'] = fingerprint
+        for (name, data) in self.columns.items():
+            if numpy.ma.isMaskedArray(data):
+                arrays['mask_' + name] = numpy.ma.getmaskarray(data)
+                data = data.data
+            arrays['column_' + name] = data
+        # written to a temporary file first, so an interrupted save does not leave a broken cache
+        with open(filename + ".tmp", "wb") as file:
+            numpy.savez(file, **arrays)
+        os.replace(filename + ".tmp", filename)
+
+    @classmethod
+    def read(cls, filename, fingerprint=None):
+        """
+        reads a frame saved as .npz file, returns None if it was saved with another fingerprint
+        """
+        with numpy.load(filename, allow_pickle=False) as arrays:
+            if fingerprint is not None:
+                if 'fingerprint' not in arrays or not numpy.array_equal(arrays['fingerprint'], fingerprint):
+                    return None
+            columns = {}
+            for name in arrays.files:
+                if name.startswith('column_'):
+                    data = arrays[name]
+                    mask = 'mask_' + name[len('column_'):]
+                    if mask in arrays.files:
+                        data = numpy.ma.MaskedArray(data, mask=arrays[mask])
+                    columns[name[len('column_'):]] = data
+            return cls(columns, arrays['sports'], arrays['sportstypes'])
+
+    def filter(self, mask=None, sport=None, sportstype=None, start=None, end=None):
+        """
+        returns a frame of the workouts matching all conditions:
+        - mask: boolean array, e.g. frame['distance_m'] > 10000
+        - sport, sportstype: name
+        - start, end: start_time >= start and < end, as datetime or string like '2020-05-04'
+        """
+        selected = numpy.ones(len(self), dtype=bool)
+        if mask is not None:
+            selected &= numpy.ma.filled(mask, False)
+        if sport is not None:
+            selected &= self.columns['sport'] == self._code(self.sports, sport)
+        if sportstype is not None:
+            selected &= self.columns['sportstype'] == self._code(self.sportstypes, sportstype)
+        if start is not None:
+            selected &= self.columns['start_time'] >= numpy.datetime64(start, 's')
+        if end is not None:
+            selected &= self.columns['start_time'] < numpy.datetime64(end, 's')
+        return WorkoutFrame({name: data[selected] for (name, data) in self.columns.items()},
+                            self.sports, self.sportstypes)
+
+    @staticmethod
+    def _code(names, name):
+        codes = numpy.flatnonzero(names == name)
+        return codes[0] if len(codes) else -2
+
+    def group_by_sport(self, column=None, function='sum'):
+        """
+        returns a dict sport name -> aggregate of a column over the workouts of the sport,
+        NULL values are skipped; without column the workouts are counted
+        function is one of count, sum, mean, min, max; workouts without sport are grouped as None
+        """
+        codes = self.columns['sport'] + 1
+        names = [None] + [str(name) for name in self.sports]
+        values = self._aggregate(codes, len(names), column, function)
+        rows = numpy.bincount(codes, minlength=len(names))
+        return {names[i]: values[i].item() for i in numpy.flatnonzero(rows)}
+
+    def time_buckets(self, period='month', column=None, function='sum'):
+        """
+        returns the start of the periods (day, week starting on monday, month or year) containing workouts
+        as datetime64 array
+        and the aggregates of a column over the workouts of each period, as in group_by_sport()
+        workouts without start_time are skipped
+        """
+        start_times = self.columns['start_time']
+        known = ~numpy.isnat(start_times)
+        frame = self.filter(known) if not known.all() else self
+        buckets = frame.columns['start_time'].astype('datetime64[{}]'.format(PERIODS[period]))
+        if period == 'week':
+            # day 0 of datetime64 is a thursday
+            buckets -= (buckets.astype(numpy.int64) + 3) % 7
+        (periods, codes) = numpy.unique(buckets, return_inverse=True)
+        return (periods, frame._aggregate(codes.ravel(), len(periods), column, function))
+
+    def _aggregate(self, codes, size, column, function):
+        """
+        aggregates a column for the groups given by codes 0 .. size - 1, with NaN for groups without values
+        """
+        if column is None:
+            return numpy.bincount(codes, minlength=size).astype(float)
+        data = self.columns[column]
+        if numpy.ma.isMaskedArray(data):
+            valid = ~numpy.ma.getmaskarray(data)
+            data = data.data
+        else:
+            valid = ~numpy.isnan(data)
+        (codes, data) = (codes[valid], data[valid].astype(float))
+        counts = numpy.bincount(codes, minlength=size)
+        if function == 'count':
+            return counts.astype(float)
+        if function in ['sum', 'mean']:
+            sums = numpy.bincount(codes, weights=data, minlength=size)
+            if function == 'sum':
+                return sums
+            with numpy.errstate(invalid='ignore', divide='ignore'):
+                return numpy.where(counts > 0, sums / numpy.maximum(counts, 1), numpy.nan)
+        if function in ['min', 'max']:
+            ufunc = numpy.minimum if function == 'min' else numpy.maximum
+            result = numpy.full(size, numpy.inf if function == 'min' else -numpy.inf)
+            ufunc.at(result, codes, data)
+            return numpy.where(counts > 0, result, numpy.nan)
+        raise ValueError("unknown aggregate function {}".format(function))
@@ -0,0 +1,55 @@
+'''
+Test Cases for exporting workouts in columnar formats (Parquet, Arrow IPC)
+- happy paths
+    - all workouts are exported, column by column
+    - exported records contain the same attributes as Workout.as_list
+'''
+
+import unittest
+import os
+
+import lib
+from lib.arrow_exporter import ArrowExporter, pyarrow
+from lib.workout import WorkoutsDatabase, Workout
+
+
+@unittest.skipIf(pyarrow is None, "pyarrow not installed")
+class TestExportArrow(unittest.TestCase):
+
+    def setUp(self):
+        self.db = WorkoutsDatabase("testdb")
+        self.db.create_session()
+        self.db.create_sample()
+
+    def tearDown(self):
+        self.db.close_session()
+        os.remove("testdb")
+
+    def export(self, filename):
+        exporter = ArrowExporter(filename)
+        self.assertTrue(exporter.create_session())
+        exporter.export_workouts(self.db)
+        exporter.close_session()
+
+    def assertExported(self, table):
+        self.assertEqual(table.column_names, Workout.header())
+        workouts = self.db.session.query(Workout).order_by(Workout.id).all()
+        self.assertEqual([list(row.values()) for row in table.to_pylist()],
+                         [workout.as_list(self.db) for workout in workouts])
+
+    def test_export_parquet(self):
+        self.export("test.parquet")
+        try:
+            self.assertExported(pyarrow.parquet.read_table("test.parquet"))
+            # columns are read one by one
+            self.assertEqual(pyarrow.parquet.read_table("test.parquet", columns=['distance_m']).num_columns, 1)
+        finally:
+            os.remove("test.parquet")
+
+    def test_export_arrow(self):
+        self.export("test.arrow")
+        try:
+            with pyarrow.memory_map("test.arrow") as source:
+                self.assertExported(pyarrow.ipc.open_file(source).read_all())
+        finally:
+            os.remove("test.arrow")
@@ -0,0 +1,41 @@
+'''
+Test Cases for exporting workouts in CSV format
+- happy paths
+    - all workouts are exported with header line
+    - exported records contain the same attributes as Workout.as_list
+'''
+
+import unittest
+import os
+import csv
+
+import lib
+from lib.csv_exporter import CsvExporter
+from lib.workout import WorkoutsDatabase, Workout
+
+
+class TestExportCSV(unittest.TestCase):
+
+    def setUp(self):
+        self.db = WorkoutsDatabase("testdb")
+        self.db.create_session()
+        self.db.create_sample()
+        self.csv = CsvExporter("test.csv")
+        self.csv.create_session()
+
+    def tearDown(self):
+        self.csv.close_session()
+        self.db.close_session()
+        os.remove("testdb")
+        os.remove("test.csv")
+
+    def test_export(self):
+        self.csv.export_workouts(self.db)
+        self.csv.close_session()
+        with open("test.csv", "r", encoding='utf-8', newline='') as file:
+            rows = list(csv.reader(file))
+        self.assertEqual(rows[0], Workout.header())
+        workouts = self.db.session.query(Workout).order_by(Workout.id).all()
+        self.assertEqual(len(rows), len(workouts) + 1)
+        for (row, workout) in zip(rows[1:], workouts):
+            self.assertEqual(row, ['' if value is None else str(value) for value in workout.as_list(self.db)])
@@ -0,0 +1,47 @@
+'''
+Test Cases for exporting workouts in JSON format
+- happy paths
+    - all workouts are exported, as json array or one json object per line
+    - exported records contain the same attributes as Workout.as_dict
+'''
+
+import unittest
+import os
+import json
+
+import lib
+from lib.json_exporter import JsonExporter
+from lib.workout import WorkoutsDatabase, Workout
+
+
+class TestExportJSON(unittest.TestCase):
+
+    def setUp(self):
+        self.db = WorkoutsDatabase("testdb")
+        self.db.create_session()
+        self.db.create_sample()
+        self.json = JsonExporter("test.json")
+        self.json.create_session()
+
+    def tearDown(self):
+        self.json.close_session()
+        self.db.close_session()
+        os.remove("testdb")
+        os.remove("test.json")
+
+    def test_export(self):
+        self.json.export_workouts(self.db)
+        self.json.close_session()
+        with open("test.json", "r", encoding='utf-8') as file:
+            records = json.load(file)
+        workouts = self.db.session.query(Workout).order_by(Workout.id).all()
+        self.assertEqual(records, [workout.as_dict(self.db) for workout in workouts])
+
+    def test_export_ndjson(self):
+        self.json.ndjson = True
+        self.json.export_workouts(self.db)
+        self.json.close_session()
+        with open("test.json", "r", encoding='utf-8') as file:
+            records = [json.loads(line) for line in file]
+        workouts = self.db.session.query(Workout).order_by(Workout.id).all()
+        self.assertEqual(records, [workout.as_dict(self.db) for workout in workouts])
@@ -0,0 +1,121 @@
+'''
+Test Cases for importing workouts in columnar formats (Parquet, Arrow IPC)
+- happy paths
+    - exported workouts are imported with the same attributes
+    - already existing workouts are identified and not imported
+- unhappy paths
+    - import file has wrong format
+'''
+
+import unittest
+import os
+
+import lib
+from lib.arrow_exporter import ArrowExporter, pyarrow
+from lib.arrow_importer import ArrowImporter
+from lib.csv_importer import CsvImporter
+from lib.workout import WorkoutsDatabase, Workout
+from benchmarks.generator import generate_workouts, write_csv
+
+
+@unittest.skipIf(pyarrow is None, "pyarrow not installed")
+class TestImportArrow(unittest.TestCase):
+
+    def setUp(self):
+        self.db = WorkoutsDatabase("testdb")
+        self.db.create_session()
+
+    def tearDown(self):
+        self.db.close_session()
+        os.remove("testdb")
+
+    def roundtrip(self, filename):
+        source = WorkoutsDatabase("test.db")
+        source.create_session()
+        try:
+            source.create_sample()
+            exporter = ArrowExporter(filename)
+            exporter.create_session()
+            exporter.export_workouts(source)
+            exporter.close_session()
+            workouts = source.session.query(Workout).filter(Workout.source != "MERGED WORKOUT").order_by(Workout.id)
+            expected = [workout.as_list(source) for workout in workouts]
+
+            importer = ArrowImporter(filename)
+            self.assertTrue(importer.create_session())
+            (fetched, imported) = importer.import_workouts(self.db)
+            self.assertEqual(fetched, imported)
+            # a second import finds all workouts
+            self.assertEqual(importer.import_workouts(self.db), (fetched, 0))
+            importer.close_session()
+        finally:
+            source.close_session()
+            os.remove("test.db")
+            os.remove(filename)
+        workouts = self.db.session.query(Workout).filter(Workout.source != "MERGED WORKOUT").order_by(Workout.id)
+        self.assertEqual([workout.as_list(self.db) for workout in workouts], expected)
+
+    def test_import_parquet(self):
+        self.roundtrip("test.parquet")
+
+    def test_import_arrow(self):
+        self.roundtrip("test.arrow")
+
+    def test_roundtrip_merged_workouts(self):
+        # merged workouts created within the same second differ in the fractions of their external ids
+        source = WorkoutsDatabase("test.db")
+        source.create_session()
+        try:
+            write_csv("test.csv", generate_workouts(300))
+            importer = CsvImporter("test.csv")
+            importer.create_session()
+            importer.import_workouts(source)
+            importer.close_session()
+            merged = set(external_id for (external_id,) in source.session.query(Workout.external_id)
+                         .filter(Workout.source == "MERGED WORKOUT"))
+            self.assertGreater(len(merged), 1)
+            number_of_workouts = source.session.query(Workout).count()
+            exporter = ArrowExporter("test.parquet")
+            exporter.create_session()
+            exporter.export_workouts(source)
+            exporter.close_session()
+            importer = ArrowImporter("test.parquet")
+            self.assertTrue(importer.create_session())
+            self.assertEqual(importer.import_workouts(self.db), (number_of_workouts, number_of_workouts))
+            importer.close_session()
+        finally:
+            source.close_session()
+            for filename in ["test.db", "test.csv", "test.parquet"]:
+                if os.path.exists(filename):
+                    os.remove(filename)
+        # every exported workout is imported, the import may merge further duplicates
+        self.assertGreaterEqual(self.db.session.query(Workout).count(), number_of_workouts)
+        self.assertLessEqual(merged, set(external_id for (external_id,) in self.db.session.query(Workout.external_id)
+                                         .filter(Workout.source == "MERGED WORKOUT")))
+
+    def test_export_not_representable(self):
+        # decimals in an integer column are not cut silently
+        source = WorkoutsDatabase("test.db")
+        source.create_session()
+        try:
+            source.session.add(Workout(source="CSV import", external_id=1, calories=1.5))
+            source.session.flush()
+            exporter = ArrowExporter("test.parquet")
+            exporter.create_session()
+            with self.assertRaises(ValueError):
+                exporter.export_workouts(source)
+            exporter.close_session()
+        finally:
+            source.close_session()
+            os.remove("test.db")
+            os.remove("test.parquet")
+
+    def test_import_wrong_format(self):
+        with open("test.arrow", "w") as file:
+            file.write("no arrow file")
+        importer = ArrowImporter("test.arrow")
+        try:
+            self.assertFalse(importer.create_session())
+        finally:
+            importer.close_session()
+            os.remove("test.arrow")
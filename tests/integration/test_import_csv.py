@@ -7,12 +7,18 @@ Test Cases for importing workouts in CSV format
 - unhappy paths
     - import file has wrong format
     - workouts have incorrect syntax 
+    - values which cannot be converted
 '''
 
 import unittest
+import csv
 import os
+from concurrent.futures import Future
 
 import lib
+from sqlalchemy import text
+from lib import csv_importer
+from lib.profiler import Profiler
 from lib.csv_importer import CsvImporter
 from lib.workout import WorkoutsDatabase, Workout
 
@@ -41,6 +47,11 @@ class TestImportCSV(unittest.TestCase):
         # workout imported with correct attribues
         workout = self.db.session.query(Workout).filter(Workout.external_id == 42).first()
         self.assertEqual(workout.name, "Indoor Rad")
+        # numeric columns are stored as numbers
+        self.assertEqual((workout.distance_m, workout.average_speed_m_per_sec), (5000, 6.123))
+        self.assertEqual(self.db.session.execute(text(
+            "SELECT typeof(distance_m), typeof(average_speed_m_per_sec), typeof(max_temperature) "
+            "FROM workouts WHERE external_id = 42")).first(), ('integer', 'real', 'null'))
 
     def test_import_existing(self):
         self.csv.import_workouts(self.db)
@@ -54,6 +65,86 @@ class TestImportCSV(unittest.TestCase):
         # from 2 imported workouts 0 are new
         self.assertEqual((fetched, imported), (3, 0))
 
+    def test_import_parallel(self):
+        # workouts with line breaks and quotes in descriptions, split into many small chunks
+        with open(self.csv.filename, "r", encoding='utf-8', newline='') as file:
+            records = list(csv.DictReader(file))
+        with open("test.csv", "w", encoding='utf-8', newline='') as file:
+            writer = csv.DictWriter(file, fieldnames=Workout.header())
+            writer.writeheader()
+            for i in range(200):
+                record = dict(records[i % len(records)])
+                record['id'] = 1000 + i
+                record['description'] = 'day {}\n"interval" training,\n'.format(i) * (i % 3)
+                writer.writerow(record)
+        chunk_size = csv_importer.CHUNK_SIZE
+        csv_importer.CHUNK_SIZE = 500
+        try:
+            importer = CsvImporter("test.csv", jobs=3)
+            importer.create_session()
+            (fetched, imported) = importer.import_workouts(self.db)
+            importer.close_session()
+        finally:
+            csv_importer.CHUNK_SIZE = chunk_size
+            os.remove("test.csv")
+        self.assertEqual((fetched, imported), (200, 200))
+        workouts = self.db.session.query(Workout).filter(Workout.source != "MERGED WORKOUT").order_by(Workout.id).all()
+        self.assertEqual([int(workout.external_id) for workout in workouts], list(range(1000, 1200)))
+        self.assertEqual(workouts[5].description, 'day 5\n"interval" training,\n' * 2)
+        self.assertEqual(workouts[5].start_time, workouts[2].start_time)
 
+    def test_parse_ahead(self):
+        # the chunks are yielded in the order of the file, at most window chunks are parsed ahead of the import
+        class Executor:
+            submitted = 0
 
-        
+            def submit(self, function, filename, start, end, header):
+                self.submitted += 1
+                future = Future()
+                future.set_result(start)
+                return future
+
+        executor = Executor()
+        starts = []
+        for start in csv_importer._parse_chunks(executor, "test.csv", list(range(0, 110, 10)), [], 4):
+            self.assertLessEqual(executor.submitted - len(starts), 4)
+            starts.append(start)
+        self.assertEqual(starts, list(range(0, 100, 10)))
+
+    def test_import_bad_values(self):
+        # values which cannot be converted are stored as NULL, the other values and workouts are imported
+        with open(self.csv.filename, "r", encoding='utf-8', newline='') as file:
+            records = list(csv.DictReader(file))
+        records[0]['distance_m'] = "n/a"
+        records[1]['calories'] = " "
+        with open("test.csv", "w", encoding='utf-8', newline='') as file:
+            writer = csv.DictWriter(file, fieldnames=Workout.header())
+            writer.writeheader()
+            writer.writerows(records)
+        try:
+            importer = CsvImporter("test.csv")
+            importer.create_session()
+            with self.assertLogs('lib.record_mapping', level='WARNING'):
+                self.assertEqual(importer.import_workouts(self.db), (3, 3))
+            importer.close_session()
+        finally:
+            os.remove("test.csv")
+        workouts = self.db.session.query(Workout).filter(Workout.source != "MERGED WORKOUT").order_by(Workout.id).all()
+        self.assertEqual(len(workouts), 3)
+        self.assertIsNone(workouts[0].distance_m)
+        self.assertEqual(workouts[0].name, records[0]['name'])
+        self.assertIsNone(workouts[1].calories)
+        self.assertEqual(workouts[1].distance_m, int(records[1]['distance_m']) if records[1]['distance_m'] else None)
+
+    def test_import_stats(self):
+        self.csv.import_workouts(self.db)
+        self.assertEqual(self.csv.stats, {})
+        self.csv.csv.seek(0)
+        profiler = Profiler().start(self.db.session.get_bind())
+        try:
+            self.csv.import_workouts(self.db)
+        finally:
+            profiler.stop()
+        self.assertEqual(self.csv.stats['stages']['resolve']['calls'], 3)
+        self.assertIn('decode', self.csv.stats['stages'])
+        self.assertGreater(self.csv.stats['sql']['statements'], 0)
@@ -0,0 +1,235 @@
+'''
+Test Cases for importing workouts from Garmin Connect
+Garmin Connect is replaced by a session serving pages of generated activities
+- happy paths
+    - all pages are fetched and all workouts are imported
+    - already existing workouts are identified and not imported
+    - incremental imports stop at the newest workout of the previous import
+    - cached pages are replayed without network
+    - a stored session is reused, signing in again only if it is rejected
+- error cases
+    - a session file without cookies is ignored and the importer signs in again
+    - the watermark is kept if workouts could not be stored, so the next import fetches them again
+'''
+
+import unittest
+import os
+import json
+import copy
+import tempfile
+from unittest import mock
+from datetime import datetime, timedelta
+
+import requests
+from sqlalchemy import exc
+
+import lib
+from lib.garmin_importer import GarminImporter, CHUNK_SIZE
+from lib.workout import WorkoutsDatabase, Workout
+
+
+class FakeResponse:
+
+    def __init__(self, status_code, content, url="https://connect.garmin.com/modern/proxy"):
+        self.status_code = status_code
+        self.url = url
+        self.content = content
+        self.text = content.decode('utf-8')
+
+    def json(self):
+        return json.loads(self.content)
+
+    def close(self):
+        pass
+
+    def iter_content(self, chunk_size=1, decode_unicode=False):
+        content = self.text if decode_unicode else self.content
+        for i in range(0, len(content), chunk_size):
+            yield content[i:i + chunk_size]
+
+
+class FakeSession:
+    """
+    serves the activities search of Garmin Connect from a list of activities, newest first
+    """
+
+    def __init__(self, activities, signed_in=True):
+        self.activities = activities
+        self.signed_in = signed_in
+        self.requested_pages = []
+        self.cookies = requests.cookies.RequestsCookieJar()
+
+    def get(self, url, params=None, **kwargs):
+        if not self.signed_in:
+            return FakeResponse(401, b"")
+        self.requested_pages.append(params["start"])
+        page = self.activities[params["start"]:params["start"] + params["limit"]]
+        return FakeResponse(200, json.dumps(page).encode('utf-8'))
+
+    def close(self):
+        pass
+
+
+def create_activities(number, newest=datetime(2020, 5, 4, 12, 0, 0)):
+    with open(os.path.join(os.path.dirname(os.path.abspath(__file__)), "./sample_garmin.json")) as file:
+        sample = json.load(file)
+    activities = []
+    for i in range(number):
+        activity = copy.deepcopy(sample)
+        start_time = newest - timedelta(days=i)
+        activity['activityId'] = 1000 + number - i
+        activity['startTimeLocal'] = str(start_time)
+        activity['startTimeGMT'] = str(start_time - timedelta(hours=1))
+        activity['duration'] = 3600.0
+        activities.append(activity)
+    return activities
+
+
+class SignInCountingImporter(GarminImporter):
+    """
+    signs in to the fake session instead of Garmin Connect
+    """
+    number_of_sign_ins = 0
+
+    def _authenticate(self):
+        SignInCountingImporter.number_of_sign_ins += 1
+        self.session.signed_in = True
+        self.session.cookies.set("SESSIONID", "signed in", domain="connect.garmin.com", path="/")
+
+
+class TestImportGarmin(unittest.TestCase):
+
+    def setUp(self):
+        self.db = WorkoutsDatabase("testdb")
+        self.db.create_session()
+        self.garmin = GarminImporter("user", "password", concurrency=2)
+        self.garmin.session = FakeSession(create_activities(CHUNK_SIZE + 50))
+
+    def temporary_directory(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        return directory.name
+
+    def tearDown(self):
+        self.garmin.close_session()
+        self.db.close_session()
+        os.remove("testdb")
+
+    def test_import(self):
+        (fetched, imported) = self.garmin.import_workouts(self.db)
+        self.assertEqual((fetched, imported), (CHUNK_SIZE + 50, CHUNK_SIZE + 50))
+        self.assertEqual(self.db.session.query(Workout.id).count(), CHUNK_SIZE + 50)
+        self.assertIn(0, self.garmin.session.requested_pages)
+        self.assertIn(CHUNK_SIZE, self.garmin.session.requested_pages)
+        workout = self.db.session.query(Workout).filter(Workout.external_id == 1000 + CHUNK_SIZE + 50).first()
+        self.assertEqual(workout.name, "Mountainbike")
+        self.assertEqual(workout.source, "Garmin")
+        self.assertEqual(workout.duration_sec, 3600)
+        self.assertEqual(workout.min_temperature, 10)
+        self.assertEqual(workout.aerobic_training_effect, 2.3)
+        self.assertEqual(workout.lactate_threshold_bpm, 158)
+        self.assertIsNone(workout.distance_m)
+        self.assertEqual(workout.sportstype_id, self.db.find_sportstype("Road Cycling")[0])
+
+    def test_parse_page(self):
+        records = self.garmin._fetch_workouts(0)
+        self.assertEqual(len(records), CHUNK_SIZE)
+        # unused fields are not kept
+        self.assertNotIn('summarizedDiveInfo', records[0])
+        self.assertNotIn('ownerProfileImageUrlLarge', records[0])
+        self.assertEqual(records[0]['activityType']['typeKey'], 'cycling')
+        self.assertEqual(records[0]['activityId'], 1000 + CHUNK_SIZE + 50)
+
+    def test_import_sequential(self):
+        self.garmin.concurrency = 0
+        (fetched, imported) = self.garmin.import_workouts(self.db)
+        self.assertEqual((fetched, imported), (CHUNK_SIZE + 50, CHUNK_SIZE + 50))
+        self.assertEqual(self.garmin.session.requested_pages, [0, CHUNK_SIZE])
+
+    def test_import_existing(self):
+        self.garmin.import_workouts(self.db)
+        self.garmin.full = True
+        (fetched, imported) = self.garmin.import_workouts(self.db)
+        self.assertEqual((fetched, imported), (CHUNK_SIZE + 50, 0))
+
+    def test_replay(self):
+        cache_directory = os.path.join(self.temporary_directory(), "cache")
+        garmin = GarminImporter("user", "password", cache_directory=cache_directory)
+        garmin.session = self.garmin.session
+        garmin.import_workouts(self.db)
+        garmin.close_session()
+
+        db = WorkoutsDatabase(os.path.join(self.temporary_directory(), "testdb"))
+        db.create_session()
+        self.addCleanup(db.close_session)
+        garmin = GarminImporter("user", None, cache_directory=cache_directory, replay=True)
+        self.assertTrue(garmin.create_session())
+        (fetched, imported) = garmin.import_workouts(db)
+        garmin.close_session()
+        self.assertEqual((fetched, imported), (CHUNK_SIZE + 50, CHUNK_SIZE + 50))
+        self.assertEqual(db.get_watermark("Garmin", "user"), self.db.get_watermark("Garmin", "user"))
+
+    def test_session_file(self):
+        session_file = os.path.join(self.temporary_directory(), "session", "garmin.json")
+        SignInCountingImporter.number_of_sign_ins = 0
+        garmin = SignInCountingImporter("user", "password", session_file=session_file)
+        garmin.create_session()
+        garmin.close_session()
+        self.assertEqual(SignInCountingImporter.number_of_sign_ins, 1)
+        self.assertEqual(os.stat(session_file).st_mode & 0o777, 0o600)
+
+        # the stored session is reused
+        garmin = SignInCountingImporter("user", "password", concurrency=2, session_file=session_file)
+        garmin.create_session()
+        self.assertEqual(garmin.session.cookies.get("SESSIONID"), "signed in")
+        self.assertEqual(SignInCountingImporter.number_of_sign_ins, 1)
+
+        # ... until it is rejected, then the importer signs in again once
+        garmin.session = FakeSession(create_activities(CHUNK_SIZE + 50), signed_in=False)
+        (fetched, imported) = garmin.import_workouts(self.db)
+        garmin.close_session()
+        self.assertEqual((fetched, imported), (CHUNK_SIZE + 50, CHUNK_SIZE + 50))
+        self.assertEqual(SignInCountingImporter.number_of_sign_ins, 2)
+
+    def test_session_file_without_cookies(self):
+        session_file = os.path.join(self.temporary_directory(), "garmin.json")
+        with open(session_file, "w") as file:
+            json.dump({"username": "user"}, file)
+        SignInCountingImporter.number_of_sign_ins = 0
+        garmin = SignInCountingImporter("user", "password", session_file=session_file)
+        with self.assertLogs('lib.garmin_importer', 'WARNING'):
+            garmin.create_session()
+        garmin.close_session()
+        self.assertEqual(SignInCountingImporter.number_of_sign_ins, 1)
+        with open(session_file) as file:
+            self.assertEqual(json.load(file)["cookies"][0]["name"], "SESSIONID")
+
+    def test_import_incremental(self):
+        self.garmin.import_workouts(self.db)
+        self.assertEqual(self.db.get_watermark("Garmin", "user")[1], 1000 + CHUNK_SIZE + 50)
+
+        # two new workouts, a single page is requested
+        activities = create_activities(CHUNK_SIZE + 52, newest=datetime(2020, 5, 6, 12, 0, 0))
+        self.garmin.session = FakeSession(activities)
+        (fetched, imported) = self.garmin.import_workouts(self.db)
+        self.assertEqual((fetched, imported), (2, 2))
+        self.assertEqual(self.garmin.session.requested_pages, [0])
+        self.assertEqual(self.db.get_watermark("Garmin", "user")[1], 1000 + CHUNK_SIZE + 52)
+
+        # no new workouts
+        self.garmin.session = FakeSession(activities)
+        (fetched, imported) = self.garmin.import_workouts(self.db)
+        self.assertEqual((fetched, imported), (0, 0))
+        self.assertEqual(self.garmin.session.requested_pages, [0])
+
+    def test_import_failed_insert(self):
+        error = exc.OperationalError("INSERT INTO workouts", {}, Exception("database is locked"))
+        with mock.patch.object(self.db, '_insert_records', side_effect=error):
+            with self.assertLogs('lib.garmin_importer', 'ERROR'):
+                self.assertEqual(self.garmin.import_workouts(self.db), (CHUNK_SIZE + 50, 0))
+        self.assertIsNone(self.db.get_watermark("Garmin", "user"))
+
+        # the next import fetches all workouts again
+        self.garmin.session = FakeSession(create_activities(CHUNK_SIZE + 50))
+        self.assertEqual(self.garmin.import_workouts(self.db), (CHUNK_SIZE + 50, CHUNK_SIZE + 50))
+        self.assertEqual(self.db.get_watermark("Garmin", "user")[1], 1000 + CHUNK_SIZE + 50)
@@ -1,5 +1,6 @@
 import unittest
 import os
+import json
 
 import lib
 from lib.json_importer import JsonImporter
@@ -30,3 +31,16 @@ class TestImportCSV(unittest.TestCase):
         workout = self.db.session.query(Workout).filter(
             Workout.external_id == 42).first()
         self.assertEqual(workout.name, "Indoor Rad")
+
+    def test_import_ndjson(self):
+        with open(self.json.filename, "r") as file:
+            records = json.load(file)
+        with open("test.ndjson", "w") as file:
+            for record in records:
+                file.write(json.dumps(record) + "\n")
+        importer = JsonImporter("test.ndjson", ndjson=True)
+        importer.create_session()
+        val = importer.import_workouts(self.db)
+        importer.close_session()
+        os.remove("test.ndjson")
+        self.assertEqual(val, (2, 2))
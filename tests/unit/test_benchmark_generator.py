@@ -0,0 +1,64 @@
+import unittest
+import os
+
+import lib
+from benchmarks.generator import generate_workouts, write_csv
+from benchmarks import scenarios
+from lib.csv_importer import CsvImporter
+from lib.workout import Workout, WorkoutsDatabase
+
+
+class TestBenchmarkGenerator(unittest.TestCase):
+
+    def test_generate_workouts(self):
+        workouts = list(generate_workouts(500, seed=1))
+        self.assertEqual(len(workouts), 500)
+        self.assertEqual(workouts, list(generate_workouts(500, seed=1)))
+        self.assertNotEqual(workouts, list(generate_workouts(500, seed=2)))
+        self.assertEqual(set(workouts[0]), set(Workout.header()))
+        self.assertEqual({workout['source'] for workout in workouts}, {"Garmin", "CSV import", "Zwift"})
+        self.assertEqual(len({(workout['source'], workout['id']) for workout in workouts}), 500)
+
+    def test_import_generated_workouts(self):
+        write_csv("test.csv", generate_workouts(200))
+        db = WorkoutsDatabase("test.db")
+        db.create_session()
+        importer = CsvImporter("test.csv")
+        importer.create_session()
+        try:
+            self.assertEqual(importer.import_workouts(db), (200, 200))
+            # the duplicates from other sources are merged
+            self.assertGreater(db.session.query(Workout).filter(Workout.source == "MERGED WORKOUT").count(), 0)
+        finally:
+            importer.close_session()
+            db.close_session()
+            os.remove("test.db")
+            os.remove("test.csv")
+
+    def test_check_scenario(self):
+        write_csv("test.csv", generate_workouts(200))
+        db = WorkoutsDatabase("test.db")
+        db.create_session()
+        importer = CsvImporter("test.csv")
+        importer.create_session()
+        importer.import_workouts(db)
+        importer.close_session()
+        db.close_session()
+        try:
+            # the imported database was checked by the import already
+            self.assertRaises(RuntimeError, scenarios.check, {'database': "test.db"})
+            scenarios.reset_duplicates("test.db")
+            db.create_session()
+            self.assertEqual(db.session.query(Workout).filter(Workout.source == "MERGED WORKOUT").count(), 0)
+            db.close_session()
+            self.assertEqual(scenarios.check({'database': "test.db"}), 200)
+            db.create_session()
+            self.assertGreater(db.session.query(Workout).filter(Workout.source == "MERGED WORKOUT").count(), 0)
+            db.close_session()
+        finally:
+            os.remove("test.db")
+            os.remove("test.csv")
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,6 +1,6 @@
 import unittest
 import os
-from datetime import datetime
+from datetime import datetime, timedelta
 import logging
 
 import lib
@@ -93,5 +93,98 @@ class TestDuplicateWorkouts(unittest.TestCase):
         self.assertEqual(number_of_workouts_after, number_of_workouts_before + 1)  # this workout added, no merged one
         self.assertIsNone(workout.is_duplicate_with)
 
+    def test_check(self):
+        # workouts are added without duplicate handling, the check has to find them
+        zwift = Workout(external_id=1, source="Garmin", name="Zwift - Watopia", sport_id=1,
+                        start_time=datetime.strptime("2020-05-21 20:00:00", "%Y-%m-%d %H:%M:%S"),
+                        duration_sec=3600)
+        csv = Workout(external_id=2, source="CSV import", name="Indoor Rad", sport_id=1,
+                      start_time=datetime.strptime("2020-05-21 20:01:00", "%Y-%m-%d %H:%M:%S"),
+                      duration_sec=3500, calories=500)
+        other_sport = Workout(external_id=3, source="CSV import", sport_id=2,
+                              start_time=datetime.strptime("2020-05-21 20:30:00", "%Y-%m-%d %H:%M:%S"),
+                              duration_sec=600)
+        next_day = Workout(external_id=4, source="Garmin", sport_id=1,
+                           start_time=datetime.strptime("2020-05-22 20:00:00", "%Y-%m-%d %H:%M:%S"),
+                           duration_sec=3600)
+        self.db.session.add_all([zwift, csv, other_sport, next_day])
+        self.db.session.flush()
+
+        self.assertEqual(self.db.check(), (4, 2, 1))
+        merged = self.db.session.query(Workout).filter(Workout.source == "MERGED WORKOUT").one()
+        self.assertEqual(zwift.is_duplicate_with, merged.id)
+        self.assertEqual(csv.is_duplicate_with, merged.id)
+        self.assertEqual(merged.name, "Zwift - Watopia")    # leading workout is the Zwift one
+        self.assertEqual(merged.calories, 500)              # missing attributes are merged from the duplicates
+        self.assertEqual(zwift.manual_check_required_with, other_sport.id)
+        self.assertIsNone(other_sport.is_duplicate_with)
+        self.assertIsNone(next_day.is_duplicate_with)
+
+        # a second check does not find new duplicates
+        self.assertEqual(self.db.check(), (5, 2, 0))
+
+    def add_workouts(self):
+        # workouts overlapping the previous and the next one, every fourth one of another sport
+        self.db.session.query(Workout).delete()
+        self.db.session.expunge_all()
+        start_time = datetime.strptime("2020-05-21 20:00:00", "%Y-%m-%d %H:%M:%S")
+        for i in range(12):
+            self.db.session.add(Workout(external_id=i, source="Garmin" if i % 3 else "CSV import",
+                                        sport_id=1 if i % 4 else 2, name="Workout {}".format(i),
+                                        start_time=start_time + timedelta(minutes=20 * i), duration_sec=1800))
+        self.db.session.flush()
+
+    def marks(self):
+        return self.db.session.query(Workout.source, Workout.external_id, Workout.is_duplicate_with != None,
+                                     Workout.manual_check_required_with != None)\
+            .filter(Workout.source != "MERGED WORKOUT").order_by(Workout.external_id).all()
+
+    def test_check_chunks(self):
+        # the check marks the workouts like Workout.handle_duplicates() checking them one after the other
+        self.add_workouts()
+        for workout in self.db.session.query(Workout).order_by(Workout.start_time).all():
+            workout.handle_duplicates(self.db)
+        expected = self.marks()
+        self.assertIn((True, False), [marks[2:] for marks in expected])
+        self.assertIn((False, True), [marks[2:] for marks in expected])
+
+        # the result does not depend on the chunks the workouts are read in, also if overlaps span several chunks
+        for chunk_size in [1, 2, 3, 100]:
+            self.add_workouts()
+            loaded = self.db.session.query(Workout).filter(Workout.external_id == 0).one()
+            (checked, duplicates, merged) = self.db.check(chunk_size)
+            self.assertEqual(checked, 12)
+            # workouts loaded by the check are not kept in the session, the ones loaded before are
+            self.assertEqual(list(self.db.session.identity_map.values()), [loaded])
+            self.assertEqual(self.marks(), expected)
+            self.assertEqual(duplicates, sum(1 for marks in expected if marks[2]))
+
+    def test_check_chain(self):
+        # A and C do not overlap, C is not merged with the workout merged from A and B
+        (a, b, c) = [Workout(external_id=i, source="CSV import", sport_id=1,
+                             start_time=datetime(2020, 5, 21, 10, 0) + timedelta(minutes=minutes), duration_sec=3600)
+                     for (i, minutes) in enumerate([0, 50, 100])]
+        self.db.session.add_all([a, b, c])
+        self.db.session.flush()
+
+        self.assertEqual(self.db.check(), (3, 2, 1))
+        merged = self.db.session.query(Workout).filter(Workout.source == "MERGED WORKOUT").one()
+        self.assertEqual((a.is_duplicate_with, b.is_duplicate_with), (merged.id, merged.id))
+        self.assertEqual(merged.start_time, a.start_time)
+        self.assertIsNone(c.is_duplicate_with)
+        self.assertIsNone(c.manual_check_required_with)
+
+    def test_check_touching(self):
+        # workouts overlap if one starts when the other one ends, in the check like in handle_duplicates
+        first = Workout(external_id=1, source="CSV import", sport_id=1, start_time=datetime(2020, 5, 21, 10, 0),
+                        duration_sec=3600)
+        second = Workout(external_id=2, source="CSV import", sport_id=1, start_time=datetime(2020, 5, 21, 11, 0),
+                         duration_sec=3600)
+        self.db.session.add_all([first, second])
+        self.db.session.flush()
+        self.assertEqual(self.db.check(), (2, 2, 1))
+        self.assertEqual(len(self.db.find_overlapping(second.start_time, 3600).all()), 1)
+        self.assertEqual(len(self.db.find_overlapping(datetime(2020, 5, 21, 9, 0), 3600).all()), 1)
+
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,52 @@
+import unittest
+import os
+import json
+import tempfile
+
+import lib
+from lib.garmin_cache import GarminCache
+
+
+class TestGarminCache(unittest.TestCase):
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = directory.name
+
+    def test_pages(self):
+        cache = GarminCache(self.directory, "user@example.com")
+        cache.store(0, b'[{"activityId": 2, "activityName": "old"}, {"activityId": 1}]')
+        cache.store(20, b'[]')
+        cache.store(0, b'[{"activityId": 2, "activityName": "old"}, {"activityId": 1}]')
+        # the activity was renamed since the first import
+        cache.store(0, b'[{"activityId": 3}, {"activityId": 2, "activityName": "new"}]')
+
+        # the index is appended to, a page fetched again unchanged is not added
+        with open(cache.index_filename) as file:
+            self.assertEqual([json.loads(line)["start"] for line in file], [0, 20, 0])
+        self.assertEqual(len(os.listdir(os.path.join(self.directory, "objects"))), 3)
+
+        # the most recently fetched pages are replayed first, also by a new cache of the same account
+        expected = [b'[{"activityId": 3}, {"activityId": 2, "activityName": "new"}]', b'[]',
+                    b'[{"activityId": 2, "activityName": "old"}, {"activityId": 1}]']
+        self.assertEqual(list(cache.pages()), expected)
+        self.assertEqual(list(GarminCache(self.directory, "user@example.com").pages()), expected)
+        self.assertEqual(list(GarminCache(self.directory, "other").pages()), [])
+
+    def test_incomplete_index(self):
+        cache = GarminCache(self.directory, "user")
+        cache.store(0, b'[]')
+        with open(cache.index_filename, "a") as file:
+            file.write('{"start": 20, "obj')
+        cache = GarminCache(self.directory, "user")
+        with self.assertLogs('lib.garmin_cache', 'WARNING'):
+            self.assertEqual(list(cache.pages()), [b'[]'])
+        # the next page is indexed on a line of its own
+        cache.store(20, b'[{"activityId": 1}]')
+        with self.assertLogs('lib.garmin_cache', 'WARNING'):
+            self.assertEqual(list(GarminCache(self.directory, "user").pages()), [b'[{"activityId": 1}]', b'[]'])
+
+
+if __name__ == '__main__':
+    unittest.main()
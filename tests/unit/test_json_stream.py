@@ -0,0 +1,33 @@
+import unittest
+import json
+
+import lib
+from lib.json_stream import iter_json_array, iter_json_lines
+
+
+def chunked(text, size):
+    return [text[i:i + size] for i in range(0, len(text), size)]
+
+
+class TestJsonStream(unittest.TestCase):
+
+    def test_iter_json_array(self):
+        records = [{"id": 42, "name": "Indoor Rad", "distance_m": 5000}, {"id": 43, "name": "[Running]"}, 1234567, []]
+        text = json.dumps(records)
+        for size in [1, 2, 7, len(text)]:
+            self.assertEqual(list(iter_json_array(chunked(text, size))), records)
+
+    def test_iter_json_arrays(self):
+        # one array per line
+        text = '[{"id": 1}, {"id": 2}]\n[]\n  [{"id": 3}]\n'
+        self.assertEqual(list(iter_json_array(chunked(text, 3))), [{"id": 1}, {"id": 2}, {"id": 3}])
+
+    def test_iter_json_array_not_formatted_correctly(self):
+        for text in ['{"id": 1}', '[{"id": 1} {"id": 2}]', '[{"id": 1}, {"id": ', '[{"id": 1}']:
+            with self.assertRaises(json.JSONDecodeError):
+                list(iter_json_array(chunked(text, 4)))
+
+    def test_iter_json_lines(self):
+        lines = ['{"id": 1}\n', '\n', '{"id": 2}']
+        self.assertEqual(list(iter_json_lines(lines)), [{"id": 1}, {"id": 2}])
+
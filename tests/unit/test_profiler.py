@@ -0,0 +1,75 @@
+import unittest
+import os
+import io
+import time
+from datetime import datetime
+
+import lib
+from lib import profiler
+from lib.profiler import Profiler, normalize_statement
+from lib.workout import Workout, WorkoutsDatabase
+
+
+class TestProfiler(unittest.TestCase):
+    DB_NAME = "test.db"
+
+    def setUp(self):
+        self.db = WorkoutsDatabase(self.DB_NAME)
+        self.db.create_session()
+
+    def tearDown(self):
+        if profiler.active:
+            profiler.active.stop()
+        self.db.close_session()
+        os.remove(self.DB_NAME)
+
+    def test_normalize_statement(self):
+        self.assertEqual(normalize_statement("SELECT id\n  FROM workouts WHERE id IN (?, ?, ?)"),
+                         "SELECT id FROM workouts WHERE id IN (?, ...)")
+        self.assertEqual(normalize_statement("INSERT INTO sports (name, id) VALUES (?, ?)"),
+                         "INSERT INTO sports (name, id) VALUES (?, ?)")
+
+    def test_stages(self):
+        run = Profiler().start()
+        started = time.perf_counter()
+        with profiler.stage("outer"):
+            time.sleep(0.02)
+            with profiler.stage("inner"):
+                time.sleep(0.02)
+        elapsed = time.perf_counter() - started
+        self.assertEqual(list(profiler.timed([1, 2], "fetch")), [1, 2])
+        run.stop()
+        stats = run.stats()
+        outer = stats['stages']['outer']['seconds']
+        inner = stats['stages']['inner']['seconds']
+        self.assertEqual(stats['stages']['outer']['calls'], 1)
+        self.assertGreaterEqual(outer, 0.02)
+        self.assertGreaterEqual(inner, 0.02)
+        # the time of the inner stage is not counted for the outer one, both fit into the time of the outer block
+        self.assertLessEqual(outer + inner, elapsed)
+        self.assertGreaterEqual(stats['stages']['fetch']['seconds'], 0)
+        self.assertEqual(stats['stages']['fetch']['calls'], 3)
+        self.assertIsNone(profiler.active)
+        self.assertEqual(profiler.stats(), {})
+
+    def test_profile_add_workouts(self):
+        run = Profiler().start(self.db.session.get_bind())
+        self.db.add_workouts([Workout(source="TEST", external_id=i, start_time=datetime(2020, 5, i + 1, 12),
+                                      duration_sec=600) for i in range(10)])
+        run.stop()
+        stats = run.stats()
+        self.assertEqual(set(stats['stages']), {"insert", "dedupe"})
+        self.assertGreater(stats['sql']['statements'], 10)
+        self.assertEqual(stats['sql']['statements'],
+                         sum(entry['count'] for entry in stats['sql']['by_statement'].values()))
+        output = io.StringIO()
+        run.report(output)
+        self.assertIn("dedupe", output.getvalue())
+        self.assertIn("INSERT INTO workouts", output.getvalue())
+        # statements after stop are not counted
+        self.db.session.query(Workout).count()
+        self.assertEqual(run.stats()['sql']['statements'], stats['sql']['statements'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,84 @@
+import unittest
+from datetime import datetime
+
+import lib
+from lib.record_mapping import FieldMapping, compile_mapping, compile_decoder, compile_initializer, to_datetime, to_int
+
+
+class TestRecordMapping(unittest.TestCase):
+
+    def test_compile_mapping(self):
+        transform = compile_mapping([FieldMapping('activityId', 'external_id'),
+                                     FieldMapping(('activityType', 'typeKey'), 'sportstype'),
+                                     FieldMapping('startTimeLocal', 'start_time', to_datetime),
+                                     FieldMapping('distance', 'distance_m', int),
+                                     FieldMapping('elevationGain', 'elevation_gain_m'),
+                                     FieldMapping('averageSpeed', 'average_speed_m_per_sec', rounding=3),
+                                     FieldMapping('avgStrokes', 'avg_strokes', float, 1)],
+                                    {'source': "Garmin"})
+        records = [{'activityId': 1,
+                    'activityType': {'typeKey': 'cycling'},
+                    'startTimeLocal': '2020-03-28 16:25:47',
+                    'distance': 1234.5,
+                    'elevationGain': 0.0,
+                    'averageSpeed': 6.12345,
+                    'avgStrokes': '12.34'},
+                   {'activityId': 2,
+                    'activityType': None,
+                    'distance': 0.0}]
+        self.assertEqual(transform(records),
+                         [{'external_id': 1,
+                           'sportstype': 'cycling',
+                           'start_time': datetime(2020, 3, 28, 16, 25, 47),
+                           'distance_m': 1234,
+                           'elevation_gain_m': 0.0,
+                           'average_speed_m_per_sec': 6.123,
+                           'avg_strokes': 12.3,
+                           'source': "Garmin"},
+                          {'external_id': 2,
+                           'sportstype': None,
+                           'start_time': None,
+                           'distance_m': None,       # converted values are only set if they are set in the record
+                           'elevation_gain_m': None,
+                           'average_speed_m_per_sec': None,
+                           'avg_strokes': None,
+                           'source': "Garmin"}])
+
+    def test_compile_decoder(self):
+        decode = compile_decoder([FieldMapping(0, 'external_id', to_int),
+                                  FieldMapping(1, 'name'),
+                                  FieldMapping(2, 'distance_m', to_int),
+                                  FieldMapping(3, 'average_speed_m_per_sec', float, 2)],
+                                 {'source': "CSV import"})
+        self.assertEqual(decode([['1', 'Run', '0', '6.123'], ['2', '', '', '1.5e0'], ['3', None, '12.5', '0']]),
+                         [{'external_id': 1, 'name': 'Run', 'distance_m': 0, 'average_speed_m_per_sec': 6.12,
+                           'source': "CSV import"},
+                          {'external_id': 2, 'name': None, 'distance_m': None, 'average_speed_m_per_sec': 1.5,
+                           'source': "CSV import"},
+                          {'external_id': 3, 'name': None, 'distance_m': 12.5, 'average_speed_m_per_sec': 0.0,
+                           'source': "CSV import"}])
+
+    def test_factory(self):
+        class Record:
+            __slots__ = ('external_id', 'name', 'source')
+            __init__ = compile_initializer(__slots__)
+
+        record = Record(name="Run")
+        self.assertEqual((record.external_id, record.name, record.source), (None, "Run", None))
+        transform = compile_mapping([FieldMapping('activityId', 'external_id', int)], {'source': "Garmin"}, Record)
+        record = transform([{'activityId': '7'}])[0]
+        self.assertEqual((record.external_id, record.name, record.source), (7, None, "Garmin"))
+        decode = compile_decoder([FieldMapping(0, 'name')], None, Record)
+        self.assertEqual(decode([['Ride']])[0].name, "Ride")
+
+    def test_repeated_target(self):
+        # the last mapping of a target wins, with and without factory
+        fields = [FieldMapping(0, 'external_id', to_int), FieldMapping(1, 'name'), FieldMapping(2, 'external_id', to_int)]
+        self.assertEqual(compile_decoder(fields)([['1', 'Run', '2']]), [{'external_id': 2, 'name': 'Run'}])
+
+        class Record:
+            __slots__ = ('external_id', 'name')
+            __init__ = compile_initializer(__slots__)
+
+        record = compile_decoder(fields, None, Record)([['1', 'Run', '2']])[0]
+        self.assertEqual((record.external_id, record.name), (2, 'Run'))
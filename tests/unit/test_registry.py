@@ -0,0 +1,51 @@
+import unittest
+import os
+import tempfile
+from importlib import metadata
+from unittest import mock
+
+import lib
+from lib import registry
+from lib.csv_importer import CsvImporter
+from lib.json_exporter import JsonExporter
+from benchmarks.startup import imported_modules
+
+
+SAMPLE_CSV = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "integration", "sample.csv")
+
+
+class TestRegistry(unittest.TestCase):
+
+    def test_builtin(self):
+        self.assertIs(registry.importer('csv'), CsvImporter)
+        self.assertIs(registry.exporter('json'), JsonExporter)
+        self.assertIs(registry.importer('parquet'), registry.importer('arrow'))
+        self.assertEqual(registry.importer_names()[:5], ['garmin', 'csv', 'json', 'parquet', 'arrow'])
+        self.assertIsNone(registry.importer('unknown'))
+        self.assertIsNone(registry.exporter(None))
+
+    def test_entry_points(self):
+        def entry_points(group):
+            return [metadata.EntryPoint(name='fit', value="lib.json_exporter:JsonExporter", group=group),
+                    metadata.EntryPoint(name='csv', value="lib.json_exporter:JsonExporter", group=group)]
+
+        with mock.patch.object(metadata, 'entry_points', entry_points):
+            self.assertIs(registry.exporter('fit'), JsonExporter)
+            # built-in formats take precedence
+            self.assertIsNot(registry.exporter('csv'), JsonExporter)
+            self.assertEqual(registry.exporter_names(), ['csv', 'json', 'parquet', 'arrow', 'fit'])
+
+    def test_lazy_loading(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        database = os.path.join(directory.name, "test.db")
+        modules = imported_modules(["check", database], directory.name)
+        self.assertIn('lib.workout', modules)
+        for module in ['requests', 'lib.garmin_importer', 'lib.csv_importer', 'lib.arrow_importer', 'pyarrow']:
+            self.assertNotIn(module, modules)
+        self.assertIn('lib.csv_importer', imported_modules(["import", database, "-s", "csv", "-f", SAMPLE_CSV],
+                                                           directory.name))
+
+
+if __name__ == '__main__':
+    unittest.main()
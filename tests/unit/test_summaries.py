@@ -0,0 +1,88 @@
+import unittest
+import os
+from datetime import datetime, date
+
+import lib
+from sqlalchemy import text
+from lib.workout import Workout, WorkoutsDatabase, Summary, SUMMARY_COLUMNS, SUMMARY_PERIODS
+
+
+class TestSummaries(unittest.TestCase):
+    DB_NAME = "test.db"
+
+    def setUp(self):
+        self.db = WorkoutsDatabase(self.DB_NAME)
+        self.db.create_session()
+
+    def tearDown(self):
+        self.db.close_session()
+        os.remove(self.DB_NAME)
+
+    def assertSummariesUpToDate(self):
+        # the summaries equal a full scan of the workouts
+        self.db.session.flush()
+        for (period, start) in SUMMARY_PERIODS.items():
+            expected = self.db.session.execute(text(
+                "SELECT coalesce(sport_id, 0), {start}, count(*), {totals} FROM workouts "
+                "WHERE is_duplicate_with IS NULL AND start_time IS NOT NULL "
+                "GROUP BY 1, 2 ORDER BY 1, 2".format(
+                    start=start, totals=", ".join("total({})".format(c) for c in SUMMARY_COLUMNS)))).all()
+            summaries = self.db.session.query(Summary.sport_id, Summary.period_start, Summary.workouts,
+                                              *[getattr(Summary, c) for c in SUMMARY_COLUMNS])\
+                .filter(Summary.period == period).filter(Summary.workouts != 0)\
+                .order_by(Summary.sport_id, Summary.period_start).all()
+            self.assertEqual([(row[0], str(row[1])) + tuple(round(value, 3) for value in row[2:]) for row in summaries],
+                             [tuple(row[:2]) + tuple(round(value, 3) for value in row[2:]) for row in expected])
+
+    def workout(self, id, sport_id, start_time, duration_sec=600, distance_m=1000):
+        return Workout(source="TEST", external_id=id, sportstype_id=sport_id, sport_id=sport_id,
+                       start_time=datetime.strptime(start_time, "%Y-%m-%d %H:%M:%S"),
+                       duration_sec=duration_sec, distance_m=distance_m, calories=100, training_stress_score=10.5)
+
+    def test_add_workouts(self):
+        self.workout(1, 1, "2020-05-03 20:00:00").add(self.db)       # sunday
+        self.db.add_workouts([self.workout(2, 1, "2020-05-04 20:00:00"),
+                              self.workout(3, 2, "2020-05-31 23:00:00", distance_m=None),
+                              self.workout(4, 1, "2020-06-01 08:00:00")])
+        self.assertSummariesUpToDate()
+        # weeks start on monday
+        self.assertEqual([start for (start, *values) in self.db.summaries('week')],
+                         [date(2020, 4, 27), date(2020, 5, 4), date(2020, 5, 25), date(2020, 6, 1)])
+        self.assertEqual(sorted((start, workouts) for (start, name, workouts, *totals) in self.db.summaries('month')),
+                         [(date(2020, 5, 1), 1), (date(2020, 5, 1), 2), (date(2020, 6, 1), 1)])
+
+    def test_duplicates(self):
+        # overlapping workouts of the same sport are merged, the duplicates are not counted
+        self.workout(1, 1, "2020-05-21 20:00:00").add(self.db)
+        self.workout(2, 1, "2020-05-21 19:58:00", distance_m=1200).add(self.db)
+        self.workout(3, 1, "2020-05-21 20:02:00").add(self.db)
+        self.workout(4, 2, "2020-05-21 20:01:00").add(self.db)
+        self.assertSummariesUpToDate()
+        self.db.session.commit()
+
+        self.db.add_workouts([self.workout(5, 1, "2020-05-22 20:00:00"), self.workout(6, 1, "2020-05-22 20:05:00")])
+        self.db.check()
+        self.assertSummariesUpToDate()
+
+        # changed and deleted workouts
+        workout = self.db.session.query(Workout).filter(Workout.external_id == 4).first()
+        workout.start_time = datetime(2020, 7, 1)
+        workout.distance_m = 5000
+        self.db.session.commit()
+        self.assertSummariesUpToDate()
+        self.db.session.delete(workout)
+        self.assertSummariesUpToDate()
+
+    def test_migrate(self):
+        self.db.add_workouts([self.workout(1, 1, "2020-05-04 20:00:00"), self.workout(2, 2, "2020-06-04 20:00:00")])
+        # turn the database into one created before summaries were introduced
+        self.db.session.execute(text("DROP TABLE summaries"))
+        self.db.session.execute(text("DELETE FROM schema_version WHERE version >= 3"))
+        self.db.close_session()
+        self.db.create_session()
+        self.assertSummariesUpToDate()
+        self.assertEqual(len(self.db.summaries('month')), 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,80 @@
+import unittest
+import os
+import math
+from datetime import datetime, date, timedelta
+
+import lib
+from lib.workout import Workout, WorkoutsDatabase, TrainingLoad
+from lib.training_load import ewma, update_training_loads, training_loads, numpy, CTL_DAYS, ATL_DAYS
+
+
+@unittest.skipIf(numpy is None, "numpy not installed")
+class TestTrainingLoad(unittest.TestCase):
+    DB_NAME = "test.db"
+
+    def setUp(self):
+        self.db = WorkoutsDatabase(self.DB_NAME)
+        self.db.create_session()
+
+    def tearDown(self):
+        self.db.close_session()
+        os.remove(self.DB_NAME)
+
+    def workout(self, id, day, score):
+        return Workout(source="TEST", external_id=id, sportstype_id=id, sport_id=id, duration_sec=3600,
+                       start_time=datetime(2020, 1, 1, 7) + timedelta(days=day), training_stress_score=score)
+
+    def expected_loads(self, scores):
+        # the recursion day by day
+        (ctl, atl, loads) = (0.0, 0.0, [])
+        for score in scores:
+            tsb = ctl - atl
+            ctl += (score - ctl) * (1 - math.exp(-1 / CTL_DAYS))
+            atl += (score - atl) * (1 - math.exp(-1 / ATL_DAYS))
+            loads.append((score, ctl, atl, tsb))
+        return loads
+
+    def assertLoads(self, loads, scores):
+        self.assertEqual(len(loads), len(scores))
+        for (load, expected) in zip(loads, self.expected_loads(scores)):
+            for (value, expected_value) in zip(load[1:], expected):
+                self.assertAlmostEqual(value, expected_value, places=9)
+
+    def test_ewma(self):
+        values = numpy.random.default_rng(1).uniform(0, 200, 1000)
+        (expected, previous) = ([], 5.0)
+        for value in values:
+            previous += (value - previous) * (1 - math.exp(-1 / 7))
+            expected.append(previous)
+        numpy.testing.assert_allclose(ewma(values, 7, 5.0, block_size=64), expected, rtol=1e-12)
+
+    def test_training_loads(self):
+        self.db.add_workouts([self.workout(1, 0, 100), self.workout(2, 2, 50), self.workout(3, 2, None),
+                              self.workout(4, 3, 80)])
+        loads = training_loads(self.db, end=date(2020, 1, 10))
+        self.assertEqual([load[0] for load in loads], [date(2020, 1, 1) + timedelta(days=i) for i in range(10)])
+        self.assertLoads(loads, [100, 0, 50, 80, 0, 0, 0, 0, 0, 0])
+        # cached days are not computed again
+        self.assertEqual(update_training_loads(self.db, date(2020, 1, 10)), 0)
+        self.assertEqual(update_training_loads(self.db, date(2020, 1, 12)), 2)
+
+    def test_incremental_update(self):
+        self.db.add_workouts([self.workout(i, i * 3, 60 + i) for i in range(100)])
+        update_training_loads(self.db, date(2021, 1, 1))
+        # a new workout removes the cached days from its day on, the days before are kept
+        self.workout(200, 150, 300).add(self.db)
+        self.assertEqual(self.db.session.query(TrainingLoad).count(), 150)
+        self.assertEqual(update_training_loads(self.db, date(2021, 1, 1)), (date(2021, 1, 1) - date(2020, 5, 30)).days + 1)
+        # workouts marked as duplicate do not count
+        workout = self.db.session.query(Workout).filter(Workout.external_id == 10).first()
+        workout.is_duplicate_with = 1
+        loads = training_loads(self.db, end=date(2021, 1, 1))
+        scores = [0] * len(loads)
+        for i in range(100):
+            scores[i * 3] += 0 if i == 10 else 60 + i
+        scores[150] += 300
+        self.assertLoads(loads, scores)
+
+
+if __name__ == '__main__':
+    unittest.main()
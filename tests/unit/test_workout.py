@@ -1,10 +1,11 @@
 import unittest
 import os
-from datetime import datetime
+from datetime import datetime, date, timedelta
 
 
 import lib
-from lib.workout import Workout, WorkoutsDatabase, Sport, SportsType
+from sqlalchemy import text, event
+from lib.workout import Workout, WorkoutRecord, WorkoutsDatabase, Sport, SportsType, SchemaVersion, SCHEMA_VERSION
 
 class TestWorkoutsDatabase(unittest.TestCase):
     DB_NAME = "test.db"
@@ -21,6 +22,55 @@ class TestWorkoutsDatabase(unittest.TestCase):
         self.assertIsNotNone(db)
         os.remove(self.DB_NAME)
 
+    def test_migrate(self):
+        db = WorkoutsDatabase(self.DB_NAME)
+        db.create_session()
+        self.assertEqual(db.session.query(SchemaVersion.version).count(), SCHEMA_VERSION)
+        # turn the database into an unversioned one without indexes
+        db.session.execute(text("DROP TABLE schema_version"))
+        db.session.execute(text("DROP INDEX ix_workouts_source_external_id"))
+        db.close_session()
+
+        db.create_session()
+        self.assertEqual(db.session.query(SchemaVersion.version).count(), SCHEMA_VERSION)
+        indexes = [row[0] for row in db.session.execute(text("SELECT name FROM sqlite_master WHERE type = 'index'"))]
+        self.assertIn("ix_workouts_source_external_id", indexes)
+        db.close_session()
+        os.remove(self.DB_NAME)
+
+    def test_migrate_reimported(self):
+        db = WorkoutsDatabase(self.DB_NAME)
+        db.create_session()
+        # an unversioned database of an old version which imported workout a twice
+        db.session.execute(text("DROP TABLE schema_version"))
+        db.session.execute(text("DROP INDEX ix_workouts_source_external_id"))
+        db.session.execute(text(
+            "INSERT INTO workouts (id, source, external_id, is_duplicate_with, manual_check_required_with) VALUES "
+            "(1, 'Garmin', 'a', 2, NULL), (2, 'Garmin', 'a', NULL, NULL), (3, 'Zwift', 'z', 2, NULL), "
+            "(4, 'CSV import', 'c', NULL, 2), (5, 'Garmin', 'a', NULL, NULL), (6, 'Garmin', 'b', NULL, NULL)"))
+        db.close_session()
+
+        self.assertTrue(db.create_session())
+        self.assertEqual(db.session.query(SchemaVersion.version).count(), SCHEMA_VERSION)
+        rows = db.session.execute(text(
+            "SELECT id, is_duplicate_with, manual_check_required_with FROM workouts ORDER BY id")).fetchall()
+        self.assertEqual([tuple(row) for row in rows], [(1, None, None), (3, 1, None), (4, None, 1), (6, None, None)])
+        db.close_session()
+        os.remove(self.DB_NAME)
+
+    def test_add_workouts(self):
+        db = WorkoutsDatabase(self.DB_NAME)
+        db.create_session()
+        Workout(source="TEST", external_id=1, name="known").add(db)
+        workouts = [Workout(source="TEST", external_id=id, name="TEST_WORKOUT") for id in [1, 2, 3, 3, 4]]
+        workouts.append(Workout(source="OTHER", external_id="1", name="TEST_WORKOUT"))
+        # small batches, so that duplicates of the same workout are spread over several chunks
+        self.assertEqual(db.add_workouts(workouts, batch_size=2), (6, 4))
+        self.assertEqual(db.session.query(Workout.id).count(), 5)
+        self.assertEqual(db.add_workouts(workouts), (6, 0))
+        db.close_session()
+        os.remove(self.DB_NAME)
+
 
 class TestSport(unittest.TestCase):
     DB_NAME = "test.db"
@@ -64,6 +114,18 @@ class TestSportsType(unittest.TestCase):
         self.assertEqual("TEST_SPORTSTYPE", self.db.session.query(
             SportsType.name).filter(SportsType.id == sportstype.id).first()[0])
 
+    def test_add_known_sportstype(self):
+        sportstype = SportsType(name="running")
+        self.assertTrue(sportstype.add(Workout(), self.db))
+        statements = []
+        event.listen(self.db.session.get_bind(), "before_cursor_execute",
+                     lambda *args: statements.append(args[2]))
+        known_sportstype = SportsType(name="Running")
+        self.assertFalse(known_sportstype.add(Workout(), self.db))
+        self.assertEqual((known_sportstype.id, known_sportstype.sport_id), (sportstype.id, sportstype.sport_id))
+        # known sportstypes are resolved from the cache
+        self.assertEqual(statements, [])
+
     def test_associate_sport(self):
         sportstype = SportsType(name = "Indoor Cycling")
         sportstype.associate_sport(self.db)
@@ -129,6 +191,42 @@ class TestWorkout(unittest.TestCase):
         self.assertIn('TEST_WORKOUT', as_list)
         self.assertIn('TEST_SPORTSTYPE', as_list)
 
+    def test_workout_decoder(self):
+        decode = Workout.decoder([(0, 'id'), (1, 'sportstype'), (2, 'name'), (3, 'start_time'),
+                                  (4, 'distance_m'), (5, 'average_speed_m_per_sec'), (6, 'unknown')])
+        workouts = decode([['42', 'running', '', '2020-05-05 20:00:00', '0', '2.5', 'x']])
+        self.assertEqual(len(workouts), 1)
+        self.assertIsInstance(workouts[0], WorkoutRecord)
+        self.assertEqual(workouts[0].parameters(),
+                         dict(dict.fromkeys(WorkoutRecord.COLUMNS[1:]), external_id=42,
+                              start_time=datetime(2020, 5, 5, 20, 0, 0), distance_m=0, average_speed_m_per_sec=2.5))
+        self.assertEqual(workouts[0].sportstype, 'running')
+        # csv files with a column id and external_id, or a repeated column, keep the last one
+        decode = Workout.decoder([(0, 'id'), (1, 'external_id'), (2, 'name'), (3, 'name')])
+        workout = decode([['1', '2', 'Run', 'Ride']])[0]
+        self.assertEqual((workout.external_id, workout.name), (2, 'Ride'))
+        decode = Workout.decoder(['id', 'calories'], {'source': "JSON import"})
+        workout = decode([{'id': 1, 'calories': 446.0}])[0]
+        self.assertEqual((workout.external_id, workout.calories, workout.source), (1, 446, "JSON import"))
+
+    def test_add_workout_records(self):
+        start_time = datetime(2020, 5, 5, 20, 0, 0)
+        records = [WorkoutRecord(source="Garmin", external_id=1, name="Run", start_time=start_time,
+                                 duration_sec=3600, distance_m=10000),
+                   WorkoutRecord(source="Garmin", external_id=2, name="Ride", start_time=start_time + timedelta(days=1),
+                                 duration_sec=3600, distance_m=30000)]
+        self.assertEqual(self.db.add_workouts(records), (2, 2))
+        # records are inserted without Workout objects and get their ids
+        self.assertEqual(len(self.db.session.identity_map), 0)
+        self.assertEqual([self.db.session.get(Workout, record.id).name for record in records], ["Run", "Ride"])
+        self.assertEqual(self.db.summaries('month'), [(date(2020, 5, 1), None, 2, 40000.0, 7200.0, 0.0, 0.0)])
+        # an overlapping workout is merged with the one inserted before
+        duplicate = WorkoutRecord(source="CSV import", external_id=1, name="Run", start_time=start_time,
+                                  duration_sec=3500, calories=700)
+        self.assertEqual(self.db.add_workouts([duplicate] + records), (3, 1))
+        merged = self.db.session.query(Workout).filter(Workout.source == "MERGED WORKOUT").one()
+        self.assertEqual((merged.distance_m, merged.calories), (10000, 700))
+        self.assertEqual(self.db.summaries('month'), [(date(2020, 5, 1), None, 2, 40000.0, 7200.0, 700.0, 0.0)])
 
 if __name__ == '__main__':
     unittest.main()
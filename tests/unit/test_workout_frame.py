@@ -0,0 +1,94 @@
+import unittest
+import os
+from datetime import datetime
+
+import lib
+from lib.workout import WorkoutsDatabase
+from lib.workout_frame import WorkoutFrame, numpy
+
+
+@unittest.skipIf(numpy is None, "numpy not installed")
+class TestWorkoutFrame(unittest.TestCase):
+    DB_NAME = "test.db"
+
+    def setUp(self):
+        self.db = WorkoutsDatabase(self.DB_NAME)
+        self.db.create_session()
+        workouts = []
+        for (i, (sportstype, day, distance, speed, average_hr)) in enumerate([
+                ('running', datetime(2020, 5, 4, 7), 10000, 3.0, 150),          # monday
+                ('cycling', datetime(2020, 5, 6, 18), 40000, 8.5, None),
+                ('running', datetime(2020, 5, 10, 9), 21100, 3.5, 160),         # sunday
+                ('running', datetime(2020, 6, 1, 9), None, None, 140),
+                (None, None, 500, 1.0, None)]):
+            (sportstype_id, sport_id) = self.db.resolve_sportstype(sportstype)
+            workouts.append(dict(source="TEST", external_id=i, start_time=day, distance_m=distance,
+                                 average_speed_m_per_sec=speed, average_hr=average_hr,
+                                 sportstype_id=sportstype_id, sport_id=sport_id))
+        self.db.add_workouts(workouts)
+        self.db.session.commit()
+
+    def tearDown(self):
+        self.db.close_session()
+        os.remove(self.DB_NAME)
+        if os.path.exists("test.npz"):
+            os.remove("test.npz")
+
+    def test_load(self):
+        frame = WorkoutFrame.load(self.db, ['distance_m', 'average_speed_m_per_sec', 'average_hr'])
+        self.assertEqual(len(frame), 5)
+        self.assertEqual(frame['start_time'].dtype, numpy.dtype('datetime64[s]'))
+        self.assertTrue(numpy.isnat(frame['start_time'][0]))   # workouts without start_time first
+        self.assertEqual(frame['start_time'][1], numpy.datetime64('2020-05-04T07:00:00'))
+        # float columns contain NaN, integer columns are masked
+        self.assertTrue(numpy.isnan(frame['average_speed_m_per_sec'][4]))
+        self.assertEqual(frame['average_speed_m_per_sec'][3], 3.5)
+        self.assertEqual(frame['distance_m'].dtype, numpy.int64)
+        self.assertEqual(list(numpy.ma.getmaskarray(frame['distance_m'])), [False, False, False, False, True])
+        self.assertEqual(frame['average_hr'].sum(), 450)
+        # categorical sports
+        self.assertEqual(frame['sport'][0], -1)
+        self.assertEqual(frame.sports[frame['sport'][1]], frame.sports[frame['sport'][3]])
+
+    def test_aggregate(self):
+        frame = WorkoutFrame.load(self.db, ['distance_m', 'average_speed_m_per_sec', 'average_hr'])
+        running = str(frame.sports[frame['sport'][1]])
+        cycling = str(frame.sports[frame['sport'][2]])
+        self.assertEqual(frame.group_by_sport(), {None: 1, running: 3, cycling: 1})
+        self.assertEqual(frame.group_by_sport('distance_m'), {None: 500, running: 31100, cycling: 40000})
+        self.assertEqual(frame.group_by_sport('average_hr', 'mean')[running], 150)
+        self.assertTrue(numpy.isnan(frame.group_by_sport('average_hr', 'max')[cycling]))
+
+        (periods, distances) = frame.time_buckets('week', 'distance_m')
+        self.assertEqual(list(periods), [numpy.datetime64('2020-05-04'), numpy.datetime64('2020-06-01')])
+        self.assertEqual(list(distances), [71100, 0])
+        self.assertEqual(frame.time_buckets('year', 'average_speed_m_per_sec', 'min')[1][0], 3.0)
+        (periods, counts) = frame.filter(sport=running).time_buckets('month')
+        self.assertEqual(list(periods), [numpy.datetime64('2020-05'), numpy.datetime64('2020-06')])
+        self.assertEqual(list(counts), [2, 1])
+
+    def test_filter(self):
+        frame = WorkoutFrame.load(self.db, ['distance_m', 'average_speed_m_per_sec', 'average_hr'])
+        self.assertEqual(len(frame.filter(frame['distance_m'] > 20000)), 2)
+        self.assertEqual(len(frame.filter(frame['average_speed_m_per_sec'] < 5)), 3)
+        self.assertEqual(len(frame.filter(frame['average_hr'] >= 150)), 2)
+        self.assertEqual(len(frame.filter(start='2020-05-05', end=datetime(2020, 6, 1))), 2)
+        self.assertEqual(len(frame.filter(sport="unknown")), 0)
+
+    def test_cache(self):
+        frame = WorkoutFrame.load(self.db, ['distance_m', 'average_speed_m_per_sec', 'average_hr'], cache=True)
+        self.assertTrue(os.path.exists("test.npz"))
+        cached = WorkoutFrame.read("test.npz")
+        self.assertEqual(list(cached['id']), list(frame['id']))
+        self.assertEqual(list(numpy.ma.getmaskarray(cached['average_hr'])),
+                         list(numpy.ma.getmaskarray(frame['average_hr'])))
+        self.assertEqual(list(cached.sports), list(frame.sports))
+        # the cache is not used for other columns or after the database changed
+        self.assertIsNone(WorkoutFrame.read("test.npz", WorkoutFrame._fingerprint(self.db, ['calories'], False)))
+        self.db.add_workouts([dict(source="TEST", external_id=99, start_time=datetime(2020, 7, 1))])
+        self.db.session.commit()
+        self.assertEqual(len(WorkoutFrame.load(self.db, ['distance_m', 'average_speed_m_per_sec', 'average_hr'], cache=True)), 6)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -7,31 +7,47 @@ Author: Martin Reese
 Project motivation: Introduce myself to Python
 """
 
+import os
 import logging
 import argparse
 from datetime import date
 
-from lib.garmin_importer import GarminImporter
-from lib.json_importer import JsonImporter
-from lib.json_exporter import JsonExporter
-from lib.csv_importer import CsvImporter
-from lib.csv_exporter import CsvExporter
-from lib.workout import Workout, Sport, SportsType, WorkoutsDatabase
+from lib import registry
 
 parser = argparse.ArgumentParser()
 parser.add_argument("-v", "--verbose", action='count',
                     help="increase verbosity, from -v (ERROR) over -vv (WARNING), -vvv (INFO) to -vvvv (DEBUG)")
-parser.add_argument("action", help="show workouts, import from external source, export, check for duplicates or create sample files", choices=[
-                    'show', 'import', 'export', 'check', 'sample'])
+parser.add_argument("action", help="show workouts, import from external source, export, check for duplicates, report totals per sport or create sample files", choices=[
+                    'show', 'import', 'export', 'check', 'report', 'sample'])
 parser.add_argument("database", help="the workouts database")
-parser.add_argument("-s", "--source", help="source to import workouts from",
-                    choices=['garmin', 'csv', 'json'])
-parser.add_argument("-d", "--destination",
-                    help="destination format to export workouts to", choices=['csv', 'json'])
+# importers and exporters are only loaded when used, names registered as entry points by other packages are valid too
+parser.add_argument("-s", "--source", help="source to import workouts from: {} or an installed plugin".format(
+                    ", ".join(registry.IMPORTERS)))
+parser.add_argument("-d", "--destination", help="destination format to export workouts to: {} or an installed plugin"
+                    .format(", ".join(registry.EXPORTERS)))
 parser.add_argument("-f", "--filename",
                     help="filename to import from or export to")
+parser.add_argument("--ndjson", action='store_true',
+                    help="json file contains one workout per line instead of one array")
+parser.add_argument("-j", "--jobs", type=int, default=1,
+                    help="number of processes parsing a csv file in parallel while importing")
+parser.add_argument("-p", "--period", default='month', choices=['week', 'month'],
+                    help="period the report sums up workouts for")
 parser.add_argument("-gu", "--garminuser", help="garmin connect user name")
 parser.add_argument("-gp", "--garminpwd", help="garmin connect password")
+parser.add_argument("-c", "--concurrency", type=int, default=4,
+                    help="number of garmin connect pages fetched in parallel while importing, 0 fetches page by page")
+parser.add_argument("--full", action='store_true',
+                    help="import all garmin connect workouts instead of the ones newer than the last import")
+parser.add_argument("--cache", help="directory to cache the garmin connect responses in")
+parser.add_argument("--replay", action='store_true',
+                    help="import the workouts from the garmin cache instead of garmin connect")
+parser.add_argument("-gs", "--garminsession", default=os.path.join(os.path.expanduser("~"), ".workouts", "garmin_session.json"),
+                    help="file to keep the signed in garmin connect session in")
+parser.add_argument("--profile", action='store_true',
+                    help="print the time spent per stage and per sql statement at exit")
+parser.add_argument("--cprofile", action='store_true',
+                    help="like --profile, additionally print a cProfile summary")
 parser.add_argument('--version', action='version', version='%(prog)s 0.1')
 args = parser.parse_args()
 
@@ -48,6 +64,9 @@ else:
 logging.basicConfig(level=log_level)
 logger = logging.getLogger(__name__)
 
+# the orm is loaded after parsing the arguments, --help and --version do not need it
+from lib.workout import WorkoutsDatabase
+
 if (args.action == "import") and not args.database:
     args.database = "sample.db"
 
@@ -56,15 +75,26 @@ if not db.create_session():
     print("could not access database {}".format(args.database))
     exit
 
+profiler = None
+if args.profile or args.cprofile:
+    from lib.profiler import Profiler
+    profiler = Profiler(cprofile=args.cprofile).start(db.session.get_bind())
+
 if (args.action == "import"):
     # import from source
     importer = None
+    importer_class = registry.importer(args.source)
     if (args.source == 'garmin'):
-        importer = GarminImporter(args.garminuser, args.garminpwd)
+        importer = importer_class(args.garminuser, args.garminpwd, args.concurrency, args.full,
+                                  args.cache, args.replay, args.garminsession)
     elif (args.source == 'csv'):
-        importer = CsvImporter(args.filename)
+        importer = importer_class(args.filename, args.jobs)
     elif (args.source == 'json'):
-        importer = JsonImporter(args.filename)
+        importer = importer_class(args.filename, args.ndjson)
+    elif (args.source in ['parquet', 'arrow']):
+        importer = importer_class(args.filename, args.source)
+    elif importer_class:
+        importer = importer_class(args.filename)
     else:
         print("importer {} not implemented".format(args.source))
     if importer:
@@ -74,10 +104,13 @@ if (args.action == "import"):
 elif (args.action == "export"):
     # export to destination
     exporter = None
-    if (args.destination == 'csv'):
-        exporter = CsvExporter(args.filename)
-    elif (args.destination == 'json'):
-        exporter = JsonExporter(args.filename)
+    exporter_class = registry.exporter(args.destination)
+    if (args.destination == 'json'):
+        exporter = exporter_class(args.filename, args.ndjson)
+    elif (args.destination in ['parquet', 'arrow']):
+        exporter = exporter_class(args.filename, args.destination)
+    elif exporter_class:
+        exporter = exporter_class(args.filename)
     else:
         print("exporter {} not implemented".format(args.destination))
     if exporter:
@@ -88,12 +121,14 @@ elif (args.action == "show"):
     db.showall()
 elif (args.action == "check"):
     db.check()
+elif (args.action == "report"):
+    db.report(args.period)
 elif (args.action == "sample"):
     db.create_sample()
     if not args.filename:
         args.filename = "sample"
-    csvExporter = CsvExporter(args.filename + ".csv")
-    jsonExporter = JsonExporter(args.filename + ".json")
+    csvExporter = registry.exporter('csv')(args.filename + ".csv")
+    jsonExporter = registry.exporter('json')(args.filename + ".json")
     if csvExporter.create_session():
         csvExporter.export_workouts(db)
         csvExporter.close_session()
@@ -102,3 +137,6 @@ elif (args.action == "sample"):
         jsonExporter.close_session()
 
 db.close_session()
+if profiler:
+    profiler.stop()
+    profiler.report()